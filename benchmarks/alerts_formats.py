@@ -0,0 +1,167 @@
+"""
+Checks that the JSON and protobuf alerts feeds give the same alerts, then times decoding each.
+
+    python benchmarks/alerts_formats.py [--entities 2000] [--repeat 5] [--write-pb]
+
+benchmarks/fixtures/alerts.json and alerts.pb hold the same small feed: active, open-ended,
+upcoming, ended and far-off alerts, an alert with two periods, one without English text, one
+without any period, every severity level and a deleted entity. Both are fetched through
+AlertsFeed with a stand-in session, with several severity thresholds and at several times,
+and must give exactly the same alerts (and the expected ones at the feed's own timestamp).
+The .pb must also be what the .json encodes to; --write-pb regenerates it after editing
+the .json.
+
+Then the fixture's entities are repeated up to --entities, and each format is timed through
+AlertsFeed, next to a whole-body json.loads() of the JSON. Needs `pip install
+gtfs-realtime-bindings`. Exits with status 1 if the formats disagree.
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from components.alerts_feed import AlertsFeed, gtfs_realtime_pb2, parse_alert_entity
+
+FIXTURES = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+JSON_FIXTURE = os.path.join(FIXTURES, "alerts.json")
+PB_FIXTURE = os.path.join(FIXTURES, "alerts.pb")
+FEED_TIME = 1_760_000_000 # The fixture's header timestamp
+EXPECTED = [
+    "1 Line: Trains every 20 minutes between SODO and Capitol Hill due to a signal problem",
+    "Broadway & E Pine: stop closed until further notice",
+    "Weekend closure of Capitol Hill Station starts tomorrow",
+    "Beacon Hill Station elevator out of service",
+]
+THRESHOLDS = [["SEVERE"], ["SEVERE", "WARNING"], ["SEVERE", "WARNING", "INFO"], ["UNKNOWN_SEVERITY"]]
+TIMES = [FEED_TIME, FEED_TIME - 86400 * 2, FEED_TIME + 86400, FEED_TIME + 86400 * 7]
+
+class FixtureResponse:
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+        self.headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+class FixtureSession:
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        return FixtureResponse(self.body)
+
+    def close(self):
+        pass
+
+def encode_pb(feed_json):
+    from google.protobuf import json_format
+    return json_format.ParseDict(feed_json, gtfs_realtime_pb2.FeedMessage()).SerializeToString(deterministic=True)
+
+def fetch(body, feed_format, thresholds, now):
+    """Decodes `body` the way the board does: one fetch through a fresh AlertsFeed."""
+    feed = AlertsFeed("fixture", session=FixtureSession(body), feed_format=feed_format, clock=lambda: now)
+    return feed.fetch_alerts(thresholds)
+
+def check_parity(json_body, pb_body):
+    failures = []
+    if encode_pb(json.loads(json_body)) != pb_body:
+        failures.append(f"{PB_FIXTURE} doesn't match {JSON_FIXTURE}, run with --write-pb")
+    for thresholds in THRESHOLDS:
+        for now in TIMES:
+            from_json = fetch(json_body, "json", thresholds, now)
+            from_pb = fetch(pb_body, "protobuf", thresholds, now)
+            if from_json != from_pb:
+                failures.append(f"{thresholds} at {now}: JSON gave {from_json}, protobuf gave {from_pb}")
+    from_json = fetch(json_body, "json", ["SEVERE"], FEED_TIME)
+    if from_json != EXPECTED:
+        failures.append(f"expected {EXPECTED} at the feed's timestamp, got {from_json}")
+    return failures
+
+def scaled_feed(feed_json, entities):
+    fixture_entities = feed_json["entity"]
+    scaled = dict(feed_json, entity=[])
+    for i in range(entities):
+        entity = dict(fixture_entities[i % len(fixture_entities)])
+        entity["id"] = f"{entity['id']}_{i}"
+        scaled["entity"].append(entity)
+    return scaled
+
+def timed(decode, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = decode()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+def main(args):
+    if gtfs_realtime_pb2 is None:
+        print("The protobuf feed needs `pip install gtfs-realtime-bindings`")
+        return 1
+    with open(JSON_FIXTURE, "rb") as f:
+        json_body = f.read()
+    if args.write_pb:
+        with open(PB_FIXTURE, "wb") as f:
+            f.write(encode_pb(json.loads(json_body)))
+        print(f"Wrote {PB_FIXTURE}")
+    with open(PB_FIXTURE, "rb") as f:
+        pb_body = f.read()
+
+    failures = check_parity(json_body, pb_body)
+    checks = len(THRESHOLDS) * len(TIMES)
+    print(f"Parity: {checks - len(failures)} of {checks} threshold/time combinations agree\n")
+
+    feed_json = scaled_feed(json.loads(json_body), args.entities)
+    big_json = json.dumps(feed_json).encode()
+    big_pb = encode_pb(feed_json)
+    thresholds = ["SEVERE"]
+
+    def whole_json():
+        return [text for text in (parse_alert_entity(entity, thresholds, FEED_TIME) for entity in json.loads(big_json)["entity"])
+                if text is not None]
+
+    runs = [
+        ("json, whole", big_json, whole_json),
+        ("json", big_json, lambda: fetch(big_json, "json", thresholds, FEED_TIME)),
+        ("protobuf", big_pb, lambda: fetch(big_pb, "protobuf", thresholds, FEED_TIME)),
+    ]
+    print(f"{args.entities} entities, median of {args.repeat}")
+    print(f"{'format':>12} {'bytes':>9} {'gzipped':>8} {'decode ms':>10} {'us/entity':>10} {'alerts':>7}")
+    results = []
+    for label, body, decode in runs:
+        seconds, alerts = timed(decode, args.repeat)
+        results.append(alerts)
+        print(f"{label:>12} {len(body):>9} {len(gzip.compress(body)):>8} {seconds * 1000:>10.1f} "
+              f"{seconds / args.entities * 1e6:>10.1f} {len(alerts):>7}")
+    if any(alerts != results[0] for alerts in results):
+        failures.append(f"the {args.entities}-entity feed decoded differently in each format")
+
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: both formats gave the same alerts")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=2000, help="entities in the timed feed")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--write-pb", action="store_true", help=f"regenerate {os.path.relpath(PB_FIXTURE, REPO_ROOT)} from the .json")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""
+Peak memory and time of fetching a very large alerts feed, as during a major disruption.
+
+    python benchmarks/alerts_memory.py [--mb 50]
+
+Builds a synthetic JSON feed of about --mb megabytes (thousands of alerts, a few of them
+severe) and fetches it through a stand-in session that streams it in chunks, without the
+network. Three fetches are measured with tracemalloc, after timing how long the stand-in
+takes to produce the feed on its own (included in every fetch's time):
+
+- baseline: the old fetch, reading the whole body and json.loads() on all of it
+- streamed: AlertsFeed, hashing and spooling the body, then parsing it one entity at a time
+- unchanged: AlertsFeed again with the same body, which is only hashed, never parsed
+
+Exits with status 1 if the streamed fetch peaks above --max-mb, if the unchanged fetch
+parses the feed, or if the alerts differ from the baseline's.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.alerts_feed import AlertsFeed
+
+START = 1_760_000_000
+DESCRIPTION = "Trains are single tracking between SODO and Capitol Hill while crews repair the signal system. " * 20
+
+def feed_chunks(megabytes):
+    """The feed, a piece at a time, so the stand-in doesn't hold all of it in memory."""
+    yield b'{"header": {"gtfs_realtime_version": "2.0", "timestamp": %d}, "entity": [' % START
+    size, i = 0, 0
+    while size < megabytes * 1024 * 1024:
+        entity = json.dumps({"id": f"alert_{i}", "alert": {
+            "severity_level": "SEVERE" if i % 500 == 0 else "INFO", "active_period": [{"start": START - 3600}],
+            "header_text": {"translation": [{"language": "en", "text": f"Alert {i}: delays near Westlake"}]},
+            "description_text": {"translation": [{"language": "en", "text": DESCRIPTION}]},
+        }}).encode()
+        piece = entity if i == 0 else b"," + entity
+        size += len(piece)
+        i += 1
+        yield piece
+    yield b"]}"
+
+class StreamedResponse:
+    def __init__(self, megabytes):
+        self.megabytes = megabytes
+        self.status_code = 200
+        self.headers = {"ETag": '"large"'}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        buffered = []
+        size = 0
+        for piece in feed_chunks(self.megabytes):
+            buffered.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield b"".join(buffered)
+                buffered, size = [], 0
+        if buffered:
+            yield b"".join(buffered)
+
+class StreamedSession:
+    """Serves the feed every time, as a server that ignores If-None-Match would."""
+
+    def __init__(self, megabytes):
+        self.megabytes = megabytes
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        return StreamedResponse(self.megabytes)
+
+    def close(self):
+        pass
+
+def measure(fetch):
+    """Runs fetch(), returning (result, seconds, peak MB of Python allocations)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fetch()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def main(args):
+    thresholds = ["SEVERE"]
+
+    def baseline_fetch():
+        # As requests' response.json() does: the whole body, then the whole document
+        body = b"".join(StreamedResponse(args.mb).iter_content(64 * 1024))
+        return [entity["alert"]["header_text"]["translation"][0]["text"] for entity in json.loads(body)["entity"]
+                if entity["alert"]["severity_level"] in thresholds]
+
+    def source_only():
+        for _ in StreamedResponse(args.mb).iter_content(64 * 1024):
+            pass
+
+    feed = AlertsFeed("synthetic", session=StreamedSession(args.mb), clock=lambda: START)
+    runs = [("source", source_only), ("baseline", baseline_fetch), ("streamed", lambda: feed.fetch_alerts(thresholds)),
+            ("unchanged", lambda: feed.fetch_alerts(thresholds))]
+    results = {}
+    print(f"{'fetch':>10} {'seconds':>8} {'peak MB':>8} {'alerts':>7} {'parses':>7}")
+    for label, fetch in runs:
+        alerts, elapsed, peak = measure(fetch)
+        results[label] = (alerts, peak, feed.parse_count)
+        print(f"{label:>10} {elapsed:>8.2f} {peak:>8.1f} {'-' if alerts is None else len(alerts):>7} {feed.parse_count:>7}")
+    print(f"Feed size: {feed.bytes_transferred / 2 / 1024 / 1024:.1f} MB")
+
+    failures = []
+    if results["streamed"][0] != results["baseline"][0]:
+        failures.append("the streamed fetch returned different alerts from the baseline")
+    if results["streamed"][1] > args.max_mb:
+        failures.append(f"the streamed fetch peaked at {results['streamed'][1]:.1f} MB")
+    if results["unchanged"][0] is not None or results["unchanged"][2] != results["streamed"][2]:
+        failures.append("the unchanged feed was parsed again")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: memory stayed bounded, and the unchanged feed was only hashed")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=50, help="size of the synthetic feed")
+    parser.add_argument("--max-mb", type=float, default=8, help="allowed peak of the streamed fetch")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""
+Load test for the arrivals API (components/arrivals_api.py), using local clients only.
+
+    python benchmarks/api_load_test.py --clients 500 --updates 40
+
+Starts the API in a child process with synthetic data for `--stops` stops, connects `--clients`
+Server-Sent Events clients, then publishes `--updates` stop updates and reports how long they
+took to reach the clients (latency percentiles), the server's memory per connection and the
+latency of plain GET /arrivals requests. Clients run on one event loop in this process, so
+with many clients the numbers include some client-side queueing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def synthetic_rows(now, sent_at=None):
+    """Encoded rows like encode_rows makes: a few routes with 4 arrivals each."""
+    rows = []
+    for route in ("1 Line", "8", "43", "49"):
+        records = []
+        for i in range(4):
+            arrival = now + random.randint(60, 1800)
+            records.append([arrival, arrival - random.choice((0, 60, 300)), True, random.randint(0, 3), "12:34", "default", f"trip_{route}_{i}"])
+        rows.append([route, "Synthetic Headsign Towards Somewhere", records])
+    if sent_at is not None:
+        # Lets the clients work out the latency
+        rows.append(["BENCH", repr(sent_at), []])
+    return rows
+
+# --- Server side, in the child process ---
+
+async def serve(port, stops):
+    from components.arrivals_api import ArrivalsAPI
+    api = ArrivalsAPI(host="127.0.0.1", port=port)
+    await api.start()
+    now = time.time()
+    for i in range(stops):
+        api.on_arrivals(f"stop_{i}", 1, json.dumps(synthetic_rows(now), separators=(",", ":")))
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    print("ready", flush=True)
+    # Simple line commands from the parent process
+    while line := await reader.readline():
+        command = line.decode().split()
+        if command[0] == "rss":
+            print(_rss_kb(), flush=True)
+        elif command[0] == "publish":
+            count, interval = int(command[1]), float(command[2])
+            for n in range(count):
+                key = f"stop_{n % stops}"
+                api.on_arrivals(key, n + 2, json.dumps(synthetic_rows(time.time(), time.time()), separators=(",", ":")))
+                await asyncio.sleep(interval)
+            print("published", flush=True)
+
+# --- Client side ---
+
+async def sse_client(port, received, connected):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1024 * 1024)
+    writer.write(b"GET /events HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+    await writer.drain()
+    event = None
+    try:
+        while line := await reader.readline():
+            if line.startswith(b"event: "):
+                event = line[7:].strip()
+                if event == b"snapshot":
+                    connected.release()
+            elif line.startswith(b"data: ") and event == b"arrivals":
+                # Parse later, so decoding doesn't count towards latency
+                received.append((time.time(), line))
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def get_arrivals(port):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /arrivals HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await writer.drain()
+    await reader.read()
+    writer.close()
+    return time.perf_counter() - start
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return "no samples"
+    def at(p):
+        return values[min(len(values) - 1, int(p * len(values)))] * 1000
+    return f"p50 {at(0.5):.1f} ms, p90 {at(0.9):.1f} ms, p99 {at(0.99):.1f} ms, max {values[-1] * 1000:.1f} ms ({len(values)} samples)"
+
+async def run(args):
+    server = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port), "--stops", str(args.stops),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+
+    async def command(text):
+        server.stdin.write(text.encode() + b"\n")
+        await server.stdin.drain()
+        return (await server.stdout.readline()).decode().strip()
+
+    try:
+        while (await server.stdout.readline()).strip() != b"ready":
+            pass
+        rss_before = int(await command("rss"))
+
+        received = []
+        connected = asyncio.Semaphore(0)
+        clients = [asyncio.create_task(sse_client(args.port, received, connected)) for _ in range(args.clients)]
+        for _ in range(args.clients):
+            await connected.acquire()
+        rss_after = int(await command("rss"))
+
+        await command(f"publish {args.updates} {args.interval}")
+        # Give the last events time to arrive
+        expected = args.clients * args.updates
+        deadline = time.time() + 30
+        while len(received) < expected and time.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        latencies = []
+        for received_at, line in received:
+            rows = json.loads(line[6:])["rows"]
+            latencies.append(received_at - float(rows[-1][1]))
+
+        for client in clients:
+            client.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+        get_latencies = await asyncio.gather(*[get_arrivals(args.port) for _ in range(args.gets)])
+    finally:
+        server.stdin.close()
+        server.kill()
+        await server.wait()
+
+    print(f"{args.clients} SSE clients, {args.stops} stops, {args.updates} updates")
+    print(f"Events received: {len(received)}/{expected}")
+    print(f"Update latency: {percentiles(latencies)}")
+    print(f"Server memory: {(rss_after - rss_before) / args.clients:.1f} KB per connection ({rss_before} KB before, {rss_after} KB after)")
+    print(f"GET /arrivals with {args.gets} at once: {percentiles(get_latencies)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--stops", type=int, default=10)
+    parser.add_argument("--updates", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between updates")
+    parser.add_argument("--gets", type=int, default=100, help="concurrent GET /arrivals requests")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    _raise_fd_limit()
+    if args.serve:
+        asyncio.run(serve(args.port, args.stops))
+    else:
+        asyncio.run(run(args))
@@ -0,0 +1,149 @@
+"""
+Bytes transferred and feeds parsed by the alerts feed over a simulated hour, against a local
+HTTP server standing in for the alerts feed's host.
+
+    python benchmarks/conditional_fetch.py [--minutes 60] [--changes 3] [--entities 40]
+
+The feed is fetched once a minute, as the board does, and changes --changes times in the
+hour. Time is simulated, so the run takes a second or two. Three runs, against the same feed:
+
+- baseline: the old fetch, a plain GET and a full parse every minute
+- revalidated: AlertsFeed against a server that honours If-None-Match / If-Modified-Since
+  and answers 304 when the feed hasn't changed
+- ignored: AlertsFeed against a server that ignores them and sends the full feed every
+  time, so only the body hash tells that nothing changed
+
+Bytes are counted by the server, headers included. Exits with status 1 if AlertsFeed parsed
+a feed that hadn't changed, if a revalidated fetch downloaded one, or if the alerts returned
+ever differ from the baseline.
+"""
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+from email.utils import formatdate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from components.alerts_feed import AlertsFeed
+
+START = 1_760_000_000
+
+def feed_body(version, entities):
+    return json.dumps({"header": {"gtfs_realtime_version": "2.0", "timestamp": START + version}, "entity": [{
+        "id": f"alert_{version}_{i}",
+        "alert": {
+            "severity_level": "SEVERE" if i % 3 == 0 else "WARNING", "active_period": [{"start": 0}],
+            "header_text": {"translation": [{"language": "en", "text": f"Alert {i}, version {version}: trains are delayed near Westlake"},
+                                            {"language": "es", "text": f"Alerta {i}: los trenes tienen retrasos cerca de Westlake"}]},
+            "description_text": {"translation": [{"language": "en", "text": "Allow extra travel time. " * 8}]},
+        },
+    } for i in range(entities)]}).encode()
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, as the real host does
+
+    def do_GET(self):
+        server = self.server
+        etag, last_modified = f'"{server.version}"', formatdate(START + server.version * 60, usegmt=True)
+        not_modified = server.honour_conditionals and (
+            self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == last_modified
+        )
+        body = b"" if not_modified else feed_body(server.version, server.entities)
+        head = (f"HTTP/1.1 {'304 Not Modified' if not_modified else '200 OK'}\r\nContent-Type: application/json\r\n"
+                f"ETag: {etag}\r\nLast-Modified: {last_modified}\r\nContent-Length: {len(body)}\r\n\r\n").encode()
+        # Counted before it's sent, so a response is always in the run that asked for it: once the
+        # client has it, simulate() may already be resetting the counters for the next run
+        with server.lock:
+            server.bytes_sent += len(head) + len(body)
+            server.responses += 1
+        self.wfile.write(head + body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FeedServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, entities):
+        super().__init__(("127.0.0.1", 0), FeedHandler)
+        self.entities = entities
+        self.version = 0
+        self.honour_conditionals = True
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.responses = 0
+
+def change_minutes(minutes, changes):
+    return {round(minutes * (i + 1) / (changes + 1)) for i in range(changes)}
+
+def simulate(server, args, fetch):
+    """Fetches once a simulated minute. Returns the alerts after every fetch, and the bytes sent."""
+    server.version = 0
+    with server.lock:
+        server.bytes_sent = 0
+    changes = change_minutes(args.minutes, args.changes)
+    shown = []
+    current = None
+    for minute in range(args.minutes):
+        if minute in changes:
+            server.version += 1
+        alerts = fetch()
+        if alerts is not None:
+            current = alerts
+        shown.append(current)
+    return shown, server.bytes_sent
+
+def main(args):
+    server = FeedServer(args.entities)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/alerts_pb.json"
+    thresholds = ["SEVERE"]
+
+    # The fetch as it was: a new connection, the whole body and a full parse every time
+    baseline_parses = [0]
+    def baseline_fetch():
+        response = requests.get(url, timeout=10)
+        baseline_parses[0] += 1
+        return [entity["alert"]["header_text"]["translation"][0]["text"] for entity in response.json()["entity"]
+                if entity["alert"]["severity_level"] in thresholds]
+
+    server.honour_conditionals = False
+    baseline_shown, baseline_bytes = simulate(server, args, baseline_fetch)
+    results = [("baseline", baseline_bytes, baseline_parses[0], args.minutes, 0)]
+
+    failures = []
+    feed_changes = args.changes + 1 # The first fetch always downloads the feed
+    for label, honour in (("revalidated", True), ("ignored", False)):
+        server.honour_conditionals = honour
+        feed = AlertsFeed(url, clock=lambda: START)
+        shown, sent = simulate(server, args, lambda: feed.fetch_alerts(thresholds))
+        feed.close()
+        results.append((label, sent, feed.parse_count, feed.requests_made, feed.not_modified_count))
+        if shown != baseline_shown:
+            failures.append(f"{label}: the alerts shown differ from the baseline's")
+        if feed.parse_count != feed_changes:
+            failures.append(f"{label}: parsed the feed {feed.parse_count} times, but it only changed {feed_changes} times")
+        if honour and sent > baseline_bytes * feed_changes / args.minutes + 500 * args.minutes:
+            failures.append(f"{label}: {sent} bytes sent, more than the changed feeds and a 304 a minute")
+    server.shutdown()
+
+    print(f"{args.minutes} fetches, the feed changed {args.changes} times ({len(feed_body(0, args.entities))} bytes each)")
+    print(f"{'run':>12} {'bytes':>10} {'of baseline':>12} {'parses':>7} {'requests':>9} {'unchanged':>10}")
+    for label, sent, parses, requests_made, unchanged in results:
+        print(f"{label:>12} {sent:>10} {sent / baseline_bytes:>12.1%} {parses:>7} {requests_made:>9} {unchanged:>10}")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: unchanged feeds were not parsed (nor sent, when revalidated), and the alerts matched the baseline")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=60, help="fetches, one per simulated minute")
+    parser.add_argument("--changes", type=int, default=3, help="times the feed changes during the run")
+    parser.add_argument("--entities", type=int, default=40, help="alerts in the feed")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,194 @@
+"""
+Fault injection for the fetch path: points the real OneBusAway SDK and alerts feed at a local
+server that misbehaves on cue, and checks that every refresh still finishes in bounded time.
+
+    python benchmarks/fault_injection.py [--rounds 6]
+
+The server goes through these phases, with several refreshes (all stops, then the alerts
+feed) in each:
+
+- healthy: normal responses
+- black hole: accepts the connection and reads the request, then never answers
+- slow drip: sends the headers, then one byte of body every half second
+- 503: fails straight away, tripping the circuit breakers
+- refused: nothing listening at all
+- recovered: healthy again, until the circuit breakers close
+
+Deadlines are shortened so the run takes about a minute. Exits with status 1 if any refresh
+took longer than its bound, or if the breakers didn't close again once the server recovered.
+"""
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components.alerts_feed import AlertsFeed
+from components.fetch_engine import TokenBucket
+from components.transit_data import TransitData
+from onebusaway import OnebusawaySDK, Timeout
+import pytz
+
+CONNECT_TIMEOUT = 0.5
+READ_TIMEOUT = 1
+FETCH_DEADLINE = 2
+ALERTS_DEADLINE = 2
+BREAKER_RESET = 3
+STOPS = ["1_11060", "1_29266", "40_99603", "40_99610"]
+# How long a refresh may take: the deadline plus some slack, and for the alerts feed also the
+# connect and read timeouts, since its deadline only starts once the headers are in
+STOPS_BOUND = FETCH_DEADLINE + 0.5
+ALERTS_BOUND = CONNECT_TIMEOUT + READ_TIMEOUT + ALERTS_DEADLINE + 0.5
+
+def oba_body():
+    now = int(time.time() * 1000)
+    arrivals = [{
+        "routeShortName": "8", "tripHeadsign": "Seattle Center", "scheduledArrivalTime": now + i * 300000,
+        "predictedArrivalTime": now + i * 300000 + 60000, "predicted": True, "status": "default", "tripId": f"trip_{i}",
+    } for i in range(1, 5)]
+    return json.dumps({"code": 200, "currentTime": now, "text": "OK", "version": 2,
+                       "data": {"entry": {"arrivalsAndDepartures": arrivals}, "references": {}}}).encode()
+
+def alerts_body():
+    return json.dumps({"entity": [{"alert": {
+        "severity_level": "SEVERE", "active_period": [{"start": 0}],
+        "header_text": {"translation": [{"language": "en", "text": f"Test alert {time.time()}"}]},
+    }}]}).encode()
+
+class FaultyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            data = self.request.recv(4096)
+            if not data:
+                return
+            request += data
+        path = request.split(b" ")[1]
+        body = oba_body() if b"/api/where/" in path else alerts_body()
+        mode = self.server.mode
+        if mode == "healthy":
+            self.request.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                                 + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        elif mode == "503":
+            self.request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        elif mode == "black hole":
+            self.server.stopped.wait(120)
+        elif mode == "slow drip":
+            self.request.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                                 + f"Content-Length: {len(body)}\r\n\r\n".encode())
+            try:
+                for i in range(len(body)):
+                    if self.server.stopped.wait(0.5):
+                        break
+                    self.request.sendall(body[i:i + 1])
+            except OSError:
+                pass # The client gave up, as it should
+
+class FaultyServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FaultyHandler)
+        self.mode = "healthy"
+        self.stopped = threading.Event()
+
+def free_port():
+    # Bound and closed again, so connections to it are refused
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def refresh(transit_data, alerts_feed):
+    """One refresh of every stop, then of the alerts feed. Returns the latencies and outcomes."""
+    started = time.perf_counter()
+    updated = transit_data.fetch(list(transit_data.queries))
+    stops_latency = time.perf_counter() - started
+    stop_outcome = "ok" if len(updated) == len(STOPS) else f"{len(STOPS) - len(updated)} failed"
+
+    started = time.perf_counter()
+    try:
+        alerts_feed.fetch_alerts(["SEVERE"])
+        alerts_outcome = "ok"
+    except Exception as e:
+        alerts_outcome = type(e).__name__
+    alerts_latency = time.perf_counter() - started
+    return stops_latency, stop_outcome, alerts_latency, alerts_outcome
+
+def main(args):
+    server = FaultyServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    refused_port = free_port()
+
+    def point_at(target_port):
+        client = OnebusawaySDK(api_key="TEST", base_url=f"http://127.0.0.1:{target_port}",
+                               timeout=Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT), max_retries=0)
+        transit_data.client = client
+        alerts_feed.url = f"http://127.0.0.1:{target_port}/alerts.json"
+
+    transit_data = TransitData(None, pytz.timezone("America/Los_Angeles"), TokenBucket(100, 100),
+                               max_workers=len(STOPS), fetch_deadline=FETCH_DEADLINE)
+    for stop in STOPS:
+        transit_data.add_query(stop, stop)
+    alerts_feed = AlertsFeed("", timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), deadline=ALERTS_DEADLINE)
+    for breaker in (transit_data.breaker, alerts_feed.breaker):
+        breaker.reset_timeout = breaker.open_for = BREAKER_RESET
+        breaker.max_reset_timeout = BREAKER_RESET * 2
+
+    phases = [("healthy", port), ("black hole", port), ("slow drip", port), ("503", port), ("refused", refused_port), ("recovered", port)]
+    failures = []
+    print(f"Bounds: stops {STOPS_BOUND:.1f} s, alerts {ALERTS_BOUND:.1f} s\n")
+    print(f"{'phase':<11} {'stops max':>9} {'alerts max':>10}  outcomes (stops / alerts)")
+    for name, target_port in phases:
+        server.mode = "healthy" if name == "recovered" else name
+        point_at(target_port)
+        stops_latencies, alerts_latencies = [], []
+        outcomes = collections.Counter()
+        rounds = 0
+        while True:
+            stops_latency, stop_outcome, alerts_latency, alerts_outcome = refresh(transit_data, alerts_feed)
+            stops_latencies.append(stops_latency)
+            alerts_latencies.append(alerts_latency)
+            outcomes[f"{stop_outcome} / {alerts_outcome}"] += 1
+            rounds += 1
+            if name == "recovered":
+                # Keep going until both breakers have let a trial through and closed
+                closed = transit_data.breaker.state == "closed" and alerts_feed.breaker.state == "closed"
+                if closed and stop_outcome == "ok" and alerts_outcome == "ok":
+                    break
+                if rounds >= 20:
+                    failures.append("circuit breakers didn't close after the server recovered")
+                    break
+            elif rounds >= args.rounds:
+                break
+            time.sleep(args.interval)
+
+        print(f"{name:<11} {max(stops_latencies):8.2f}s {max(alerts_latencies):9.2f}s  "
+              + ", ".join(f"{count}x {outcome}" for outcome, count in outcomes.items()))
+        if max(stops_latencies) > STOPS_BOUND:
+            failures.append(f"{name}: stops refresh took {max(stops_latencies):.2f} s")
+        if max(alerts_latencies) > ALERTS_BOUND:
+            failures.append(f"{name}: alerts refresh took {max(alerts_latencies):.2f} s")
+
+    server.stopped.set()
+    server.shutdown()
+    transit_data.shutdown()
+    print()
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: every refresh finished within its bound, and both circuit breakers recovered")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=6, help="refreshes per phase")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between refreshes")
+    sys.exit(main(parser.parse_args()))
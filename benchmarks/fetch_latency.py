@@ -0,0 +1,125 @@
+"""
+Wall-clock time of one full refresh (TransitData.fetch), against a local stub client.
+
+    python benchmarks/fetch_latency.py [--stops 5,50] [--latency 0.2] [--rate 1] [--burst 10] [--baseline]
+
+The stub answers every stop query after --latency seconds, as a OneBusAway round trip would,
+and counts how many requests are in flight at once. Each refresh fetches every stop through
+the same FetchEngine and TokenBucket as the board, with its rate limit, and again with no
+effective limit to show what the engine itself costs. --baseline also times the old loop
+(one stop after another, with time.sleep(1) between them), which takes about a minute for
+50 stops.
+
+Exits with status 1 if a refresh that fits in the bucket's burst takes longer than two round
+trips, or if the limit is broken: more requests started than `burst + rate * elapsed`.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import pytz
+from components.fetch_engine import TokenBucket
+from components.transit_data import TransitData
+
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+
+class StubArrivals:
+    """Stands in for the SDK's arrival_and_departure resource, answering after `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        with self.lock:
+            self.started.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            now = time.time()
+            arrivals = [types.SimpleNamespace(
+                route_short_name="8", trip_headsign="Seattle Center", status="default", trip_id=f"{stop_id}_{i}",
+                scheduled_arrival_time=(now + 120 + i * 600) * 1000, predicted_arrival_time=(now + 150 + i * 600) * 1000,
+                predicted=True,
+            ) for i in range(3)]
+            return types.SimpleNamespace(data=types.SimpleNamespace(entry=types.SimpleNamespace(arrivals_and_departures=arrivals)))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+def refresh(stops, latency, rate, burst):
+    """Times one refresh of `stops` stops. Returns (seconds, max in flight, request start times)."""
+    arrivals = StubArrivals(latency)
+    client = types.SimpleNamespace(arrival_and_departure=arrivals)
+    # The same sizing as main.py: a thread per stop, up to the burst
+    transit_data = TransitData(client, TIME_ZONE, TokenBucket(rate, burst), max_workers=min(stops, burst))
+    for i in range(stops):
+        transit_data.add_query(f"stop_{i}", f"1_{i}")
+    started = time.monotonic()
+    updated = transit_data.fetch(list(transit_data.queries))
+    elapsed = time.monotonic() - started
+    transit_data.shutdown()
+    if len(updated) != stops:
+        raise RuntimeError(f"Only {len(updated)} of {stops} stops were updated")
+    return elapsed, arrivals.max_in_flight, [t - started for t in arrivals.started]
+
+def sequential_refresh(stops, latency):
+    """The loop this replaced: one stop at a time, a second apart."""
+    arrivals = StubArrivals(latency)
+    client = types.SimpleNamespace(arrival_and_departure=arrivals)
+    transit_data = TransitData(client, TIME_ZONE, TokenBucket(1, 1))
+    started = time.monotonic()
+    for i in range(stops):
+        transit_data.parse_query(f"1_{i}")
+        if i < stops - 1:
+            time.sleep(1)
+    elapsed = time.monotonic() - started
+    transit_data.shutdown()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", default="5,50", help="Comma-separated numbers of configured stops")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per stub round trip")
+    parser.add_argument("--rate", type=float, default=1, help="Requests per second (API_RATE_LIMIT)")
+    parser.add_argument("--burst", type=int, default=10, help="Requests at once (API_RATE_BURST)")
+    parser.add_argument("--baseline", action="store_true", help="Also time the old sequential loop")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"Round trip {args.latency * 1000:.0f} ms, rate limit {args.rate:g}/s with bursts of {args.burst}")
+    print(f"{'stops':>6} {'limit':>12} {'refresh s':>10} {'round trips':>12} {'in flight':>10}")
+    for stops in (int(n) for n in args.stops.split(",")):
+        for label, rate, burst in (("configured", args.rate, args.burst), ("none", 1e9, stops)):
+            elapsed, in_flight, starts = refresh(stops, args.latency, rate, burst)
+            print(f"{stops:>6} {label:>12} {elapsed:>10.2f} {elapsed / args.latency:>12.1f} {in_flight:>10}")
+            if stops <= burst and elapsed > 2 * args.latency + 0.1:
+                failures.append(f"{stops} stops took {elapsed:.2f} s with {label} limit, more than two round trips")
+            for i, started in enumerate(sorted(starts)):
+                # Allow a little slack for the time between reading the clock and starting
+                if i + 1 > burst + rate * started + 1e-6 and rate < 1e9:
+                    failures.append(f"{stops} stops: request {i + 1} started at {started:.2f} s, over the rate limit")
+                    break
+        if args.baseline:
+            elapsed = sequential_refresh(stops, args.latency)
+            print(f"{stops:>6} {'sequential':>12} {elapsed:>10.2f} {elapsed / args.latency:>12.1f} {1:>10}")
+
+    if failures:
+        print("FAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("PASSED: refreshes within the burst take about one round trip, and the rate limit held")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+How much of the screen the framebuffer output (components/framebuffer.py) writes.
+
+    python benchmarks/framebuffer_diff.py [--hours 1] [--size 800x480] [--rows 3]
+                                          [--alerts none,static,animated] [--alert-cycle 600]
+                                          [--min-interval 0,30] [--bpp 32]
+
+Runs the board for a while on a virtual clock, drawing into a file-backed framebuffer under
+SDL's dummy video driver. Every row has a trip every few minutes, so countdowns tick over,
+trips leave and new ones appear, and the data is refreshed every 35 seconds as on the board.
+There's a frame every second, and 30 a second while the alert animates. The alert cases are:
+
+- none: no alert
+- static: one alert, as on a framebuffer: the full box every --alert-cycle seconds
+  (FRAMEBUFFER_ALERT_CYCLE), without animation, up for a write interval longer than usual
+- animated: one alert, as in a window: the box grows and shrinks every 90 seconds
+
+For each case and minimum interval it prints the pixels and rects written per minute, next
+to the pixels of the regions the board redrew (what a window would have been sent) and of a
+full frame every minute.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts and icons are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from components import arrival_record
+from components.arrival_record import ArrivalRecord
+from components.board_renderer import ALERT_FULL_DISPLAY_SECONDS, AlertAnimation, BoardRenderer
+from components.framebuffer import FramebufferOutput, FramebufferSink
+from components.stop_registry import load_stop_registry
+from components.text_cache import text_cache
+
+START = 1_760_000_000
+DATA_REFRESH_RATE = 35
+FPS = 30 # While the alert animates, as on the board
+ROUTES = [("1 Line", "Lynnwood City Center"), ("1 Line", "Angle Lake"), ("8", "Seattle Center"),
+          ("9", "Rainier Beach"), ("First Hill Streetcar", "Pioneer Square"), ("43", "Downtown Seattle"),
+          ("49", "University District"), ("60", "Westwood Village")]
+ALERT = "1 Line: Trains are running every 20 minutes between SODO and Capitol Hill due to a signal problem near Westlake Station."
+
+def timetable_rows(count, now):
+    """Rows as merge_stop_data returns them at `now`: the next 4 trips of each route."""
+    rows = []
+    for i in range(count):
+        headway = (4, 6, 8, 10, 15)[i % 5] * 60
+        first = START + i * 97 - headway
+        n = max(0, int((now - first) // headway) + 1)
+        records = []
+        for j in range(n, n + 4):
+            arrival = first + j * headway
+            lateness = (arrival_record.ON_TIME, arrival_record.LATE, arrival_record.ON_TIME, arrival_record.SCHEDULED)[j % 4]
+            records.append(ArrivalRecord(arrival, arrival, lateness != arrival_record.SCHEDULED, lateness, "00:00", "default", f"trip_{i}_{j}"))
+        rows.append((ROUTES[i % len(ROUTES)], records))
+    return rows
+
+def alert_animation_for(alerts, args, min_interval):
+    """The AlertAnimation main.py would use for the case, or None for no alert."""
+    if alerts == "static":
+        return AlertAnimation(animate=False, cycle_seconds=args.alert_cycle, full_seconds=ALERT_FULL_DISPLAY_SECONDS + min_interval)
+    if alerts == "animated":
+        return AlertAnimation()
+    return None
+
+def simulate(args, alerts, min_interval, path):
+    now = [START]
+    screen = FramebufferOutput(FramebufferSink(path, args.size, args.bpp), min_interval, clock=lambda: now[0])
+    presented = [0]
+    present = screen.present
+    def counted_present(rects=None):
+        presented[0] += sum(rect.width * rect.height for rect in rects) if rects is not None else args.size[0] * args.size[1]
+        present(rects)
+    screen.present = counted_present
+    renderer = BoardRenderer(screen, "Benchmark Station", "America/Los_Angeles", clock=lambda: now[0], route_styles=load_stop_registry().route_styles)
+    alert_animation = alert_animation_for(alerts, args, min_interval)
+
+    rows = timetable_rows(args.rows, START)
+    version = 0
+    minutes = []
+    last = (0, 0, 0, 0) # writes, pixels written, rects, pixels presented
+    rects_written = [0]
+    write = screen.sink.write
+    def counted_write(surface, rects):
+        rects_written[0] += len(rects)
+        write(surface, rects)
+    screen.sink.write = counted_write
+
+    # Time is counted in frames at FPS so animation frames don't drift off whole seconds
+    tick, minute, next_refresh = 0, 0, 0
+    end = int(args.hours * 3600 * FPS)
+    while tick < end:
+        if tick // (60 * FPS) > minute:
+            totals = (screen.writes, screen.pixels_written, rects_written[0], presented[0])
+            # The first minute includes the initial full write
+            if minute >= 1:
+                minutes.append(tuple(total - previous for total, previous in zip(totals, last)))
+            last = totals
+            minute = tick // (60 * FPS)
+        now[0] = START + tick / FPS
+        if tick >= next_refresh:
+            rows = timetable_rows(args.rows, now[0])
+            version += 1
+            next_refresh += DATA_REFRESH_RATE * FPS
+        alert_view = alert_animation.update(ALERT, now[0]) if alert_animation else None
+        renderer.draw(rows, alert_view, now[0], version=version)
+        screen.flush()
+        if alert_animation and alert_animation.next_change() is None:
+            tick += 1
+        else:
+            tick = (tick // FPS + 1) * FPS
+    screen.sink.close()
+    return minutes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--size", default="800x480", help="Framebuffer size, WIDTHxHEIGHT")
+    parser.add_argument("--rows", type=int, default=3, help="Arrival rows (3 fit on 800x480)")
+    parser.add_argument("--alerts", default="none,static,animated", help="Comma-separated alert cases: none, static, animated")
+    parser.add_argument("--alert-cycle", type=float, default=600, help="Seconds between full alert boxes in the static case (0 for the ticker only)")
+    parser.add_argument("--min-interval", default="0,30", help="Comma-separated minimum seconds between writes")
+    parser.add_argument("--bpp", type=int, default=32, choices=(32, 16, 8))
+    args = parser.parse_args()
+    args.size = tuple(int(n) for n in args.size.lower().split("x"))
+    cases = args.alerts.split(",")
+    for alerts in cases:
+        if alerts not in ("none", "static", "animated"):
+            parser.error(f"unknown alert case {alerts!r}")
+
+    pygame.display.init()
+    pygame.font.init()
+    full_frame = args.size[0] * args.size[1]
+    print(f"{args.size[0]}x{args.size[1]} at {args.bpp} bpp, {args.rows} rows, static alert box every {args.alert_cycle:g} s, "
+          f"{args.hours:g} h. A full frame is {full_frame} pixels")
+    print(f"{'alerts':>8} {'min interval':>12} {'writes/min':>11} {'rects/min':>10} {'pixels/min':>11} {'p50':>8} {'max':>8} {'redrawn/min':>12} {'of full':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for alerts in cases:
+            for min_interval in (float(n) for n in args.min_interval.split(",")):
+                text_cache.clear()
+                minutes = simulate(args, alerts, min_interval, os.path.join(directory, "fb.raw"))
+                writes, pixels, rects, presented = (statistics.fmean(column) for column in zip(*minutes))
+                pixels_sorted = sorted(minute[1] for minute in minutes)
+                print(f"{alerts:>8} {min_interval:>11g}s {writes:>11.1f} {rects:>10.1f} {pixels:>11.0f} {pixels_sorted[len(minutes) // 2]:>8} {pixels_sorted[-1]:>8}"
+                      f" {presented:>12.0f} {pixels / full_frame:>8.1%}")
+
+if __name__ == "__main__":
+    main()
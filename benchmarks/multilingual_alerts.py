@@ -0,0 +1,170 @@
+"""
+Checks how long alerts in other scripts are trimmed for the ticker and wrapped for the full box.
+
+    python benchmarks/multilingual_alerts.py [--widths 120,1800,60]
+
+Each sample alert (English, Chinese, Japanese, Korean in both composed and conjoining-jamo
+form, Arabic and Hebrew with vowel marks, decomposed Vietnamese, Hindi, and emoji with ZWJ
+sequences, skin tones and flags) is trimmed with fit_text and wrapped with wrap_text at every
+width in the range, with the alert font. Both must fit the width, keep the text in order, and
+only cut between grapheme clusters: no line or cut may start with a combining mark or leave a
+ZWJ, skin tone or half a flag behind. Then every sample is laid out by the board's alert
+overlay as the ticker (one line) and as the full box.
+
+The fonts don't have glyphs for every script, so some characters are drawn as boxes, but
+they are measured all the same. Also prints how many measurements fit_text takes, next to
+the old loop that dropped one character at a time. Exits with status 1 on any failure.
+"""
+import argparse
+import os
+import sys
+import unicodedata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts and icons are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from components.board_renderer import ALERT_TICKER_HEIGHT, FONT_PATH, ICON_SIZE, BoardRenderer
+from components.display_functions import fit_text, wrap_text
+
+SAMPLES = {
+    "English": "1 Line: Trains are running every 20 minutes between SODO and Capitol Hill due to a signal problem near Westlake Station. Expect crowding and allow extra travel time.",
+    "Chinese": "由于威斯特莱克站附近的信号故障，一号线列车在索多站和国会山站之间每二十分钟一班。预计车厢拥挤，请预留额外的出行时间。",
+    "Japanese": "ウェストレイク駅付近の信号トラブルのため、1号線はソードー駅とキャピトルヒル駅の間で20分間隔で運行しています。混雑が予想されますので、時間に余裕を持ってお出かけください。",
+    "Korean": "웨스트레이크 역 부근의 신호 장애로 인해 1호선 열차가 소도 역과 캐피톨 힐 역 사이에서 20분 간격으로 운행됩니다. 혼잡이 예상되니 여유 있게 출발하십시오.",
+    "Korean (jamo)": unicodedata.normalize("NFD", "웨스트레이크 역 부근의 신호 장애로 인해 1호선 열차가 소도 역과 캐피톨 힐 역 사이에서 20분 간격으로 운행됩니다."),
+    "Arabic": "بِسَبَبِ عُطْلٍ فِي الإِشَارَاتِ قُرْبَ مَحَطَّةِ وِيسْتْلِيك، تَعْمَلُ قِطَارَاتُ الخَطِّ الأَوَّلِ كُلَّ عِشْرِينَ دَقِيقَةً بَيْنَ سُودُو وَكَابِيتُول هِيل. يُرْجَى تَخْصِيصُ وَقْتٍ إِضَافِيٍّ لِلرِّحْلَةِ.",
+    "Hebrew": "בְּשֶׁל תַּקָּלָה בְּאִתּוּת לְיַד תַּחֲנַת וֶסְטְלֵייק, רַכָּבוֹת קַו 1 פּוֹעֲלוֹת כָּל עֶשְׂרִים דַּקּוֹת בֵּין סוֹדוֹ לְקַפִּיטוֹל הִיל. צְפוּיָה צְפִיפוּת.",
+    "Vietnamese (NFD)": unicodedata.normalize("NFD", "Do sự cố tín hiệu gần ga Westlake, tàu tuyến 1 chạy cứ 20 phút một chuyến giữa SODO và Capitol Hill. Dự kiến sẽ đông đúc, xin hãy dành thêm thời gian."),
+    "Hindi": "वेस्टलेक स्टेशन के पास सिग्नल की समस्या के कारण, लाइन 1 की ट्रेनें सोडो और कैपिटल हिल के बीच हर 20 मिनट में चल रही हैं। भीड़ की संभावना है, कृपया अतिरिक्त समय लेकर चलें।",
+    "Emoji": "🚇⚠️ Delays 👩‍👩‍👧‍👦👩‍👩‍👧‍👦👩‍👩‍👧‍👦 near Westlake 👍🏽👍🏽👍🏽 🇺🇸🇨🇦🇺🇸🇨🇦🇺🇸🇨🇦🇺🇸🇨🇦 🏳️‍🌈🏳️‍🌈🏳️‍🌈 allow extra time ❤️❤️❤️",
+}
+
+def is_regional_indicator(char):
+    return 0x1F1E6 <= ord(char) <= 0x1F1FF
+
+def bad_cut(text, cut):
+    """Why cutting text at `cut` would split a grapheme cluster, or None if it doesn't."""
+    if cut <= 0 or cut >= len(text):
+        return None
+    after, before = text[cut], text[cut - 1]
+    if unicodedata.category(after)[0] == "M":
+        return f"splits {unicodedata.name(after, hex(ord(after)))} from its base"
+    if before == "‍" or after == "‍":
+        return "splits a ZWJ sequence"
+    if 0x1F3FB <= ord(after) <= 0x1F3FF or 0xFE00 <= ord(after) <= 0xFE0F:
+        return "splits an emoji from its modifier"
+    if 0x1160 <= ord(after) <= 0x11FF:
+        return "splits a Hangul syllable"
+    if is_regional_indicator(after):
+        run = 0
+        while cut - run - 1 >= 0 and is_regional_indicator(text[cut - run - 1]):
+            run += 1
+        if run % 2:
+            return "splits a flag"
+    return None
+
+class CountingFont:
+    """Wraps a font, counting calls to size()."""
+
+    def __init__(self, font):
+        self.font = font
+        self.calls = 0
+
+    def size(self, text):
+        self.calls += 1
+        return self.font.size(text)
+
+def old_trim(text, font, max_width, suffix="..."):
+    """The ticker's original trimming: drop one character at a time until it fits."""
+    if font.size(text)[0] <= max_width:
+        return text
+    while text and font.size(text + suffix)[0] > max_width:
+        text = text[:-1]
+    return text + suffix
+
+def check_fit(name, text, font, width, failures):
+    fitted = fit_text(text, font, width)
+    if fitted == text:
+        return
+    prefix = fitted[:-3]
+    if not fitted.endswith("...") or not text.startswith(prefix):
+        failures.append(f"{name} at {width}px: fit_text returned {fitted!r}, not a prefix of the alert")
+        return
+    cut = len(prefix)
+    # fit_text strips trailing spaces, so check the cut where the prefix really ended
+    while cut < len(text) and text[cut] == " ":
+        cut += 1
+    reason = bad_cut(text, len(prefix)) or bad_cut(text, cut)
+    if reason:
+        failures.append(f"{name} at {width}px: fit_text {reason}: {prefix[-3:]!r}|{text[len(prefix):len(prefix) + 3]!r}")
+    if prefix and font.size(fitted)[0] > width:
+        failures.append(f"{name} at {width}px: fit_text returned {font.size(fitted)[0]}px")
+
+def check_wrap(name, text, font, width, failures):
+    lines = wrap_text(text, font, width)
+    if "".join(lines).replace(" ", "") != text.replace(" ", ""):
+        failures.append(f"{name} at {width}px: wrap_text lost or reordered text")
+        return
+    position = 0
+    for line in lines:
+        start = text.index(line, position) if line else position
+        position = start + len(line)
+        reason = bad_cut(text, start) or bad_cut(text, position)
+        if reason:
+            failures.append(f"{name} at {width}px: wrap_text {reason} in line {line!r}")
+            return
+        # A single cluster wider than the line is allowed to stick out
+        if font.size(line)[0] > width and len(line) > 2 and not line.isspace():
+            failures.append(f"{name} at {width}px: wrapped line is {font.size(line)[0]}px: {line!r}")
+            return
+
+def check_overlay(name, text, renderer, surface, failures):
+    for label, height in (("ticker", ALERT_TICKER_HEIGHT), ("box", ICON_SIZE)):
+        bar, icon, text_x, text_top, line_images, bounds = renderer.alert_overlay_layout(surface.get_size(), text, height, height)
+        max_width = bar.width - text_x - 12
+        if label == "ticker" and len(line_images) != 1:
+            failures.append(f"{name}: the ticker has {len(line_images)} lines")
+        for image in line_images:
+            if image.get_width() > max_width:
+                failures.append(f"{name}: a {label} line is {image.get_width()}px, over {max_width}px")
+                break
+        renderer.draw_alert_overlay(renderer.screen, text, height, height)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--widths", default="120,1800,60", help="start,stop,step of the widths to check, in pixels")
+    args = parser.parse_args()
+    start, stop, step = (int(n) for n in args.widths.split(","))
+
+    pygame.display.init()
+    pygame.font.init()
+    surface = pygame.display.set_mode((1280, 720))
+    font = pygame.font.Font(FONT_PATH, 32) # The alert font
+    renderer = BoardRenderer(surface, "Benchmark Station", "America/Los_Angeles")
+
+    failures = []
+    print(f"{'alert':>17} {'chars':>6} {'px':>6} {'old measures':>13} {'fit_text measures':>18}")
+    for name, text in SAMPLES.items():
+        for width in range(start, stop + 1, step):
+            check_fit(name, text, font, width, failures)
+            check_wrap(name, text, font, width, failures)
+        check_overlay(name, text, renderer, surface, failures)
+        # Measurements to trim the alert for a ticker on a 1280px screen
+        old_font, new_font = CountingFont(font), CountingFont(font)
+        old_trim(text, old_font, 1200)
+        fit_text(text, new_font, 1200)
+        print(f"{name:>17} {len(text):>6} {font.size(text)[0]:>6} {old_font.calls:>13} {new_font.calls:>18}")
+
+    if failures:
+        print(f"FAILED ({len(failures)}):")
+        for failure in failures[:30]:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("PASSED: every alert was trimmed and wrapped to fit, between grapheme clusters")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+OneBusAway calls over a simulated day, with adaptive polling (PollScheduler) and without it.
+
+    python benchmarks/poll_day.py [--days 1] [--interval 35] [--error-rate 0]
+
+Each stop is served by a stub client on its own timetable, in local time: light rail every
+8-15 minutes from 5 am to 1 am, a frequent bus, an hourly bus from 6 am to 9 pm, and a peak
+hours express. Predictions run up to a few minutes late. Time is a VirtualClock, so a day
+takes a second or two.
+
+- fixed: every stop is polled every --interval seconds, all day and night, as the board
+  used to (a stop with nothing in the next 35 minutes costs a second, 7 hour lookahead call)
+- adaptive: TransitData's PollScheduler decides when each stop is next due, as the board does
+
+For each stop it prints the calls per day, and the longest the board went without fresh data
+while a trip was under 3 minutes away, which is when a stale countdown shows. Exits with
+status 1 if adaptive polling makes more calls than fixed, or lets that gap grow beyond the
+fixed interval.
+"""
+import argparse
+import os
+import random
+import sys
+import types
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+import requests
+from components.replay import NoRateLimit, VirtualClock
+from components.transit_data import TransitData
+
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+START = TIME_ZONE.localize(datetime(2025, 10, 8)).timestamp() # Local midnight, a Wednesday
+IMMINENT_SECONDS = 180
+
+# (route, headsign, [(from hour, to hour, headway in minutes)]), hours in local time, past 24 for after midnight
+STOPS = {
+    "40_99610": ("1 Line", "Angle Lake", [(5, 6, 15), (6, 9, 8), (9, 15, 10), (15, 19, 8), (19, 22, 12), (22, 25, 15)]),
+    "1_11060": ("49", "University District", [(5, 7, 15), (7, 19, 10), (19, 24, 20)]),
+    "1_29266": ("125", "Downtown Seattle", [(6, 21, 60)]),
+    "1_1121": ("577", "Federal Way", [(6, 9, 20), (15, 18, 20)]),
+}
+
+def timetable(stop_id, days):
+    """Every scheduled arrival at the stop, over `days` days and the morning after."""
+    route, headsign, periods = STOPS[stop_id]
+    times = []
+    for day in range(days + 1):
+        for start_hour, end_hour, headway in periods:
+            t = START + day * 86400 + start_hour * 3600
+            while t < START + day * 86400 + end_hour * 3600:
+                times.append(t)
+                t += headway * 60
+    return sorted(times)
+
+class StubArrivals:
+    """Stands in for the SDK's arrival_and_departure resource, answering from the timetables."""
+
+    def __init__(self, clock, days, error_rate):
+        self.clock = clock
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+        self.timetables = {stop_id: timetable(stop_id, days) for stop_id in STOPS}
+        # Predictions run 0-4 minutes late, the same for every poll of a trip
+        self.predicted = {stop_id: [t + (int(t) // 60 * 37 % 5) * 60 for t in times] for stop_id, times in self.timetables.items()}
+        self.calls = defaultdict(int)
+        self.polls = defaultdict(list) # stop ID -> times of successful polls
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        self.calls[stop_id] += 1
+        if self.random.random() < self.error_rate:
+            raise requests.exceptions.ConnectionError("Synthetic outage")
+        now = self.clock()
+        route, headsign, _ = STOPS[stop_id]
+        scheduled, predicted = self.timetables[stop_id], self.predicted[stop_id]
+        arrivals = []
+        for i in range(bisect_left(predicted, now), len(predicted)):
+            if predicted[i] > now + minutes_after * 60:
+                break
+            arrivals.append(types.SimpleNamespace(
+                route_short_name=route, trip_headsign=headsign, status="default", trip_id=f"{stop_id}_{i}",
+                scheduled_arrival_time=scheduled[i] * 1000, predicted_arrival_time=predicted[i] * 1000, predicted=True,
+            ))
+        if minutes_after <= 35:
+            self.polls[stop_id].append(now)
+        return types.SimpleNamespace(data=types.SimpleNamespace(entry=types.SimpleNamespace(arrivals_and_departures=arrivals)))
+
+def longest_imminent_gap(polls, arrivals, end):
+    """The longest stretch without a poll while the next trip was under IMMINENT_SECONDS away."""
+    longest = 0
+    for arrival in arrivals:
+        window_start = arrival - IMMINENT_SECONDS
+        if window_start < START or arrival > end:
+            continue
+        # The last poll before the window, every poll in it, and the arrival itself
+        first = max(0, bisect_right(polls, window_start) - 1)
+        last = bisect_right(polls, arrival)
+        points = polls[first:last] + [arrival]
+        if not points or points[0] > window_start:
+            points = [START] + points
+        longest = max(longest, max(b - max(a, window_start) for a, b in zip(points, points[1:])))
+    return longest
+
+def simulate(args, adaptive):
+    clock = VirtualClock(START, speed=0)
+    arrivals = StubArrivals(clock.time, args.days, args.error_rate)
+    client = types.SimpleNamespace(arrival_and_departure=arrivals)
+    transit_data = TransitData(client, TIME_ZONE, NoRateLimit(), base_interval=args.interval, clock=clock.time, max_workers=len(STOPS))
+    for stop_id in STOPS:
+        transit_data.add_query(stop_id, stop_id)
+    end = START + args.days * 86400
+
+    while clock.time() < end:
+        now = clock.time()
+        if adaptive:
+            transit_data.fetch(transit_data.poll_scheduler.due(now))
+            clock.advance_to(max(now + 0.001, transit_data.poll_scheduler.next_due()))
+        else:
+            transit_data.fetch(list(transit_data.queries))
+            clock.advance_to(now + args.interval)
+    transit_data.shutdown()
+    gaps = {stop_id: longest_imminent_gap(arrivals.polls[stop_id], arrivals.predicted[stop_id], end) for stop_id in STOPS}
+    return arrivals.calls, gaps
+
+def main(args):
+    results = {}
+    devnull = open(os.devnull, "w")
+    for label, adaptive in (("fixed", False), ("adaptive", True)):
+        # Failed polls are printed by TransitData; only the report goes to the terminal
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            results[label] = simulate(args, adaptive)
+        finally:
+            sys.stdout = stdout
+    devnull.close()
+
+    print(f"{args.days:g} day(s), fixed interval {args.interval:g} s, {args.error_rate:.0%} of calls failing")
+    print(f"{'stop':>10} {'route':>7} {'fixed calls/day':>16} {'adaptive calls/day':>19} {'saved':>6} {'stale gap fixed':>16} {'adaptive':>9}")
+    failures = []
+    totals = [0, 0]
+    for stop_id, (route, _, _) in STOPS.items():
+        fixed_calls, adaptive_calls = results["fixed"][0][stop_id] / args.days, results["adaptive"][0][stop_id] / args.days
+        fixed_gap, adaptive_gap = results["fixed"][1][stop_id], results["adaptive"][1][stop_id]
+        totals[0] += fixed_calls
+        totals[1] += adaptive_calls
+        print(f"{stop_id:>10} {route:>7} {fixed_calls:>16.0f} {adaptive_calls:>19.0f} {1 - adaptive_calls / fixed_calls:>6.0%} "
+              f"{fixed_gap:>15.0f}s {adaptive_gap:>8.0f}s")
+        if adaptive_calls > fixed_calls:
+            failures.append(f"{stop_id}: adaptive polling made more calls than fixed")
+        if args.error_rate == 0 and adaptive_gap > args.interval + 1:
+            failures.append(f"{stop_id}: went {adaptive_gap:.0f} s without fresh data while a trip was due")
+    print(f"{'total':>10} {'':>7} {totals[0]:>16.0f} {totals[1]:>19.0f} {1 - totals[1] / totals[0]:>6.0%}")
+
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: adaptive polling made fewer calls, without leaving imminent arrivals staler than fixed polling")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=35, help="seconds between fixed polls (DATA_REFRESH_RATE)")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of calls that fail")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,327 @@
+"""
+Frame-time jitter while refreshes run, with fetching and parsing on threads (the default)
+and in a child process (FETCH_MODE="process").
+
+    python benchmarks/refresh_jitter.py [--seconds 20] [--stops 5] [--refresh 2] [--cpus 1]
+
+A local server (in its own process) answers OneBusAway and alerts requests with full-size
+responses: --arrivals arrivals per stop with trip status, and --alerts alerts that change on
+every request. They go through the real SDK and alerts parser, every --refresh seconds, which
+is far more often than the board polls, to make the parsing cost easy to see.
+
+Meanwhile the main thread draws the alert animation at --fps under SDL's dummy video driver,
+as the board does during an alert transition. For each frame it measures how long after its
+slot it was finished. With threads, the parsing competes with drawing for the GIL; with a
+process, the board only decodes the compact rows the child sends. --cpus pins everything but
+the server to that many cores, e.g. 1 to see what a single-core Pi would.
+"""
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts and icons are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pytz
+
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+ROUTES = [("1 Line", "Angle Lake"), ("1 Line", "Lynnwood City Center"), ("8", "Seattle Center"),
+          ("43", "Downtown Seattle"), ("49", "University District"), ("Streetcar", "Pioneer Square")]
+
+# --- Upstream ---
+
+def arrivals_body(stop_id, count):
+    now = int(time.time() * 1000)
+    arrivals = []
+    for i in range(count):
+        route, headsign = ROUTES[i % len(ROUTES)]
+        scheduled = now + 60000 + i * 45000
+        predicted = scheduled + (i * 37 % 11 - 2) * 30000
+        trip_id = f"1_{now // 60000}_{i}"
+        arrivals.append({
+            "arrivalEnabled": True, "blockTripSequence": i % 7, "departureEnabled": True, "numberOfStopsAway": i % 12,
+            "predictedArrivalTime": predicted, "predictedDepartureTime": predicted + 20000, "routeId": f"1_{route}",
+            "scheduledArrivalTime": scheduled, "scheduledDepartureTime": scheduled + 20000, "serviceDate": now - now % 86400000,
+            "stopId": stop_id, "stopSequence": 10 + i % 30, "totalStopsInTrip": 40, "tripHeadsign": headsign,
+            "tripId": trip_id, "vehicleId": f"1_{4000 + i}", "distanceFromStop": 1234.5 * (i + 1), "lastUpdateTime": now,
+            "predicted": i % 5 != 0, "routeShortName": route, "routeLongName": f"{route} to {headsign}", "status": "default",
+            "situationIds": [], "occupancyStatus": "MANY_SEATS_AVAILABLE",
+            "tripStatus": {
+                "activeTripId": trip_id, "blockTripSequence": i % 7, "closestStop": stop_id, "distanceAlongTrip": 5000.0 + i,
+                "lastKnownDistanceAlongTrip": 4990.0 + i, "lastLocationUpdateTime": now, "lastUpdateTime": now,
+                "occupancyCapacity": 100, "occupancyCount": i, "occupancyStatus": "MANY_SEATS_AVAILABLE", "phase": "in_progress",
+                "predicted": True, "scheduleDeviation": i * 10, "serviceDate": now - now % 86400000, "status": "SCHEDULED",
+                "totalDistanceAlongTrip": 20000.0, "closestStopTimeOffset": 30, "lastKnownLocation": {"lat": 47.6, "lon": -122.3},
+                "lastKnownOrientation": 90.0, "nextStop": stop_id, "nextStopTimeOffset": 60, "orientation": 90.0,
+                "position": {"lat": 47.6, "lon": -122.3}, "scheduledDistanceAlongTrip": 5000.0, "vehicleId": f"1_{4000 + i}",
+            },
+        })
+    references = {"agencies": [], "routes": [], "situations": [], "stopTimes": [], "stops": [], "trips": []}
+    return json.dumps({"code": 200, "currentTime": now, "text": "OK", "version": 2,
+                       "data": {"entry": {"arrivalsAndDepartures": arrivals}, "references": references}}).encode()
+
+def alerts_body(count):
+    version = time.time()
+    return json.dumps({"header": {"gtfs_realtime_version": "2.0", "timestamp": int(version)}, "entity": [{
+        "id": f"alert_{i}",
+        "alert": {
+            "severity_level": "SEVERE" if i % 10 == 0 else "WARNING", "active_period": [{"start": 0}],
+            "cause": "TECHNICAL_PROBLEM", "effect": "SIGNIFICANT_DELAYS",
+            "informed_entity": [{"agency_id": "40", "route_id": f"100{j}", "stop_id": f"1_{i * 10 + j}"} for j in range(8)],
+            "header_text": {"translation": [{"language": "en", "text": f"Alert {i} ({version:.0f}): trains are delayed near Westlake"}]},
+            "description_text": {"translation": [{"language": language, "text": f"Alert {i} in {language}. " + "Expect delays. " * 20}
+                                                 for language in ("en", "es", "zh", "vi")]},
+        },
+    } for i in range(count)]}).encode()
+
+class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/api/where/"):
+            stop_id = self.path.rpartition("/")[2].partition(".json")[0]
+            body = arrivals_body(stop_id, self.server.arrivals)
+        else:
+            body = alerts_body(self.server.alerts)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def run_server(args):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    server.arrivals = args.arrivals
+    server.alerts = args.alerts
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+def start_server(args):
+    """Starts the upstream in its own process, so it doesn't take the GIL from what's measured."""
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--arrivals", str(args.arrivals), "--alerts", str(args.alerts)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return server, int(server.stdout.readline())
+
+# --- The fetch pipeline, as the board and its fetch process set it up ---
+
+def make_pipeline(port, args):
+    from components.alerts_feed import AlertsFeed
+    from components.replay import NoRateLimit
+    from components.transit_data import TransitData
+    from onebusaway import OnebusawaySDK
+    client = OnebusawaySDK(api_key="BENCHMARK", base_url=f"http://127.0.0.1:{port}", max_retries=0)
+    transit_data = TransitData(client, TIME_ZONE, NoRateLimit(), base_interval=args.refresh, max_workers=args.stops)
+    # Every arrival is imminent, so this is the interval that counts
+    transit_data.poll_scheduler.fast_interval = args.refresh
+    alerts_feed = AlertsFeed(f"http://127.0.0.1:{port}/alerts.json")
+    return transit_data, alerts_feed
+
+def run_child(args):
+    """The child process of process mode: a FetchDaemon serving one board, like fetcher.py --parent."""
+    from components.fetch_daemon import FetchDaemon
+    transit_data, alerts_feed = make_pipeline(args.port, args)
+    daemon = FetchDaemon(transit_data, alerts_feed, ["SEVERE"], args.socket, args.refresh)
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transit_data.shutdown()
+        alerts_feed.close()
+
+class ThreadedRefreshes:
+    """The default mode: refreshes on the board's own worker pool, as main.py runs them."""
+
+    def __init__(self, port, args, board_state):
+        from components.fetch_supervisor import FetchSupervisor
+        from components.worker_pool import WorkerPool
+        self.transit_data, self.alerts_feed = make_pipeline(port, args)
+        self.board_state = board_state
+        self.stop_keys = [f"1_{i}" for i in range(args.stops)]
+        for key in self.stop_keys:
+            self.transit_data.add_query(key, key)
+        self.refresh_rate = args.refresh
+        self.workers = WorkerPool("refresh", workers=2)
+        self.data_refresh = FetchSupervisor("Transit data", 60, self.workers)
+        self.alerts_refresh = FetchSupervisor("Service alerts", 60, self.workers)
+        self.next_alerts = 0
+        self.updates = 0
+
+    def _fetch_transit_data(self, keys):
+        self.transit_data.fetch(keys)
+        rows = []
+        for key in self.stop_keys:
+            rows.extend(self.transit_data.arrivals.get(key, {}).items())
+        self.board_state.publish_rows(rows)
+        self.updates += len(keys) # One update per stop, as the fetch process sends them
+
+    def _fetch_service_alerts(self):
+        self.board_state.publish_alerts(self.alerts_feed.fetch_alerts(["SEVERE"]))
+        self.updates += 1
+
+    def tick(self):
+        """What main.py's loop does each frame: start any refreshes that are due."""
+        now = time.time()
+        due = self.transit_data.poll_scheduler.due(now)
+        if due and not self.data_refresh.busy():
+            self.data_refresh.start(self._fetch_transit_data, due)
+        if now >= self.next_alerts and not self.alerts_refresh.busy():
+            self.alerts_refresh.start(self._fetch_service_alerts)
+            self.next_alerts = now + self.refresh_rate
+
+    def close(self):
+        self.workers.close()
+        self.transit_data.shutdown()
+        self.alerts_feed.close()
+
+class ProcessRefreshes:
+    """FETCH_MODE="process": a supervised child process, read with a FetchSubscriber."""
+
+    def __init__(self, port, args, board_state):
+        from components.fetch_daemon import FetchSubscriber
+        from components.fetch_process import FetchProcess
+        self.board_state = board_state
+        self.stop_keys = [f"1_{i}" for i in range(args.stops)]
+        self.arrivals = {}
+        self.updates = 0
+        socket_path = os.path.join(tempfile.gettempdir(), f"refresh-jitter-{os.getpid()}.sock")
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--socket", socket_path, "--port", str(port),
+                   "--stops", str(args.stops), "--refresh", str(args.refresh)]
+        self.process = FetchProcess(socket_path, command)
+        self.subscriber = FetchSubscriber(socket_path, [(key, None) for key in self.stop_keys],
+                                          self._on_arrivals, self._on_alerts, reconnect_delay=0.5)
+        self.process.start()
+        self.subscriber.start()
+
+    def _on_arrivals(self, key, rows):
+        self.arrivals[key] = rows
+        merged = []
+        for stop_key in self.stop_keys:
+            merged.extend(self.arrivals.get(stop_key, {}).items())
+        self.board_state.publish_rows(merged)
+        self.updates += 1
+
+    def _on_alerts(self, alerts):
+        self.board_state.publish_alerts(alerts)
+        self.updates += 1
+
+    def tick(self):
+        pass
+
+    def close(self):
+        self.subscriber.close()
+        self.process.close()
+
+# --- Measurement ---
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(mode, port, args):
+    """Draws frames for the warm-up and then --seconds, returning how late each measured frame finished (s)."""
+    import pygame
+    from components.board_renderer import AlertAnimation, BoardRenderer
+    from components.board_state import BoardState
+    from components.stop_registry import load_stop_registry
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((1024, 768))
+    renderer = BoardRenderer(screen, "Benchmark Station", "America/Los_Angeles", route_styles=load_stop_registry().route_styles)
+    renderer.load_alert_assets()
+    animation = AlertAnimation()
+    board_state = BoardState()
+    refreshes = (ThreadedRefreshes if mode == "thread" else ProcessRefreshes)(port, args, board_state)
+
+    interval = 1 / args.fps
+    delays = []
+    measure_from = time.perf_counter() + args.warmup
+    end = measure_from + args.seconds
+    next_frame = time.perf_counter()
+    updates_at_start = None
+    try:
+        while next_frame < end:
+            time.sleep(max(0, next_frame - time.perf_counter()))
+            pygame.event.pump()
+            refreshes.tick()
+            snapshot = board_state.current
+            now = time.time()
+            # Keep the alert expanding and collapsing, so every frame redraws it
+            animation.last_cycle = 0
+            animation.show_full_until = min(animation.show_full_until, now)
+            alert_view = animation.update(snapshot.alert_text() or "Benchmark alert", now)
+            renderer.draw(snapshot.rows, alert_view, now, version=snapshot.version)
+            finished = time.perf_counter()
+            if next_frame >= measure_from:
+                if updates_at_start is None:
+                    updates_at_start = refreshes.updates
+                delays.append(finished - next_frame)
+            next_frame += interval
+            if next_frame < finished:
+                # Missed slots are dropped, not made up for with a burst of frames
+                next_frame += (finished - next_frame) // interval * interval + interval
+        updates = refreshes.updates - (updates_at_start or 0)
+    finally:
+        refreshes.close()
+        pygame.quit()
+    return delays, updates
+
+def main(args):
+    server, port = start_server(args)
+    if args.cpus:
+        # After starting the server, so it doesn't count; the fetch process inherits this
+        os.sched_setaffinity(0, set(sorted(os.sched_getaffinity(0))[:args.cpus]))
+    results = {}
+    try:
+        for mode in args.modes.split(","):
+            print(f"Measuring {mode} mode for {args.seconds:.0f} s...", flush=True)
+            results[mode] = measure(mode, port, args)
+    finally:
+        server.kill()
+        server.wait()
+
+    budget = 1000 / args.fps
+    cpus = f", {args.cpus} CPU{'s' if args.cpus > 1 else ''}" if args.cpus else ""
+    print(f"\nTime from each frame's slot until it was drawn, at {args.fps} FPS ({budget:.1f} ms per frame{cpus}):")
+    print(f"{'mode':>8} {'frames':>7} {'updates':>7} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'stdev ms':>8} {'late':>6}")
+    for mode, (delays, updates) in results.items():
+        delays_ms = [delay * 1000 for delay in delays]
+        late = sum(delay > budget for delay in delays_ms)
+        print(f"{mode:>8} {len(delays_ms):7} {updates:7} {statistics.median(delays_ms):7.1f} {percentile(delays_ms, 0.99):7.1f} "
+              f"{max(delays_ms):7.1f} {statistics.pstdev(delays_ms):8.1f} {late / len(delays_ms):6.1%}")
+    print("\n'updates' counts the stops and alert lists each mode delivered to the board; 'late' is the share of frames that missed their slot.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20, help="seconds to measure each mode for")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds to run before measuring")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--stops", type=int, default=5)
+    parser.add_argument("--refresh", type=float, default=2, help="seconds between refreshes of each stop and the alerts")
+    parser.add_argument("--arrivals", type=int, default=60, help="arrivals in each OneBusAway response")
+    parser.add_argument("--alerts", type=int, default=200, help="alerts in the alerts feed")
+    parser.add_argument("--cpus", type=int, help="run on only this many CPU cores (Linux)")
+    parser.add_argument("--modes", default="thread,process")
+    # Used internally, to run the upstream server and the fetch process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        run_server(args)
+    elif args.child:
+        run_child(args)
+    else:
+        sys.exit(main(args))
@@ -0,0 +1,347 @@
+"""
+Headless benchmark of the board's render path (components/board_renderer.py).
+
+    python benchmarks/render_bench.py [--rows 1,10,40] [--alerts 0,1,10] [--frames 200]
+    python benchmarks/render_bench.py --backend software,texture
+    python benchmarks/render_bench.py --compare benchmarks/results/<older commit>.json
+
+Draws synthetic boards under SDL's dummy video driver: each row has 4 arrivals (a mix of
+predicted, late and scheduled times, some over an hour out), headsigns are long enough to
+need fitting, and alerts range from one line to several. Rows that don't fit on the screen
+are paged, so only one page of them is drawn. For every dataset it times:
+
+- cold: the first frame, with empty text and layout caches
+- steady: frames where nothing changed (the common case between countdown ticks)
+- minute: frames where every countdown ticked over
+- repaint: full repaints, as after a resize or window expose
+- alert phases: ticker, expand, full and collapse frames of the alert animation, and the
+  ticker frame right after rotating to the next alert
+
+It also counts the surfaces allocated per frame (font renders and transform calls) and the
+Python memory allocated per frame (tracemalloc, in a separate untimed pass). Results are
+written to benchmarks/results/<commit>.json so runs can be compared between commits.
+
+--backend picks the canvas to draw on (see components/canvas.py): "texture" runs the same
+frames through SDL2's renderer, and its datasets are prefixed with "texture". Under the dummy
+video driver that is SDL's software renderer; on a GPU the time of a frame only goes up to
+submitting it, since the GPU may finish drawing it later.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts and icons are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from components import arrival_record
+from components.arrival_record import ArrivalRecord
+from components.board_renderer import ALERT_TRANSITION_DURATION, AlertAnimation, BoardRenderer
+from components.canvas import open_canvas
+from components.stop_registry import load_stop_registry
+from components.text_cache import text_cache
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+FRAME_STEP = 1 / 30 # Virtual time between animation frames, at the board's FPS
+START = 1_760_000_000
+
+ROUTES = ["1 Line", "2 Line", "8", "43", "49", "Streetcar", "545", "C Line"]
+HEADSIGNS = [
+    "Angle Lake",
+    "Lynnwood City Center",
+    "Downtown Seattle via Capitol Hill and Madison Valley",
+    "University District Station via Broadway and Eastlake Avenue East",
+    "Pioneer Square",
+    "Redmond Technology Station Express",
+    "Rainier Beach via Martin Luther King Jr Way South",
+]
+ALERT_TEXTS = [
+    "Elevator out of service at Capitol Hill Station.",
+    "Trains are running every 20 minutes between Westlake and SODO due to maintenance work.",
+    "Route 8 is rerouted in both directions between Denny Way and E John St due to a collision. "
+    "Use stops on Olive Way instead. Expect delays of up to 20 minutes in the area.",
+    "Weekend service change: 1 Line trains will single-track between Stadium and SODO stations from "
+    "Friday 10 PM until Monday 4 AM. Trains will run every 15 minutes and may be crowded. Plan extra "
+    "travel time and consider using routes 36, 101 and 150 as alternatives.",
+]
+
+class CountingFont:
+    """Wraps a pygame Font to count render() calls, i.e. new text surfaces."""
+
+    def __init__(self, font, counts):
+        self.font = font
+        self.counts = counts
+
+    def render(self, *args, **kwargs):
+        self.counts["surfaces"] += 1
+        return self.font.render(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.font, name)
+
+def count_transforms(counts):
+    """Counts the surfaces made by pygame.transform (scaling the icon, etc.)."""
+    for name in ("scale", "smoothscale", "rotate", "rotozoom"):
+        original = getattr(pygame.transform, name)
+        def counted(*args, _original=original, **kwargs):
+            counts["surfaces"] += 1
+            return _original(*args, **kwargs)
+        setattr(pygame.transform, name, counted)
+
+def synthetic_rows(count, now, rng):
+    """Rows in the shape merge_stop_data returns: ((route, headsign), [4 ArrivalRecords])."""
+    rows = []
+    for i in range(count):
+        records = []
+        for j in range(4):
+            scheduled = now + rng.randint(0, 30) * 60 + j * 420 + rng.randint(0, 59)
+            lateness = rng.choice([arrival_record.ON_TIME, arrival_record.ON_TIME, arrival_record.EARLY,
+                                   arrival_record.LATE, arrival_record.VERY_LATE, arrival_record.SCHEDULED])
+            predicted = lateness != arrival_record.SCHEDULED
+            arrival = scheduled + {arrival_record.EARLY: -90, arrival_record.LATE: 150, arrival_record.VERY_LATE: 420}.get(lateness, 0)
+            if i % 7 == 6:
+                # Night mode: the next trip is hours away, so the row shows clock times
+                arrival += 4 * 3600
+            records.append(ArrivalRecord(arrival, scheduled, predicted, lateness, time.strftime("%H:%M", time.gmtime(arrival)), "default", f"trip_{i}_{j}"))
+        records.sort(key=lambda record: record.arrival_epoch)
+        rows.append(((ROUTES[i % len(ROUTES)], HEADSIGNS[i % len(HEADSIGNS)]), records))
+    return rows
+
+def synthetic_alerts(count, rng):
+    return [rng.choice(ALERT_TEXTS) + f" ({i + 1}/{count})" for i in range(count)]
+
+def summarize(samples):
+    """Percentiles in milliseconds."""
+    samples = sorted(samples)
+    if not samples:
+        return None
+    def at(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": samples[-1] * 1000, "mean": statistics.fmean(samples) * 1000, "frames": len(samples)}
+
+class Bench:
+    def __init__(self, size, backend="software"):
+        pygame.init()
+        self.screen = open_canvas(size, backend=backend)
+        self.counts = {"surfaces": 0}
+        count_transforms(self.counts)
+
+    def new_renderer(self):
+        """A renderer with empty caches and counting fonts, as on a fresh boot."""
+        text_cache.clear()
+        renderer = BoardRenderer(self.screen, "Benchmark Station", "America/Los_Angeles", clock=lambda: self.now,
+                                 route_styles=load_stop_registry().route_styles)
+        renderer.font_large = CountingFont(renderer.font_large, self.counts)
+        renderer.load_alert_assets()
+        renderer.font_alert = CountingFont(renderer.font_alert, self.counts)
+        renderer.alert_layouts.font = renderer.font_alert
+        renderer.clock_display.font = CountingFont(renderer.clock_display.font, self.counts)
+        return renderer
+
+    def frames(self, renderer, rows, alerts, n):
+        """
+        Yields (phase, frame function) for every scenario. Each frame function draws one frame
+        at the next virtual time for its phase.
+        """
+        alert_animation = AlertAnimation()
+        alert_index = [0]
+
+        def alert_view():
+            if not alerts:
+                return None
+            return alert_animation.update(alerts[alert_index[0]], self.now)
+
+        def draw():
+            renderer.draw(rows, alert_view(), self.now)
+
+        # Cold first frame, which also starts the alert cycle
+        self.now = START
+        yield "cold", draw
+
+        # Finish that alert cycle, so the following scenarios all show the ticker
+        self.now += ALERT_TRANSITION_DURATION + 13
+        draw()
+        self.now += ALERT_TRANSITION_DURATION + 1
+        draw()
+        ticker_time = self.now
+
+        for _ in range(n):
+            yield "steady", draw
+
+        def minute_tick():
+            # Alternate between two minutes, so every countdown changes each frame
+            self.now = ticker_time + 60 if self.now == ticker_time else ticker_time
+            draw()
+        for _ in range(n):
+            yield "minute", minute_tick
+        self.now = ticker_time
+
+        def repaint():
+            renderer.region_tracker.invalidate()
+            draw()
+        for _ in range(n):
+            yield "repaint", repaint
+
+        if not alerts:
+            return
+        for _ in range(n):
+            yield "alert: ticker", draw
+
+        def rotate():
+            alert_index[0] = (alert_index[0] + 1) % len(alerts)
+            draw()
+        for _ in range(min(n, 4 * len(alerts))):
+            yield "alert: rotate", rotate
+
+        # Step through whole expand/full/collapse cycles at the board's FPS
+        for _ in range(max(1, n // 60)):
+            alert_animation.last_cycle = self.now - 100
+            while True:
+                def step():
+                    self.now += FRAME_STEP
+                    draw()
+                state = alert_animation.state
+                if state == "animating":
+                    phase = "alert: " + alert_animation.transition_direction
+                elif state == "full":
+                    phase = "alert: full"
+                else:
+                    phase = "alert: expand" # The frame that starts the cycle
+                yield phase, step
+                if alert_animation.state == "ticker":
+                    break
+
+    def run(self, row_count, alert_count, n, seed=0):
+        rng = random.Random(seed)
+        rows = synthetic_rows(row_count, START, rng)
+        alerts = synthetic_alerts(alert_count, rng)
+
+        # Timed pass
+        renderer = self.new_renderer()
+        timings = {}
+        for phase, frame in self.frames(renderer, rows, alerts, n):
+            started = time.perf_counter()
+            frame()
+            timings.setdefault(phase, []).append(time.perf_counter() - started)
+
+        # Untimed pass, counting allocations
+        renderer = self.new_renderer()
+        surfaces = {}
+        python_bytes = {}
+        tracemalloc.start()
+        for phase, frame in self.frames(renderer, rows, alerts, n):
+            self.counts["surfaces"] = 0
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            frame()
+            surfaces.setdefault(phase, []).append(self.counts["surfaces"])
+            python_bytes.setdefault(phase, []).append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+
+        return {
+            phase: {
+                **summarize(samples),
+                "surfaces_per_frame": statistics.fmean(surfaces[phase]),
+                "python_kb_per_frame": statistics.fmean(python_bytes[phase]) / 1024,
+            }
+            for phase, samples in timings.items()
+        }
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+def print_results(results):
+    print(f"{'dataset':<26} {'phase':<16} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'surfaces':>9} {'py KB':>7}")
+    for dataset, phases in results.items():
+        for phase, stats in phases.items():
+            print(f"{dataset:<26} {phase:<16} {stats['p50']:8.3f} {stats['p90']:8.3f} {stats['p99']:8.3f} {stats['max']:8.3f} "
+                  f"{stats['surfaces_per_frame']:9.1f} {stats['python_kb_per_frame']:7.1f}")
+
+def compare(old, new, threshold):
+    """Prints the p50/p99 change of every phase in both runs. Returns the number of regressions."""
+    print(f"\nCompared with {old['commit']} ({old['date']}):")
+    print(f"{'dataset':<26} {'phase':<16} {'p50 before':>10} {'after':>8} {'change':>8} {'p99 before':>10} {'after':>8} {'change':>8}")
+    regressions = 0
+    for dataset, phases in new["results"].items():
+        for phase, stats in phases.items():
+            before = old["results"].get(dataset, {}).get(phase)
+            if before is None:
+                continue
+            changes = []
+            for key in ("p50", "p99"):
+                change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0
+                changes.append(change)
+            flag = ""
+            if changes[0] > threshold:
+                flag = "  <- slower"
+                regressions += 1
+            print(f"{dataset:<26} {phase:<16} {before['p50']:10.3f} {stats['p50']:8.3f} {changes[0]:+7.0f}% "
+                  f"{before['p99']:10.3f} {stats['p99']:8.3f} {changes[1]:+7.0f}%{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1,5,10,20,40", help="comma-separated row counts")
+    parser.add_argument("--alerts", default="0,1,10", help="comma-separated alert counts")
+    parser.add_argument("--frames", type=int, default=200, help="frames per scenario")
+    parser.add_argument("--size", default="1920x1080", help="screen size, WIDTHxHEIGHT")
+    parser.add_argument("--backend", default="software", help="comma-separated canvases to draw on: software, texture")
+    parser.add_argument("--output", help="where to save the results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=20, help="p50 slowdown, in percent, reported as a regression")
+    args = parser.parse_args()
+
+    size = tuple(int(x) for x in args.size.split("x"))
+    results = {}
+    for backend in args.backend.split(","):
+        bench = Bench(size, backend)
+        if bench.screen.name != backend:
+            print(f"Skipping the {backend} backend, which isn't available here")
+            pygame.quit()
+            continue
+        # Software results keep their plain names, so they compare with older runs
+        prefix = "" if backend == "software" else f"{backend} "
+        for row_count in (int(x) for x in args.rows.split(",")):
+            for alert_count in (int(x) for x in args.alerts.split(",")):
+                results[f"{prefix}rows={row_count} alerts={alert_count}"] = bench.run(row_count, alert_count, args.frames)
+        pygame.quit()
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit + ("-dirty" if dirty else ""),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "size": args.size,
+        "backends": args.backend,
+        "frames": args.frames,
+        "results": results,
+    }
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nSaved to {os.path.relpath(output)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
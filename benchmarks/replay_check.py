@@ -0,0 +1,273 @@
+"""
+Checks that replaying a recording (components/replay.py) is deterministic, and that the
+replay's poll schedule and backoff run on its VirtualClock rather than wall time.
+
+    python benchmarks/replay_check.py [--write-recording]
+
+benchmarks/fixtures/recording.jsonl.gz is two hours of simulated board traffic, recorded
+through the same RecordingClient and RecordingSession the board uses, from 04:30 to 06:30:
+no service until the first trips of the morning, a OneBusAway outage (HTTP 503) from 05:40 to
+05:45, a new alert at 05:45, and rate limiting (HTTP 429 with Retry-After) from 06:10 to
+06:12. --write-recording regenerates it. The recording is then replayed three times:
+
+- twice as it is, which must print exactly the same refreshes, alerts and errors
+- once with time.time() stuck at the epoch, which must print the same again, since nothing
+  in a replay should read the wall clock
+
+and the requests each replay makes, at virtual times, must follow the board's schedule: one
+lookahead call overnight and then quiet until shortly before the first trip, backoff during
+the outage, Retry-After honoured after a 429, and regular polls again afterwards. Exits with status 1
+if any of that doesn't hold.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import types
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import httpx
+import onebusaway
+import pytz
+from onebusaway.types.arrival_and_departure_list_response import ArrivalAndDepartureListResponse
+from components.alerts_feed import DEFAULT_ALERTS_URL, AlertsFeed
+from components.poll_scheduler import PollScheduler
+from components.replay import NoRateLimit, Recording, RecordingClient, RecordingSession, TrafficRecorder, VirtualClock, replay
+from components.transit_data import TransitData, query_key
+
+RECORDING = os.path.join(REPO_ROOT, "benchmarks", "fixtures", "recording.jsonl.gz")
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+
+def local_timestamp(hour, minute=0):
+    return TIME_ZONE.localize(datetime(2025, 10, 8, hour, minute)).timestamp()
+
+START, END = local_timestamp(4, 30), local_timestamp(6, 30)
+OUTAGE_START, OUTAGE_END = local_timestamp(5, 40), local_timestamp(5, 45)
+RATE_LIMIT_START, RATE_LIMIT_END = local_timestamp(6, 10), local_timestamp(6, 12)
+RETRY_AFTER = 90
+RECOVERED = local_timestamp(6, 15) # Polling is back to normal by then
+NEW_ALERT = local_timestamp(5, 45)
+# Stop -> (route, headsign, first trip, headway in minutes)
+STOPS = {
+    "40_99610": ("1 Line", "Angle Lake", local_timestamp(5, 15), 10),
+    "1_11060": ("9", "Rainier Beach", local_timestamp(5, 30), 15),
+}
+QUERIES = [(stop, None) for stop in STOPS]
+
+class StubArrivals:
+    """Stands in for the SDK's arrival_and_departure resource while recording."""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        now = self.clock()
+        request = httpx.Request("GET", f"https://api.pugetsound.onebusaway.org/api/where/arrivals-and-departures-for-stop/{stop_id}.json")
+        if OUTAGE_START <= now < OUTAGE_END:
+            raise onebusaway.InternalServerError("Service unavailable", response=httpx.Response(503, request=request), body=None)
+        if RATE_LIMIT_START <= now < RATE_LIMIT_END:
+            response = httpx.Response(429, headers={"retry-after": str(RETRY_AFTER)}, request=request)
+            raise onebusaway.RateLimitError("Rate limit exceeded", response=response, body=None)
+        route, headsign, first, headway = STOPS[stop_id]
+        arrivals = []
+        trip = first
+        while trip <= now + minutes_after * 60:
+            # Runs 0-3 minutes late, the same for every poll of a trip
+            predicted = trip + int(trip) // 60 * 7 % 4 * 60
+            if predicted >= now:
+                arrivals.append({
+                    "routeShortName": route, "tripHeadsign": headsign, "tripId": f"{stop_id}_{int(trip)}",
+                    "scheduledArrivalTime": int(trip * 1000), "predictedArrivalTime": int(predicted * 1000),
+                    "predicted": True, "status": "default",
+                })
+            trip += headway * 60
+        return ArrivalAndDepartureListResponse.construct(data={"entry": {"arrivalsAndDepartures": arrivals}})
+
+class StubResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.headers = {"Content-Type": "application/json"}
+        self.content = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        yield self.content
+
+class StubAlertsSession:
+    """Stands in for the alerts feed's requests.Session while recording. Ignores conditional headers."""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        alerts = ["Beacon Hill Station elevator out of service"]
+        if self.clock() >= NEW_ALERT:
+            alerts.append("1 Line: Trains every 15 minutes between SODO and Capitol Hill due to a signal problem")
+        body = json.dumps({"entity": [{"id": str(i), "alert": {
+            "severity_level": "SEVERE", "active_period": [{"start": 0}],
+            "header_text": {"translation": [{"language": "en", "text": text}]},
+        }} for i, text in enumerate(alerts)]}).encode()
+        return StubResponse(body)
+
+    def close(self):
+        pass
+
+def write_recording(path):
+    """Polls like the board does, on a VirtualClock, through the recording wrappers."""
+    if os.path.exists(path):
+        os.remove(path)
+    clock = VirtualClock(START, speed=0)
+    recorder = TrafficRecorder(path, clock=clock.time)
+    client = RecordingClient(types.SimpleNamespace(arrival_and_departure=StubArrivals(clock.time)), recorder)
+    transit_data = TransitData(client, TIME_ZONE, NoRateLimit(), clock=clock.time, max_workers=1)
+    for stop, stop_filter in QUERIES:
+        transit_data.add_query(query_key(stop, stop_filter), stop, stop_filter)
+    alerts_feed = AlertsFeed(DEFAULT_ALERTS_URL, session=RecordingSession(StubAlertsSession(clock.time), recorder), clock=clock.time)
+    next_alerts = START
+    stdout, sys.stdout = sys.stdout, io.StringIO() # The outage's errors
+    try:
+        while clock.time() < END:
+            now = clock.time()
+            transit_data.fetch(transit_data.poll_scheduler.due(now))
+            if now >= next_alerts:
+                alerts_feed.fetch_alerts(["SEVERE"])
+                next_alerts = now + 60
+            clock.advance_to(min(next_alerts, transit_data.poll_scheduler.next_due()))
+    finally:
+        sys.stdout = stdout
+    transit_data.shutdown()
+    alerts_feed.close()
+    recorder.close()
+
+class LoggedRecording(Recording):
+    """
+    A Recording that also notes every request looked up: the request, the virtual time it was
+    made at, and the HTTP status of the error it was answered with (None if it succeeded).
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.requests = []
+
+    def lookup(self, request, now):
+        entry = super().lookup(request, now)
+        status = entry.get("status") if entry is not None and "error" in entry else None
+        self.requests.append((request, now, status))
+        return entry
+
+def run_replay(timeout=60):
+    """
+    Replays the fixture. Returns everything it printed, the requests it made and its stats, or
+    None if it didn't finish within `timeout` seconds, as a replay polling on the wall clock
+    wouldn't: its stops would be due again before the virtual clock ever moved on.
+    """
+    recording = LoggedRecording(RECORDING)
+    lines = []
+    result = {}
+    def run():
+        result["stats"] = replay(recording, QUERIES, TIME_ZONE, out=lines.append)
+    stdout, sys.stdout = sys.stdout, io.StringIO() # TransitData prints the outage's errors
+    try:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        printed = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    if "stats" not in result:
+        return None
+    return lines + printed.splitlines(), list(recording.requests), result["stats"]
+
+def check_schedule(requests):
+    """Checks the replay's requests against the board's poll schedule, in virtual time."""
+    failures = []
+    scheduler = PollScheduler()
+    rate_limited = 0
+    for stop, (route, headsign, first, headway) in STOPS.items():
+        polls = [(request[2], now, status) for request, now, status in requests if request[0] == "oba" and request[1] == stop]
+        # Overnight: the lookahead call, then nothing until lead_seconds before the first trip
+        if len(polls) < 3 or [minutes for minutes, _, _ in polls[:2]] != [35, 420]:
+            failures.append(f"{stop}: expected a 35 minute call then the 420 minute lookahead first, got {polls[:2]}")
+        elif polls[2][1] < first - scheduler.lead_seconds - 60:
+            failures.append(f"{stop}: polled at {polls[2][1] - START:.0f} s in, before the first trip was near")
+
+        # Backoff after each failed request, at least Retry-After long after a 429
+        for (_, a, status), (_, b, _) in zip(polls, polls[1:]):
+            if status is None:
+                continue
+            least = RETRY_AFTER if status == 429 else scheduler.backoff_base
+            rate_limited += status == 429
+            if b - a < least:
+                failures.append(f"{stop}: retried {b - a:.0f} s after an HTTP {status} at {a - START:.0f} s in, expected at least {least} s")
+
+        after = [now for minutes, now, _ in polls if now >= RECOVERED]
+        after_gaps = [b - a for a, b in zip(after, after[1:])]
+        if not after_gaps or max(after_gaps) > scheduler.base_interval + 1:
+            failures.append(f"{stop}: polls didn't go back to every {scheduler.base_interval} s or less after the rate limiting")
+    if not rate_limited:
+        failures.append("no request was answered with a recorded 429, so Retry-After wasn't checked")
+    return failures
+
+def main(args):
+    if args.write_recording:
+        write_recording(RECORDING)
+        print(f"Wrote {RECORDING}")
+
+    started = time.perf_counter()
+    first_run = run_replay()
+    replay_seconds = time.perf_counter() - started
+    if first_run is None:
+        print("FAILED: the replay didn't finish")
+        return 1
+    first, requests, stats = first_run
+    second_run = run_replay()
+    # Nothing should read the wall clock: stop it, and the replay must not notice
+    wall_time = time.time
+    time.time = lambda: 0.0
+    try:
+        frozen_run = run_replay()
+    finally:
+        time.time = wall_time
+
+    failures = []
+    if not any("alerts:" in line for line in first) or not any("error" in line for line in first):
+        failures.append("the replay printed no alerts or no outage errors, so the recording isn't being used")
+    for label, run in (("second replay", second_run), ("replay with the wall clock stopped", frozen_run)):
+        if run is None:
+            failures.append(f"{label} didn't finish")
+            continue
+        lines, run_requests, _ = run
+        if lines != first or run_requests != requests:
+            differing = next((i for i, (a, b) in enumerate(zip(first, lines)) if a != b), min(len(first), len(lines)))
+            failures.append(f"{label} differs from the first, from line {differing}")
+    failures += check_schedule(requests)
+
+    span = END - START
+    print(f"Replayed {span / 3600:.1f} h ({stats['polls']} stop refreshes, {stats['alert_fetches']} alert fetches, "
+          f"{len(first)} lines) in {replay_seconds:.2f} s, {span / replay_seconds:.0f}x real time")
+    oba = [status for request, now, status in requests if request[0] == "oba"]
+    print(f"OneBusAway requests: {len(oba)}, answered with a 503: {oba.count(503)}, with a 429: {oba.count(429)}")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: replays were identical, with or without the wall clock, and followed the virtual clock's poll schedule")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--write-recording", action="store_true", help=f"regenerate {os.path.relpath(RECORDING, REPO_ROOT)}")
+    sys.exit(main(parser.parse_args()))
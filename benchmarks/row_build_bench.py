@@ -0,0 +1,151 @@
+"""
+Micro-benchmark of building arrival rows, before and after precomputed ArrivalRecords.
+
+    python benchmarks/row_build_bench.py [--rows 120] [--frames 200]
+
+"before" is the per-frame row code as it was when parse_query returned raw dicts: two or
+three datetime.now(TIME_ZONE) calls per arrival, the lateness thresholds worked out again,
+and strftime for arrivals over an hour out. "after" is BoardRenderer.build_row on the
+ArrivalRecords parse_query builds now, with one timestamp per frame. Both build the same
+synthetic rows from the same OneBusAway-shaped arrivals (4 per row, a mix of early, late,
+scheduled-only and far-off trips), and the output of both is checked to match.
+"""
+import argparse
+import os
+import sys
+import time
+import types
+from collections import defaultdict
+from datetime import datetime
+from math import floor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import pytz
+from components.arrival_record import ArrivalRecord
+from components.board_renderer import GREEN, LIGHT_GREY, LIGHT_YELLOW, RED, WHITE, BoardRenderer
+from components.stop_registry import load_stop_registry
+
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+ROUTES = [("1 Line", "Angle Lake"), ("8", "Seattle Center"), ("43", "Downtown"), ("Streetcar", "Pioneer Square")]
+DELAYS = [0, -120, 120, 360, 0, 60] # Seconds late, so every color comes up
+
+def synthetic_arrivals(rows, now):
+    """OneBusAway-shaped arrivals, 4 per row."""
+    arrivals = []
+    for i in range(rows):
+        route, headsign = ROUTES[i % len(ROUTES)]
+        for j in range(4):
+            # 20 s past a whole minute from `now`, so a second either way can't change a countdown
+            scheduled = now + 80 + j * 420 + (i % 30) * 60
+            if i % 9 == 8:
+                scheduled += 3 * 3600 # Far off, shown as a clock time
+            arrivals.append(types.SimpleNamespace(
+                route_short_name=route, trip_headsign=f"{headsign} {i}", status="default", trip_id=f"trip_{i}_{j}",
+                scheduled_arrival_time=scheduled * 1000, predicted_arrival_time=(scheduled + DELAYS[(i + j) % len(DELAYS)]) * 1000,
+                predicted=(i + j) % 7 != 0,
+            ))
+    return arrivals
+
+def group(arrivals, make_entry):
+    rows = defaultdict(list)
+    for arr_dep in arrivals:
+        rows[(arr_dep.route_short_name, arr_dep.trip_headsign)].append(make_entry(arr_dep))
+    return list(rows.items())
+
+def old_entry(arr_dep):
+    """What parse_query used to keep for each arrival."""
+    return {
+        "predicted_arrival_time": arr_dep.predicted_arrival_time,
+        "scheduled_arrival_time": arr_dep.scheduled_arrival_time,
+        "predicted": arr_dep.predicted,
+        "status": arr_dep.status,
+        "trip": arr_dep.trip_id,
+    }
+
+def old_build_row(arrival):
+    """The countdown part of the old main loop, minus the drawing."""
+    text_color = WHITE
+    colored_arr = []
+    arrival_times = arrival[1][:4]
+    num_schedules = len(arrival_times)
+    for j, schedule in enumerate(arrival_times):
+        if schedule.get('predicted', False):
+            now = round(datetime.now(TIME_ZONE).timestamp())
+            time_until = (schedule['predicted_arrival_time']/1000 - round(datetime.now(TIME_ZONE).timestamp()))
+            time_diff = (schedule['predicted_arrival_time']/1000 - schedule['scheduled_arrival_time']/1000)
+            if time_diff >= 300:
+                text_color = RED
+            elif time_diff >= 90:
+                text_color = LIGHT_YELLOW
+            elif time_diff <= -60:
+                text_color = GREEN
+            else:
+                text_color = WHITE
+        else:
+            time_until = (schedule['scheduled_arrival_time']/1000 - round(datetime.now(TIME_ZONE).timestamp()))
+            text_color = LIGHT_GREY
+        minutes_until = floor(time_until / 60)
+        if minutes_until > 60:
+            minutes_str = datetime.fromtimestamp(schedule["scheduled_arrival_time"]/1000, TIME_ZONE).strftime("%H:%M")
+            text_color = WHITE
+        elif minutes_until < 1:
+            minutes_str = "Now"
+        else:
+            minutes_str = f"{minutes_until}"
+        colored_arr.append((minutes_str, text_color))
+        if j < num_schedules - 1:
+            colored_arr.append((", ", WHITE))
+    if num_schedules > 0 and colored_arr[-1][0] != "Now" and ":" not in colored_arr[-1][0]:
+        colored_arr.append((" min", WHITE))
+    return tuple(colored_arr)
+
+def timed(frame, frames):
+    started = time.perf_counter()
+    for _ in range(frames):
+        frame()
+    return (time.perf_counter() - started) / frames
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=120)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    pygame.display.init()
+    pygame.font.init()
+    renderer = BoardRenderer(pygame.Surface((1920, 1080)), "Benchmark Station", "America/Los_Angeles",
+                             route_styles=load_stop_registry().route_styles)
+    now = int(time.time())
+    arrivals = synthetic_arrivals(args.rows, now)
+    old_rows = group(arrivals, old_entry)
+    new_rows = group(arrivals, lambda arr_dep: ArrivalRecord.from_oba(arr_dep, TIME_ZONE))
+
+    for old_row, new_row in zip(old_rows, new_rows):
+        if old_build_row(old_row) != renderer.build_row(new_row, now)[3]:
+            sys.exit(f"The rows differ for {old_row[0]}: {old_build_row(old_row)} vs {renderer.build_row(new_row, now)[3]}")
+
+    def before():
+        for row in old_rows:
+            old_build_row(row)
+
+    def after():
+        frame_now = time.time() # The one timestamp per frame
+        for row in new_rows:
+            renderer.build_row(row, frame_now)
+
+    before_s = timed(before, args.frames)
+    after_s = timed(after, args.frames)
+    print(f"{args.rows} rows, {args.frames} frames each")
+    print(f"{'':>8} {'per frame ms':>13} {'per row us':>11}")
+    for label, seconds in (("before", before_s), ("after", after_s)):
+        print(f"{label:>8} {seconds * 1000:>13.3f} {seconds / args.rows * 1e6:>11.2f}")
+    print(f"{before_s / after_s:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
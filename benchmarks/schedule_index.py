@@ -0,0 +1,238 @@
+"""
+Checks the GTFS schedule index (components/gtfs_schedule.py) against a small fixture, then
+times its lookups on a synthetic, agency-sized schedule.
+
+    python benchmarks/schedule_index.py [--stops 400] [--lookups 2000] [--write-zip]
+
+benchmarks/fixtures/gtfs.zip is built from the text files in benchmarks/fixtures/gtfs/ (run with
+--write-zip after editing them). It has a weekday, Saturday and Sunday service from October to
+December 2025, and the cases it's checked against cover:
+
+- a weekday trip at 24:30:00, which runs after midnight on the next calendar day, and must
+  still be found from that day's 00:10
+- rolling over from one service day to the next overnight, including from Friday's weekday
+  service into Saturday's
+- calendar_dates: Thanksgiving (Thursday 2025-11-27) drops the weekday service and runs the
+  Sunday one, and a one-off game day service exists only in calendar_dates
+- the end of the calendar, the night DST ends, and a stop time without a time
+- filters by route, by headsign (i.e. direction) and by a stop_headsign override
+
+It also checks that the per-thread connections go away with their threads, and that only the
+last few service days are cached. Then it builds an index of --stops stops, each served
+every few minutes all day on three services, and times next_departures() with and without
+a filter (for a route at the stop, a headsign, and a route that never stops there). Exits with
+status 1 if any case gives the wrong departures, or if a lookup's median takes longer than
+--max-us microseconds (except for the route that never stops there, which is only shown).
+"""
+import argparse
+import gc
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import pytz
+from components.gtfs_schedule import SERVICE_DATE_CACHE_SIZE, ScheduleIndex, build_index
+
+FIXTURES = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+GTFS_DIR = os.path.join(FIXTURES, "gtfs")
+GTFS_ZIP = os.path.join(FIXTURES, "gtfs.zip")
+TIME_ZONE_STR = "America/Los_Angeles"
+TIME_ZONE = pytz.timezone(TIME_ZONE_STR)
+
+# (what's checked, local time, stop, filter, limit, expected [(trip, local time)])
+CASES = [
+    ("late weekday trip, the evening before", "2025-10-08 23:00", "1_99610", None, 3,
+     [("1_wk_late_south", "2025-10-09 00:30"), ("1_wk_early_south", "2025-10-09 05:00"), ("1_wk_early_north", "2025-10-09 05:10")]),
+    ("yesterday's 24:30 trip after midnight", "2025-10-09 00:10", "1_99610", None, 2,
+     [("1_wk_late_south", "2025-10-09 00:30"), ("1_wk_early_south", "2025-10-09 05:00")]),
+    ("Friday night into Saturday's services", "2025-10-10 23:00", "1_99610", None, 3,
+     [("1_wk_late_south", "2025-10-11 00:30"), ("1_sat_south", "2025-10-11 06:00"), ("1_gameday_577", "2025-10-11 10:00")]),
+    ("service only in calendar_dates", "2025-10-11 07:00", "1_99610", None, 4,
+     [("1_gameday_577", "2025-10-11 10:00"), ("1_sun_south", "2025-10-12 08:00")]),
+    ("one-off service not repeated", "2025-10-18 07:00", "1_99610", None, 4,
+     [("1_sun_south", "2025-10-19 08:00")]),
+    ("Thanksgiving: weekday service swapped for Sunday's", "2025-11-26 23:00", "1_99610", None, 3,
+     [("1_wk_late_south", "2025-11-27 00:30"), ("1_sun_south", "2025-11-27 08:00")]), # Friday is past the horizon
+    ("Thanksgiving night: no 24:30 trip from a removed service", "2025-11-27 23:00", "1_99610", None, 1,
+     [("1_wk_early_south", "2025-11-28 05:00")]),
+    ("the night DST ends", "2025-11-02 00:30", "1_99610", None, 1,
+     [("1_sun_south", "2025-11-02 08:00")]),
+    ("end of the calendar", "2025-12-31 23:00", "1_99610", None, 4,
+     [("1_wk_late_south", "2026-01-01 00:30")]),
+    ("route filter", "2025-10-08 06:00", "1_99610", ["49"], 2,
+     [("1_wk_49", "2025-10-08 07:15"), ("1_wk_49", "2025-10-09 07:15")]),
+    ("headsign (direction) filter", "2025-10-08 04:00", "1_99610", ["Lynnwood City Center"], 1,
+     [("1_wk_early_north", "2025-10-08 05:10")]),
+    ("stop_headsign overrides the trip's", "2025-10-08 06:00", "1_11060", ["Capitol Hill"], 1,
+     [("1_wk_49", "2025-10-08 07:20")]),
+    ("stop time without a time is skipped", "2025-10-11 07:00", "1_11060", ["577"], 4, []),
+]
+
+def local_timestamp(local_time):
+    return TIME_ZONE.localize(datetime.strptime(local_time, "%Y-%m-%d %H:%M")).timestamp()
+
+def local_time(ms):
+    return datetime.fromtimestamp(ms / 1000, TIME_ZONE).strftime("%Y-%m-%d %H:%M")
+
+def write_zip(zip_path, files):
+    """Writes {name: bytes} with fixed timestamps, so the same files give the same zip."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name in sorted(files):
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2025, 10, 1, 0, 0, 0)), files[name])
+
+def fixture_files():
+    files = {}
+    for name in os.listdir(GTFS_DIR):
+        with open(os.path.join(GTFS_DIR, name), "rb") as f:
+            files[name] = f.read()
+    return files
+
+def check_fixture(tmp_dir):
+    failures = []
+    with zipfile.ZipFile(GTFS_ZIP) as archive:
+        if {name: archive.read(name) for name in archive.namelist()} != fixture_files():
+            failures.append(f"{GTFS_ZIP} doesn't match {GTFS_DIR}, run with --write-zip")
+
+    db_path = os.path.join(tmp_dir, "fixture.sqlite")
+    build_index(db_path, [("1", GTFS_ZIP)])
+    index = ScheduleIndex(db_path, TIME_ZONE_STR)
+    wrong = 0
+    for label, now, stop_id, filter, limit, expected in CASES:
+        departures = index.next_departures(stop_id, local_timestamp(now), limit=limit, filter=filter)
+        got = [(departure.trip_id, local_time(departure.scheduled_arrival_time)) for departure in departures]
+        if got != expected:
+            wrong += 1
+            failures.append(f"{label}: expected {expected}, got {got}")
+
+    # Stuck workers get replaced, so threads come and go for as long as the board runs. They
+    # overlap, like a stuck worker and its replacement, so none reuses another's thread ID
+    release = threading.Event()
+    def lookup():
+        index.next_departures("1_99610", local_timestamp("2025-10-08 12:00"))
+        release.wait()
+    threads = [threading.Thread(target=lookup) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+    connections = sum(isinstance(obj, sqlite3.Connection) for obj in gc.get_objects())
+    if connections > 2:
+        failures.append(f"{connections} SQLite connections open after 20 threads came and went")
+    for day in range(60):
+        index.next_departures("1_99610", local_timestamp("2025-10-01 12:00") + day * 86400)
+    if len(index.services_by_date) > SERVICE_DATE_CACHE_SIZE:
+        failures.append(f"{len(index.services_by_date)} service days cached after 60 days")
+    index.close()
+
+    # Only the stops asked for are imported
+    db_path = os.path.join(tmp_dir, "one_stop.sqlite")
+    build_index(db_path, [("1", GTFS_ZIP)], stop_ids={"1_99610"})
+    index = ScheduleIndex(db_path, TIME_ZONE_STR)
+    if index.next_departures("1_11060", local_timestamp("2025-10-08 06:00")):
+        failures.append("a stop left out with stop_ids was imported anyway")
+    index.close()
+    return failures, wrong
+
+def synthetic_zip(zip_path, stops):
+    """
+    Routes of 40 stops, each stop on two of them, with a trip every 6-15 minutes from 5 am to
+    1 am on three services. Returns the number of stop times, and the routes at each stop.
+    """
+    rng = random.Random(0)
+    routes_at = {f"1_s{i}": [] for i in range(stops)}
+    routes = ["route_id,route_short_name,route_long_name,route_type"]
+    trips = ["route_id,service_id,trip_id,trip_headsign,direction_id"]
+    stop_times = ["trip_id,arrival_time,departure_time,stop_id,stop_sequence,stop_headsign"]
+    for route in range(max(1, stops // 20)):
+        routes.append(f"r{route},{route},Route {route},3")
+        route_stops = [f"s{(route * 20 + i) % stops}" for i in range(40)]
+        for stop_id in route_stops:
+            routes_at[f"1_{stop_id}"].append(str(route))
+        for service, headway in (("WKDY", rng.randint(6, 10)), ("SAT", rng.randint(10, 15)), ("SUN", rng.randint(10, 15))):
+            for direction, headsign in enumerate(("Downtown", "Uptown")):
+                ordered = route_stops if direction == 0 else route_stops[::-1]
+                for start in range(5 * 60, 25 * 60, headway):
+                    trip_id = f"{route}_{service}_{direction}_{start}"
+                    trips.append(f"r{route},{service},{trip_id},{headsign},{direction}")
+                    for sequence, stop_id in enumerate(ordered):
+                        minutes = start + sequence * 2
+                        stop_times.append(f"{trip_id},{minutes // 60:02d}:{minutes % 60:02d}:00,{minutes // 60:02d}:{minutes % 60:02d}:00,{stop_id},{sequence},")
+    calendar = ["service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date",
+                "WKDY,1,1,1,1,1,0,0,20250101,20261231", "SAT,0,0,0,0,0,1,0,20250101,20261231", "SUN,0,0,0,0,0,0,1,20250101,20261231"]
+    write_zip(zip_path, {name: "\n".join(lines).encode() + b"\n" for name, lines in (
+        ("routes.txt", routes), ("trips.txt", trips), ("stop_times.txt", stop_times), ("calendar.txt", calendar),
+    )})
+    return len(stop_times) - 1, routes_at
+
+def time_lookups(index, stops, lookups, filter_for):
+    rng = random.Random(1)
+    start = local_timestamp("2025-10-06 00:00")
+    # Warm up the service day cache, as a running board has it
+    index.next_departures("1_s0", start + 12 * 3600)
+    times = []
+    for _ in range(lookups):
+        stop_id = f"1_s{rng.randrange(stops)}"
+        now = start + rng.randrange(86400)
+        filter = filter_for(stop_id, rng)
+        started = time.perf_counter()
+        index.next_departures(stop_id, now, limit=4, filter=filter)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), sorted(times)[int(len(times) * 0.99)]
+
+def main(args):
+    if args.write_zip:
+        write_zip(GTFS_ZIP, fixture_files())
+        print(f"Wrote {GTFS_ZIP}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        failures, wrong = check_fixture(tmp_dir)
+        print(f"Fixture: {len(CASES) - wrong} of {len(CASES)} cases right\n")
+
+        zip_path = os.path.join(tmp_dir, "synthetic.zip")
+        db_path = os.path.join(tmp_dir, "synthetic.sqlite")
+        stop_times, routes_at = synthetic_zip(zip_path, args.stops)
+        started = time.perf_counter()
+        build_index(db_path, [("1", zip_path)])
+        build_seconds = time.perf_counter() - started
+        print(f"{args.stops} stops, {stop_times} stop times: built in {build_seconds:.1f} s, {os.path.getsize(db_path) / 1e6:.1f} MB")
+
+        index = ScheduleIndex(db_path, TIME_ZONE_STR)
+        print(f"{'lookup':>16} {'median us':>10} {'p99 us':>8}")
+        lookups = [
+            ("next 4", lambda stop_id, rng: None, True),
+            ("one route", lambda stop_id, rng: [rng.choice(routes_at[stop_id])], True),
+            ("one headsign", lambda stop_id, rng: ["Uptown"], True),
+            # Nothing matches, so the stop's whole day is scanned. Only shown, it's the worst case
+            ("route not here", lambda stop_id, rng: ["no such route"], False),
+        ]
+        for label, filter_for, bounded in lookups:
+            median, p99 = time_lookups(index, args.stops, args.lookups, filter_for)
+            print(f"{label:>16} {median * 1e6:>10.0f} {p99 * 1e6:>8.0f}")
+            if bounded and median * 1e6 > args.max_us:
+                failures.append(f"{label}: median lookup took {median * 1e6:.0f} us, more than {args.max_us:g} us")
+        index.close()
+
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        return 1
+    print("PASSED: the fixture's departures were right, and lookups were fast")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, default=400, help="stops in the synthetic schedule")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--max-us", type=float, default=1000, help="slowest acceptable median lookup, in microseconds")
+    parser.add_argument("--write-zip", action="store_true", help=f"regenerate {os.path.relpath(GTFS_ZIP, REPO_ROOT)} from the text files")
+    sys.exit(main(parser.parse_args()))
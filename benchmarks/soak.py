@@ -0,0 +1,262 @@
+"""
+Soak test of the board's refresh and render path: runs several days of refreshes on a virtual
+clock and checks that the thread count and Python memory stay flat.
+
+    python benchmarks/soak.py [--days 3] [--stops 5] [--error-rate 0.01]
+
+The same pieces as main.py are wired together without its event loop: TransitData and
+AlertsFeed refreshing on the refresh WorkerPool through FetchSupervisors, publishing to a
+BoardState, and a BoardRenderer drawing each new snapshot under SDL's dummy video driver.
+Upstream answers are synthetic: every trip has a new ID, some predictions run late, service
+stops overnight, the alerts change every hour and a fraction of requests fail.
+
+Time only moves between refreshes and frames, so days take minutes. Memory is traced with
+tracemalloc from the start, and compared against the end of the first (warm-up) day. Exits
+with status 1 if more threads ran than the pools account for, or memory grew by more than
+--max-growth-kb.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT) # Fonts and icons are loaded from relative paths
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import pytz
+import requests
+from components.alerts_feed import AlertsFeed
+from components.board_renderer import AlertAnimation, BoardRenderer
+from components.board_state import BoardState
+from components.fetch_supervisor import FetchSupervisor
+from components.replay import NoRateLimit, VirtualClock
+from components.stop_registry import load_stop_registry
+from components.text_cache import text_cache
+from components.transit_data import TransitData
+from components.worker_pool import WorkerPool
+
+START = 1_760_000_000
+TIME_ZONE = pytz.timezone("America/Los_Angeles")
+SERVICE_ALERTS_REFRESH_RATE = 60
+ANIMATION_STEP = 0.25 # Virtual time between frames while the alert is animating
+SAMPLE_EVERY = 3600
+ROUTES = [("1 Line", "Angle Lake"), ("1 Line", "Lynnwood City Center"), ("8", "Seattle Center"),
+          ("43", "Downtown Seattle"), ("49", "University District"), ("Streetcar", "Pioneer Square")]
+
+class SyntheticArrivals:
+    """Stands in for the SDK's arrival_and_departure resource, with trips every few minutes."""
+
+    def __init__(self, clock, error_rate):
+        self.clock = clock
+        self.error_rate = error_rate
+        self.random = random.Random(0)
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        if self.random.random() < self.error_rate:
+            raise requests.exceptions.ConnectionError("Synthetic outage")
+        now = self.clock()
+        index = int(stop_id.rpartition("_")[2])
+        routes = [ROUTES[index % len(ROUTES)], ROUTES[(index + 1) % len(ROUTES)]]
+        headway = 6 + index % 5
+        arrivals = []
+        # Trips leave every `headway` minutes, numbered from the epoch so IDs never repeat
+        first_trip = int(now // (headway * 60)) + 1
+        for trip in range(first_trip, first_trip + minutes_after // headway):
+            scheduled = trip * headway * 60
+            hour = (scheduled // 3600 - 7) % 24 # Roughly local time
+            if 1 <= hour < 5:
+                continue # No service overnight
+            route, headsign = routes[trip % 2]
+            delay = (trip * 37 % 11 - 2) * 60 if trip % 3 else 0
+            arrivals.append(types.SimpleNamespace(
+                route_short_name=route, trip_headsign=headsign, status="default", trip_id=f"{stop_id}_{trip}",
+                scheduled_arrival_time=scheduled * 1000, predicted_arrival_time=(scheduled + delay) * 1000,
+                predicted=trip % 5 != 0,
+            ))
+        return types.SimpleNamespace(data=types.SimpleNamespace(entry=types.SimpleNamespace(arrivals_and_departures=arrivals)))
+
+class SyntheticResponse:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+class SyntheticSession:
+    """Stands in for the alerts feed's requests.Session. The alerts change every hour."""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        hour = int(self.clock() // 3600)
+        etag = f'"{hour}"'
+        if headers and headers.get("If-None-Match") == etag:
+            return SyntheticResponse(304, {"ETag": etag}, b"")
+        entities = [{"alert": {
+            "severity_level": "SEVERE", "active_period": [{"start": 0}],
+            "header_text": {"translation": [{"language": "en", "text": f"Alert {i} of hour {hour}: trains are delayed" + " near Westlake" * i}]},
+        }} for i in range(hour % 4)]
+        return SyntheticResponse(200, {"ETag": etag}, json.dumps({"entity": entities}).encode())
+
+    def close(self):
+        pass
+
+def main(args):
+    out = sys.stdout # Refresh errors are printed by the code under test; only the report goes here
+    tracemalloc.start()
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((1024, 768))
+
+    clock = VirtualClock(START, speed=0)
+    client = types.SimpleNamespace(arrival_and_departure=SyntheticArrivals(clock.time, args.error_rate))
+    transit_data = TransitData(client, TIME_ZONE, NoRateLimit(), clock=clock.time, max_workers=args.stops)
+    stop_keys = [f"stop_{i}" for i in range(args.stops)]
+    for i, key in enumerate(stop_keys):
+        transit_data.add_query(key, f"1_{i}")
+    alerts_feed = AlertsFeed("synthetic", session=SyntheticSession(clock.time), clock=clock.time)
+
+    board_state = BoardState()
+    refresh_workers = WorkerPool("refresh", workers=2)
+    data_refresh = FetchSupervisor("Transit data", 60, refresh_workers)
+    alerts_refresh = FetchSupervisor("Service alerts", 60, refresh_workers)
+    finished = queue.Queue() # Stands in for DATA_UPDATED_EVENT
+    # Every thread should belong to a pool: this one, the refresh workers, the stop query
+    # workers (started as needed, up to one per stop) and the alerts feed's deadline thread
+    thread_limit = 1 + 2 + args.stops + 1
+
+    def fetch_transit_data(keys):
+        transit_data.fetch(keys)
+        rows = []
+        for key in stop_keys:
+            rows.extend(transit_data.arrivals.get(key, {}).items())
+        board_state.publish_rows(rows)
+        finished.put("rows")
+
+    def fetch_service_alerts():
+        alerts_data = []
+        try:
+            alerts_data = alerts_feed.fetch_alerts(["SEVERE"])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"An error occurred while fetching service alerts: {e}")
+        board_state.publish_alerts(alerts_data)
+        finished.put("alerts")
+
+    renderer = BoardRenderer(screen, "Soak Station", "America/Los_Angeles", clock=clock.time, route_styles=load_stop_registry().route_styles)
+    animation = AlertAnimation()
+    end = START + args.days * 86400
+    warmed_up_at = START + 86400
+    next_alerts = START
+    next_sample = START
+    samples = []
+    baseline = None
+    frames = 0
+    started = time.perf_counter()
+
+    print(f"{'day':>5} {'threads':>7} {'workers':>7} {'traced KB':>9} {'peak KB':>8} {'version':>8} {'frames':>7}", file=out)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Runs up to and including `end`, so the last sample is at the same time of day as the baseline
+        while clock.time() <= end:
+            now = clock.time()
+            # What the main loop does each time it wakes up: start any due refreshes, wait for them
+            # (time stands still meanwhile), then draw the current snapshot
+            pending = 0
+            due = transit_data.poll_scheduler.due(now)
+            if due and not data_refresh.busy():
+                data_refresh.start(fetch_transit_data, due)
+                pending += 1
+            if now >= next_alerts and not alerts_refresh.busy():
+                alerts_refresh.start(fetch_service_alerts)
+                pending += 1
+                next_alerts = now + SERVICE_ALERTS_REFRESH_RATE
+            for _ in range(pending):
+                finished.get()
+
+            snapshot = board_state.current
+            alert_view = animation.update(snapshot.alert_text(), now) if snapshot.alerts else None
+            row_change = renderer.draw(snapshot.rows, alert_view, now, version=snapshot.version)
+            frames += 1
+
+            if now >= next_sample:
+                current, peak = tracemalloc.get_traced_memory()
+                sample = (now, threading.active_count(), refresh_workers.size(), current, peak, snapshot.version, frames)
+                samples.append(sample)
+                if baseline is None and now >= warmed_up_at:
+                    baseline = (sample, tracemalloc.take_snapshot())
+                if (now - START) % (6 * 3600) < SAMPLE_EVERY:
+                    print(f"{(now - START) / 86400:5.2f} {sample[1]:7} {sample[2]:7} {current / 1024:9.0f} {peak / 1024:8.0f} {sample[5]:8} {frames:7}", file=out)
+                next_sample += SAMPLE_EVERY
+
+            # Sleep until the next thing that would change the board, like the frame scheduler
+            wake_at = [next_alerts, next_sample, now - now % 60 + 60]
+            next_due = transit_data.poll_scheduler.next_due()
+            if next_due is not None:
+                wake_at.append(next_due)
+            if row_change is not None:
+                wake_at.append(row_change)
+            if alert_view:
+                alert_change = animation.next_change()
+                wake_at.append(now + ANIMATION_STEP if alert_change is None else alert_change)
+            clock.advance_to(max(now + 0.001, min(wake_at)))
+
+    end_sample = samples[-1]
+    end_snapshot = tracemalloc.take_snapshot()
+    refresh_workers.close()
+    transit_data.shutdown()
+    pygame.quit()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nSimulated {args.days} days ({frames} frames, {end_sample[5]} snapshots) in {elapsed:.0f} s. {text_cache.stats()}", file=out)
+    failures = []
+    if baseline is None:
+        failures.append("the run was too short to get past the warm-up day")
+    else:
+        base_sample, base_snapshot = baseline
+        growth = (end_sample[3] - base_sample[3]) / 1024
+        most_threads = max(sample[1] for sample in samples)
+        print(f"Threads: at most {most_threads} (limit {thread_limit}). After warm-up, traced memory went from "
+              f"{base_sample[3] / 1024:.0f} KB to {end_sample[3] / 1024:.0f} KB ({growth:+.0f} KB)", file=out)
+        if most_threads > thread_limit:
+            failures.append(f"{most_threads} threads were running, more than the {thread_limit} expected")
+        if growth > args.max_growth_kb:
+            failures.append(f"traced memory grew by {growth:.0f} KB")
+            print("Largest growth by line:", file=out)
+            for stat in end_snapshot.compare_to(base_snapshot, "lineno")[:10]:
+                print(f"  {stat}", file=out)
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures), file=out)
+        return 1
+    print("PASSED: thread count and memory stayed flat", file=out)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=3, help="virtual days to run (the first is warm-up)")
+    parser.add_argument("--stops", type=int, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.01, help="fraction of OneBusAway requests that fail")
+    parser.add_argument("--max-growth-kb", type=float, default=256, help="allowed growth of traced memory after warm-up")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,159 @@
+"""
+Startup benchmark: how long main.py takes to put its first frame on screen, and which imports
+that time goes to.
+
+    python benchmarks/startup_bench.py [--runs 5] [--warm]
+
+Runs the real main.py in a scratch directory (with its own .env, and the repo's assets linked
+in) under SDL's dummy video driver, and reads the startup lines it prints. Every request is
+sent through a proxy on a closed local port, so nothing reaches OneBusAway or the alerts feed.
+
+- Time to first frame is measured over --runs plain runs, both from process start (including
+  the interpreter's own startup) and as main.py reports it.
+- One more run under `python -X importtime` splits the imports into those before the first
+  frame and those deferred until after it, listing the slowest of each.
+
+--warm first writes a snapshot, so the first frame shows arrivals instead of "Loading Data...".
+"""
+import argparse
+import os
+import queue
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+FIRST_FRAME = re.compile(r"First frame drawn (\d+) ms after startup")
+STARTED_FETCHING = re.compile(r"Started fetching (\d+) ms after startup")
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def write_warm_snapshot(path):
+    from components.arrival_record import ON_TIME, ArrivalRecord
+    from components.snapshot import save_snapshot
+    from components.stop_registry import load_stop_registry
+    now = time.time()
+    arrivals = {}
+    for i, (stop, name, stop_filter) in enumerate(load_stop_registry(os.path.join(REPO_ROOT, "stops.json")).queries):
+        records = [ArrivalRecord(now + 120 + j * 300, now + 120 + j * 300, True, ON_TIME, "12:00", "default", f"trip_{i}_{j}") for j in range(4)]
+        arrivals[name] = {(str(i + 1), f"Benchmark Destination {i}"): records}
+    save_snapshot(path, arrivals, ["Benchmark alert"])
+
+def make_workdir():
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    os.symlink(os.path.join(REPO_ROOT, "assets"), os.path.join(workdir, "assets"))
+    snapshot_path = os.path.join(workdir, "snapshot.json")
+    with open(os.path.join(workdir, ".env"), "w") as f:
+        f.write('API_KEY=startup-benchmark\nREGION="America/Los_Angeles"\nSTATION_NAME="Benchmark Station"\n')
+        f.write(f'SNAPSHOT_PATH="{snapshot_path}"\n')
+        f.write(f'STOPS_FILE="{os.path.join(REPO_ROOT, "stops.json")}"\n')
+    return workdir, snapshot_path
+
+def run_board(workdir, importtime=False, settle=2.0, timeout=30):
+    """
+    Starts main.py and reads its output until `settle` seconds after it started fetching, so
+    imports made in the background by the first refresh are seen too. Returns (seconds from
+    launch to the first-frame line, first frame ms as reported, output lines in order).
+    """
+    proxy = f"http://127.0.0.1:{closed_port()}"
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1",
+               HTTP_PROXY=proxy, HTTPS_PROXY=proxy, ALL_PROXY=proxy, NO_PROXY="")
+    command = [sys.executable, "-u"] + (["-X", "importtime"] if importtime else []) + [os.path.join(REPO_ROOT, "main.py")]
+    launched = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = queue.Queue()
+
+    def read():
+        for line in process.stdout:
+            lines.put((time.perf_counter(), line.rstrip("\n")))
+        lines.put((time.perf_counter(), None))
+    threading.Thread(target=read, daemon=True).start()
+
+    output = []
+    first_frame_at = reported = None
+    stop_at = launched + timeout
+    try:
+        while time.perf_counter() < stop_at:
+            try:
+                when, line = lines.get(timeout=max(0, stop_at - time.perf_counter()))
+            except queue.Empty:
+                break
+            if line is None:
+                break
+            output.append(line)
+            match = FIRST_FRAME.search(line)
+            if match:
+                first_frame_at = when - launched
+                reported = int(match.group(1))
+            if STARTED_FETCHING.search(line):
+                stop_at = min(stop_at, when + settle)
+    finally:
+        process.kill()
+        process.wait()
+    if first_frame_at is None:
+        raise RuntimeError("main.py never drew its first frame:\n" + "\n".join(output[-20:]))
+    return first_frame_at, reported, output
+
+def split_imports(output):
+    """Returns the top-level imports before and after the first frame, as {module: cumulative ms}."""
+    before, after = {}, {}
+    current = before
+    for line in output:
+        if FIRST_FRAME.search(line):
+            current = after
+            continue
+        match = IMPORT_LINE.match(line)
+        if match and not match.group(3): # Nested imports are indented
+            current[match.group(4)] = int(match.group(2)) / 1000
+    return before, after
+
+def print_imports(title, imports, top):
+    print(f"{title}: {len(imports)} top-level imports, {sum(imports.values()):.0f} ms")
+    for name, ms in sorted(imports.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {ms:7.1f} ms  {name}")
+
+def main(args):
+    workdir, snapshot_path = make_workdir()
+    try:
+        launch_times, reported_times = [], []
+        for _ in range(args.runs):
+            if args.warm:
+                # A run can save over it (e.g. with the alerts it failed to fetch)
+                write_warm_snapshot(snapshot_path)
+            first_frame_at, reported, _ = run_board(workdir, settle=0)
+            launch_times.append(first_frame_at * 1000)
+            reported_times.append(reported)
+        if args.warm:
+            write_warm_snapshot(snapshot_path)
+        _, _, output = run_board(workdir, importtime=True, settle=args.settle)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    kind = "warm" if args.warm else "cold"
+    print(f"Time to first frame ({kind} start, median of {args.runs} runs):")
+    print(f"  {statistics.median(launch_times):6.0f} ms from launching python (min {min(launch_times):.0f}, max {max(launch_times):.0f})")
+    print(f"  {statistics.median(reported_times):6.0f} ms as reported by main.py, from its first line")
+    before, after = split_imports(output)
+    print("\nImports (from one run under -X importtime, which adds some overhead of its own):")
+    print_imports("Before the first frame", before, args.top)
+    print_imports("Deferred until after it", after, args.top)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="start from a snapshot")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    parser.add_argument("--settle", type=float, default=2, help="seconds to keep watching for background imports")
+    sys.exit(main(parser.parse_args()))
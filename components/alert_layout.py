@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from components.display_functions import fit_text, wrap_text
+import pygame
+
+class AlertLayoutCache:
+    """
+    Caches the wrapped lines of an alert, keyed by (alert text, max width, single line), and the rendered
+    surface of each line, keyed by the line's text. The icon grows during the expand/collapse
+    animation, so the text is wrapped to a slightly different width every frame, but the same
+    handful of lines keeps coming back. After the first cycle an animation frame is just blits.
+
+    Lines are rendered once and passed through `to_image` (a canvas's image(), see
+    components/canvas.py), so with the texture backend they are kept as textures.
+    """
+
+    def __init__(self, font, color, to_image=None, max_layouts=128, max_lines=64):
+        self.font = font
+        self.color = color
+        self.to_image = to_image or (lambda surface: surface.convert_alpha())
+        self.max_layouts = max_layouts
+        self.max_lines = max_lines
+        self.layouts = OrderedDict() # (text, max width, single line) -> wrapped lines
+        self.line_surfaces = OrderedDict() # line text -> rendered image
+
+    def _line_surface(self, line):
+        surface = self.line_surfaces.get(line)
+        if surface is not None:
+            self.line_surfaces.move_to_end(line)
+            return surface
+        surface = self.to_image(self.font.render(line, True, self.color))
+        self.line_surfaces[line] = surface
+        if len(self.line_surfaces) > self.max_lines:
+            self.line_surfaces.popitem(last=False)
+        return surface
+
+    def get(self, text, max_width, single_line=False):
+        """
+        Returns (wrapped lines, line images) for `text` wrapped to `max_width` pixels. With
+        single_line (the ticker), it is cut to one line ending in "..." instead.
+        """
+        key = (text, max_width, single_line)
+        lines = self.layouts.get(key)
+        if lines is not None:
+            self.layouts.move_to_end(key)
+        else:
+            lines = [fit_text(text, self.font, max_width)] if single_line else wrap_text(text, self.font, max_width)
+            self.layouts[key] = lines
+            if len(self.layouts) > self.max_layouts:
+                self.layouts.popitem(last=False)
+        return lines, [self._line_surface(line) for line in lines]
+
+class IconFrames:
+    """
+    Pre-scaled copies of an icon for every size the alert transition passes through, so
+    animation frames never call smoothscale. Sizes are snapped down to `step` pixels to keep
+    memory down (a 200px RGBA icon is 160KB per frame).
+    """
+
+    def __init__(self, icon, min_size, max_size, step=4):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.step = step
+        self.frames = {}
+        sizes = list(range(min_size, max_size, step)) + [max_size]
+        for size in sizes:
+            try:
+                self.frames[size] = pygame.transform.smoothscale(icon, (size, size))
+            except ValueError:
+                # smoothscale only supports 24/32-bit surfaces
+                self.frames[size] = pygame.transform.scale(icon, (size, size))
+
+    def get(self, size):
+        """Returns the largest pre-scaled frame that is no bigger than `size`."""
+        size = max(self.min_size, min(self.max_size, int(size)))
+        if size in self.frames:
+            return self.frames[size]
+        # Snap down, so the icon never spills outside a bar of height `size`
+        return self.frames[self.min_size + (size - self.min_size) // self.step * self.step]
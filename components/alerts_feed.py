@@ -0,0 +1,267 @@
+from components.fetch_supervisor import CircuitBreaker, FetchTimeout
+from components.json_stream import iter_array_items
+from components.worker_pool import Deadlines
+import hashlib
+import requests
+import tempfile
+import threading
+import time
+import urllib3
+
+# Optional: decoding the binary GTFS-realtime feed needs `pip install gtfs-realtime-bindings`
+try:
+    from google.transit import gtfs_realtime_pb2
+except ImportError:
+    gtfs_realtime_pb2 = None
+
+# Allow for 24hr notice
+ALERT_NOTICE_SECONDS = 60*60*24
+DEFAULT_ALERTS_URL = "https://s3.amazonaws.com/st-service-alerts-prod/alerts_pb.json"
+
+def _is_active(periods, now):
+    """Checks (start, end) active periods, where either may be None if not given."""
+    for start, end in periods:
+        if start is None:
+            continue
+        elif start < (now + ALERT_NOTICE_SECONDS):
+            if end is None or end > now:
+                return True
+    return False
+
+def parse_alert_entity(entity, alert_thresholds, now):
+    """
+    Returns the English header text of a JSON feed entity, or None if the alert is below the
+    severity thresholds or not active (or about to be, within a day) at time `now`.
+    """
+    alert = entity.get("alert")
+    if not alert or alert.get("severity_level") not in alert_thresholds:
+        return None
+    # Only show active alerts
+    periods = [(period.get("start"), period.get("end")) for period in alert.get("active_period", [])]
+    if not _is_active(periods, now):
+        return None
+    for translation in alert.get("header_text", {}).get("translation", []):
+        if translation["language"] == "en":
+            return translation["text"]
+    return None
+
+def parse_alert_pb(entity, alert_thresholds, now):
+    """Same as parse_alert_entity, for a protobuf FeedEntity."""
+    if not entity.HasField("alert"):
+        return None
+    alert = entity.alert
+    # An unset severity reads as UNKNOWN_SEVERITY, but the JSON feed just leaves it out
+    if not alert.HasField("severity_level"):
+        return None
+    if gtfs_realtime_pb2.Alert.SeverityLevel.Name(alert.severity_level) not in alert_thresholds:
+        return None
+    periods = [
+        (period.start if period.HasField("start") else None, period.end if period.HasField("end") else None)
+        for period in alert.active_period
+    ]
+    if not _is_active(periods, now):
+        return None
+    for translation in alert.header_text.translation:
+        if translation.language == "en":
+            return translation.text
+    return None
+
+def _abort(response, expired):
+    """
+    Marks a download as past its deadline, so the thread reading it stops, and closes the
+    response. A read already waiting on the socket is still bounded by the read timeout.
+    """
+    expired.set()
+    try:
+        response.close()
+    except (AttributeError, OSError):
+        pass # Already closed, or not a real connection (e.g. a replay)
+
+class AlertsFeed:
+    """
+    Fetches the service alerts feed over a persistent, keep-alive requests.Session and
+    revalidates with ETag / If-Modified-Since. The body is hashed as it is downloaded, into a
+    spool that moves to a temporary file past SPOOL_SIZE, and only parsed if the hash changed.
+    It is then parsed one entity at a time, keeping only the header text of alerts that pass
+    the filter, so memory stays bounded however large the feed gets during a major disruption.
+
+    With feed_format="protobuf", the binary GTFS-realtime FeedMessage is decoded instead.
+    It is a smaller download and faster to decode, and goes through the same filter.
+
+    fetch_alerts() returns None when the feed hasn't changed (a 304, or a 200 whose body
+    hashes the same as last time), so callers can skip updating their alerts.
+
+    Requests have (connect, read) `timeout`s, and the whole download is cut off after
+    `deadline` seconds. After a run of failures the circuit breaker fails fetches fast until
+    the feed is back (see components/fetch_supervisor.py).
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    SPOOL_SIZE = 1024 * 1024 # Bodies bigger than this are spooled to disk until they're parsed
+    FORMATS = ("json", "protobuf")
+
+    def __init__(self, url, session=None, feed_format="json", clock=time.time, timeout=(5, 10), deadline=30):
+        if feed_format not in self.FORMATS:
+            raise ValueError(f"Unknown alerts feed format {feed_format!r}, expected one of {self.FORMATS}")
+        if feed_format == "protobuf" and gtfs_realtime_pb2 is None:
+            raise ImportError("The protobuf alerts feed needs `pip install gtfs-realtime-bindings`")
+        self.url = url
+        self.feed_format = feed_format
+        self.session = session if session is not None else requests.Session()
+        self.clock = clock # Decides which alerts are active; replays pass a virtual clock
+        self.timeout = timeout
+        self.deadline = deadline
+        self.breaker = CircuitBreaker("Alerts feed", clock=clock)
+        self.deadlines = Deadlines("alerts-deadline")
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+
+        # Counters, handy for checking how much revalidation saves
+        self.requests_made = 0
+        self.not_modified_count = 0
+        self.bytes_transferred = 0
+        self.parse_count = 0
+
+    def _conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def fetch_alerts(self, alert_thresholds):
+        """
+        Returns the header texts of active alerts at or above `alert_thresholds`, or None if the
+        feed is unchanged since the last fetch.
+        Raises requests.exceptions.RequestException, or ValueError (including
+        json.JSONDecodeError) if the feed can't be decoded.
+        """
+        self.breaker.check()
+        try:
+            alerts_data = self._fetch(alert_thresholds)
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return alerts_data
+
+    def _fetch(self, alert_thresholds):
+        with self.session.get(self.url, headers=self._conditional_headers(), stream=True, timeout=self.timeout) as response:
+            self.requests_made += 1
+            # The read timeout only bounds each socket read, so a server trickling out the body
+            # could hold this thread forever. Stop reading at the deadline instead
+            expired = threading.Event()
+            timer = self.deadlines.call_at(time.monotonic() + self.deadline, _abort, response, expired)
+            try:
+                return self._read(response, alert_thresholds, expired)
+            except Exception as e:
+                if expired.is_set():
+                    raise FetchTimeout(f"Alerts feed took longer than {self.deadline} s") from e
+                raise
+            finally:
+                self.deadlines.cancel(timer)
+
+    def _read(self, response, alert_thresholds, expired):
+        if response.status_code == 304:
+            self.not_modified_count += 1
+            return None
+
+        # Check if the request was successful (status code 200-299)
+        response.raise_for_status()
+
+        # Some servers ignore conditional headers, so also compare the body itself. It's hashed
+        # before anything is parsed, so an unchanged feed costs only the download
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE) as body:
+            for chunk in self._chunks(response, expired):
+                self.bytes_transferred += len(chunk)
+                digest.update(chunk)
+                body.write(chunk)
+            if expired.is_set():
+                # Cut off at the deadline, which can look like the end of the body
+                raise FetchTimeout(f"Alerts feed took longer than {self.deadline} s")
+            content_hash = digest.digest()
+            if content_hash == self.content_hash:
+                self.not_modified_count += 1
+                return None
+
+            body.seek(0)
+            now = self.clock()
+            if self.feed_format == "protobuf":
+                alerts_data = self._parse_protobuf(body.read(), alert_thresholds, now)
+            else:
+                alerts_data = self._parse_json(iter(lambda: body.read(self.CHUNK_SIZE), b""), alert_thresholds, now)
+            self.parse_count += 1
+
+        # Only remember validators once the body parsed, so a bad response gets retried in full
+        self.content_hash = content_hash
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        return alerts_data
+
+    def _chunks(self, response, expired):
+        """
+        The body's (decoded) chunks, stopping once `expired` is set. Each read returns as soon as
+        anything arrives, rather than waiting to fill a whole chunk, so a server trickling out the
+        body is noticed within a read timeout of the deadline.
+        """
+        read1 = getattr(getattr(response, "raw", None), "read1", None)
+        if read1 is None:
+            # urllib3 before 2.3, or a stand-in response (e.g. a replay)
+            yield from response.iter_content(chunk_size=self.CHUNK_SIZE)
+            return
+        while not expired.is_set():
+            # Same errors as iter_content raises
+            try:
+                chunk = read1(self.CHUNK_SIZE, decode_content=True)
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e)
+            except urllib3.exceptions.DecodeError as e:
+                raise requests.exceptions.ContentDecodingError(e)
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.exceptions.ConnectionError(e)
+            except urllib3.exceptions.SSLError as e:
+                raise requests.exceptions.SSLError(e)
+            if not chunk:
+                return
+            yield chunk
+
+    def _parse_json(self, chunks, alert_thresholds, now):
+        # Filter each entity as soon as it is decoded, so only the kept texts accumulate
+        alerts_data = []
+        for entity in iter_array_items(chunks, "entity"):
+            text = parse_alert_entity(entity, alert_thresholds, now)
+            if text is not None:
+                alerts_data.append(text)
+        return alerts_data
+
+    def _parse_protobuf(self, body, alert_thresholds, now):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        try:
+            feed.ParseFromString(body)
+        except Exception as e:
+            # DecodeError isn't a ValueError, and callers shouldn't need protobuf installed to catch it
+            raise ValueError(f"Failed to decode protobuf alerts feed: {e}") from e
+        alerts_data = []
+        for entity in feed.entity:
+            text = parse_alert_pb(entity, alert_thresholds, now)
+            if text is not None:
+                alerts_data.append(text)
+        return alerts_data
+
+    def close(self):
+        self.session.close()
+
+def open_alerts_feed(feed_format="json", pb_url=None, json_url=DEFAULT_ALERTS_URL, session=None, clock=time.time):
+    """Sets up the configured alerts feed, falling back to the JSON feed if protobuf isn't available."""
+    try:
+        if feed_format == "protobuf":
+            if not pb_url:
+                raise ValueError("ALERTS_PB_URL is not set")
+            return AlertsFeed(pb_url, session=session, feed_format="protobuf", clock=clock)
+        return AlertsFeed(json_url, session=session, clock=clock)
+    except (ImportError, ValueError) as e:
+        print(f"Could not set up {feed_format} alerts feed, falling back to JSON: {e}")
+        return AlertsFeed(json_url, session=session, clock=clock)
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+# Lateness classes, worked out once when the data is fetched instead of every frame
+ON_TIME = 0
+EARLY = 1 # >=1min early
+LATE = 2 # >=1.5min late
+VERY_LATE = 3 # >=5min late
+SCHEDULED = 4 # No real-time data, only the schedule
+
+class ArrivalRecord:
+    """
+    Compact, precomputed view of one OneBusAway arrival. Everything that doesn't depend on
+    the current time is worked out once in parse_query, so drawing a row only needs the
+    current timestamp and a subtraction.
+    """
+    __slots__ = ("arrival_epoch", "scheduled_epoch", "predicted", "lateness", "scheduled_str", "status", "trip")
+
+    def __init__(self, arrival_epoch, scheduled_epoch, predicted, lateness, scheduled_str, status, trip):
+        self.arrival_epoch = arrival_epoch # Seconds since epoch, predicted if available
+        self.scheduled_epoch = scheduled_epoch
+        self.predicted = predicted
+        self.lateness = lateness
+        self.scheduled_str = scheduled_str # Scheduled time as HH:MM, for arrivals over an hour out
+        self.status = status
+        self.trip = trip
+
+    @classmethod
+    def from_oba(cls, arr_dep, time_zone):
+        """Builds a record from an entry of an arrival_and_departure.list response."""
+        scheduled_epoch = arr_dep.scheduled_arrival_time / 1000
+        scheduled_str = datetime.fromtimestamp(scheduled_epoch, time_zone).strftime("%H:%M")
+        if arr_dep.predicted:
+            arrival_epoch = arr_dep.predicted_arrival_time / 1000
+            time_diff = arrival_epoch - scheduled_epoch
+            if time_diff >= 300:
+                lateness = VERY_LATE
+            elif time_diff >= 90:
+                lateness = LATE
+            elif time_diff <= -60:
+                lateness = EARLY
+            else:
+                lateness = ON_TIME
+        else:
+            arrival_epoch = scheduled_epoch
+            lateness = SCHEDULED
+        return cls(arrival_epoch, scheduled_epoch, bool(arr_dep.predicted), lateness, scheduled_str, arr_dep.status, arr_dep.trip_id)
+
+    def to_list(self):
+        """Compact form for snapshots, in __slots__ order."""
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def __repr__(self):
+        return f"ArrivalRecord(trip={self.trip!r}, arrival_epoch={self.arrival_epoch}, lateness={self.lateness})"
@@ -0,0 +1,164 @@
+"""
+Small asyncio HTTP server that shares the fetcher's data with browsers, e.g. hallway tablets
+and kiosks. No web framework, just enough HTTP/1.1 for these GET endpoints:
+
+    GET /arrivals   {"version": 12, "stops": {key: rows, ...}}
+    GET /alerts     {"version": 12, "alerts": ["...", ...]}
+    GET /events     Server-Sent Events: one "snapshot" event with everything, then an
+                    "arrivals" event ({"key", "version", "rows"}) whenever a stop changes,
+                    "removed" ({"key"}) when a stop is no longer polled, and "alerts"
+                    ({"version", "alerts"}) when the alerts change
+
+`key` is query_key(stop, filter) and rows are the compact lists from encode_rows:
+[route, headsign, [[arrival_epoch, scheduled_epoch, predicted, lateness, scheduled_str, status, trip], ...]].
+Each event is serialized once and the same bytes are written to every client, and the full
+payloads are only rebuilt after something changes.
+"""
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+# A client that stops reading is dropped once this much is queued for it
+MAX_CLIENT_BUFFER = 256 * 1024
+KEEPALIVE_SECONDS = 15
+_KEEPALIVE = b": keepalive\n\n"
+
+def _json(value):
+    return json.dumps(value, separators=(",", ":"))
+
+def _sse_event(event, data, event_id):
+    return f"event: {event}\nid: {event_id}\ndata: {data}\n\n".encode()
+
+class ArrivalsAPI:
+    """
+    Serves the arrivals and alerts published to it by a FetchDaemon (it implements the
+    daemon's listener methods) on `host`:`port`.
+    """
+
+    def __init__(self, host="0.0.0.0", port=8080, max_clients=2000):
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.version = 0 # Goes up on every change, used for ETags and event IDs
+        self.arrivals: dict[str, str] = {} # Serialized rows per key
+        self.arrival_versions: dict[str, int] = {}
+        self.alerts_json = _json({"version": 0, "alerts": []})
+        self.arrivals_body = None # Cached /arrivals payload, rebuilt on demand after a change
+        self.clients: set[asyncio.StreamWriter] = set()
+        self.server = None
+        self.keepalive_task = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, limit=16 * 1024)
+        print(f"Arrivals API listening on http://{self.host}:{self.port}/")
+        self.keepalive_task = asyncio.get_running_loop().create_task(self._keepalive())
+
+    # --- Listener methods, called by FetchDaemon on the event loop ---
+
+    def on_arrivals(self, key, version, rows_json):
+        self.version += 1
+        self.arrivals[key] = rows_json
+        self.arrival_versions[key] = version
+        self.arrivals_body = None
+        data = f'{{"key":{_json(key)},"version":{version},"rows":{rows_json}}}'
+        self._broadcast(_sse_event("arrivals", data, self.version))
+
+    def on_removed(self, key):
+        if self.arrivals.pop(key, None) is None:
+            return
+        self.arrival_versions.pop(key, None)
+        self.version += 1
+        self.arrivals_body = None
+        self._broadcast(_sse_event("removed", _json({"key": key}), self.version))
+
+    def on_alerts(self, version, alerts):
+        self.version += 1
+        self.alerts_json = _json({"version": version, "alerts": alerts})
+        self._broadcast(_sse_event("alerts", self.alerts_json, self.version))
+
+    # --- Serving ---
+
+    def _arrivals_json(self):
+        if self.arrivals_body is None:
+            # Rows are already serialized, so this is just string joins
+            stops = ",".join(f"{_json(key)}:{rows}" for key, rows in self.arrivals.items())
+            self.arrivals_body = f'{{"version":{self.version},"stops":{{{stops}}}}}'
+        return self.arrivals_body
+
+    def _send(self, writer, data):
+        if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            # Too slow to keep up, it'll get a fresh snapshot when it reconnects
+            self.clients.discard(writer)
+            writer.close()
+            return
+        writer.write(data)
+
+    def _broadcast(self, data):
+        for writer in list(self.clients):
+            self._send(writer, data)
+
+    async def _keepalive(self):
+        # Stops proxies and browsers from timing out quiet event streams
+        while True:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            self._broadcast(_KEEPALIVE)
+
+    async def _handle_client(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            path = urlsplit(target).path
+
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", "text/plain", "Only GET is supported")
+            elif path == "/events":
+                await self._stream_events(reader, writer)
+            elif path in ("/arrivals", "/alerts"):
+                etag = f'"{self.version}"'
+                if headers.get("if-none-match") == etag:
+                    await self._respond(writer, "304 Not Modified", None, "", etag)
+                else:
+                    body = self._arrivals_json() if path == "/arrivals" else self.alerts_json
+                    await self._respond(writer, "200 OK", "application/json", body, etag)
+            else:
+                await self._respond(writer, "404 Not Found", "text/plain", "Not found")
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body, etag=None):
+        body = body.encode()
+        head = [f"HTTP/1.1 {status}", f"Content-Length: {len(body)}", "Connection: close", "Access-Control-Allow-Origin: *"]
+        if content_type:
+            head.append(f"Content-Type: {content_type}")
+        if etag:
+            head.append(f"ETag: {etag}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def _stream_events(self, reader, writer):
+        if len(self.clients) >= self.max_clients:
+            await self._respond(writer, "503 Service Unavailable", "text/plain", "Too many clients")
+            return
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\nAccess-Control-Allow-Origin: *\r\n\r\n"
+        )
+        snapshot = f'{{"arrivals":{self._arrivals_json()},"alerts":{self.alerts_json}}}'
+        writer.write(_sse_event("snapshot", snapshot, self.version))
+        # Added before the first await, so no update can go out between the snapshot and joining
+        self.clients.add(writer)
+        await writer.drain()
+        # Clients don't send anything on an event stream, so this returns when they disconnect.
+        # Anything they do send is thrown away a chunk at a time
+        while await reader.read(4096):
+            pass
@@ -0,0 +1,531 @@
+from components import arrival_record
+from components.alert_layout import AlertLayoutCache
+from components.canvas import SurfaceCanvas
+from components.clock_display import ClockDisplay
+from components.dirty_regions import RegionTracker
+from components.display_functions import fit_text, draw_multi_colored_text
+from components.metrics import NULL_TIMER
+from components.stop_registry import RouteStyles
+from math import ceil, floor
+import pygame
+import time
+
+# Colors
+WHITE = (255, 255, 255)
+BLACK = (23, 29, 34)
+LIGHT_GREY = (128, 128, 128)
+ALERT_GREY = (67, 65, 66)
+ALERT_YELLOW = (255, 179, 34)
+LIGHT_YELLOW = (255, 255, 0)
+GREEN = (0, 255, 100)
+RED = (255, 0, 0)
+
+# Countdown color for each lateness class worked out in parse_query
+LATENESS_COLORS = {
+    arrival_record.ON_TIME: WHITE,
+    arrival_record.EARLY: GREEN,
+    arrival_record.LATE: LIGHT_YELLOW,
+    arrival_record.VERY_LATE: RED,
+    arrival_record.SCHEDULED: LIGHT_GREY, # Real-time data is not available for this arrival
+}
+
+# Component settings
+BAR_HEIGHT = 60
+ICON_SIZE = 200
+ROUTE_CIRCLE_RADIUS = 45 # Increase this size for prominence
+PAGE_SECONDS = 10 # How long each page of rows is shown, when they don't all fit
+
+# Fonts and icons
+FONT_PATH = 'assets/fonts/Roboto/static/Roboto_Condensed-Bold.ttf'
+CLOCK_FONT = 'assets/fonts/Roboto/static/Roboto_Condensed-ExtraLight.ttf'
+WARNING_ICON_PATH = 'assets/icons/alert-octagon.png'
+
+# Alert display configuration (ticker + periodic full display)
+ALERT_TICKER_HEIGHT = 48
+ALERT_FULL_DISPLAY_SECONDS = 12
+ALERT_CYCLE_SECONDS = 90
+ALERT_TRANSITION_DURATION = 0.8  # seconds for expand/collapse animation
+
+# Debug overlay (DEBUG_OVERLAY in .env)
+DEBUG_FONT_SIZE = 22
+DEBUG_BACKGROUND = (0, 0, 0)
+DEBUG_PADDING = 8
+
+def _lerp(a, b, t):
+    return a + (b - a) * t
+
+def _fade_alpha(t):
+    # alpha: fade out (0-25%), hold hidden (25-75%), fade in (75-100%)
+    if t < 0.25:
+        return _lerp(255, 0, t / 0.25)
+    elif t < 0.75:
+        return 0
+    return _lerp(0, 255, (t - 0.75) / 0.25)
+
+def next_row_change(arrival, now):
+    """Returns the timestamp at which one of the row's minute countdowns next ticks over."""
+    next_change = None
+    for record in arrival[1][:4]:
+        # Countdowns are floor((arrival - now) / 60), so they change every 60s relative to the arrival
+        change = now + ((record.arrival_epoch - now) % 60 or 60)
+        if next_change is None or change < next_change:
+            next_change = change
+    return next_change
+
+class AlertAnimation:
+    """
+    The alert ticker/expand/full/collapse state machine. Every `cycle_seconds` the ticker
+    grows into the full alert box, stays for `full_seconds` and shrinks back. With
+    animate=False (e.g. on e-paper) it jumps straight between the two, and with
+    cycle_seconds=0 it stays a ticker.
+    """
+
+    def __init__(self, animate=True, cycle_seconds=ALERT_CYCLE_SECONDS, full_seconds=ALERT_FULL_DISPLAY_SECONDS):
+        self.animate = animate
+        self.cycle_seconds = cycle_seconds
+        self.full_seconds = full_seconds
+        self.state = "ticker"  # one of: 'ticker', 'animating', 'full'
+        self.transition_start = 0
+        self.transition_direction = None  # 'expand' or 'collapse'
+        self.full_end_time = 0
+        self.show_full_until = 0
+        self.last_cycle = 0
+
+    def update(self, alert_text, now):
+        """
+        Advances the animation to `now` and returns the arguments for draw_alert_overlay as
+        (alert text, bar height, icon size, text alpha).
+        """
+        # Trigger a full alert cycle periodically (starts expand animation)
+        if self.cycle_seconds and now - self.last_cycle > self.cycle_seconds and self.state == 'ticker':
+            self.transition_direction = 'expand'
+            self.transition_start = now
+            self.state = 'animating'
+            self.full_end_time = now + self.full_seconds
+            self.last_cycle = now
+
+        # Handle animation / states
+        if self.state == 'animating':
+            t = (now - self.transition_start) / ALERT_TRANSITION_DURATION if self.animate else 1.0
+            t = max(0.0, min(1.0, t))
+            if self.transition_direction == 'expand':
+                size = _lerp(ALERT_TICKER_HEIGHT, ICON_SIZE, t)
+                if t >= 1.0:
+                    self.state = 'full'
+                    self.show_full_until = self.full_end_time
+            else:  # collapse
+                size = _lerp(ICON_SIZE, ALERT_TICKER_HEIGHT, t)
+                if t >= 1.0:
+                    self.state = 'ticker'
+            # Round so that identical frames produce identical region keys
+            return (alert_text, round(size), round(size), round(_fade_alpha(t)))
+        elif self.state == 'full':
+            # If full display time expired, start collapse animation
+            if now >= self.show_full_until:
+                self.transition_direction = 'collapse'
+                self.transition_start = now
+                self.state = 'animating'
+            return (alert_text, ICON_SIZE, ICON_SIZE, 255)
+
+        # ticker
+        return (alert_text, ALERT_TICKER_HEIGHT, ALERT_TICKER_HEIGHT, 255)
+
+    def next_change(self):
+        """
+        Returns when the alert next needs a frame, None if it is animating (full FPS), or inf if
+        it stays a ticker.
+        """
+        if self.state == 'animating':
+            return None
+        if self.state == 'full':
+            return self.show_full_until
+        if not self.cycle_seconds:
+            return float("inf")
+        return self.last_cycle + self.cycle_seconds
+
+class BoardLayout:
+    """
+    Where the rows go at one screen size: the row slots, how many of them fit on a page above
+    the alert ticker, and the room left for headsigns. Worked out once per resolution (see
+    BoardRenderer.set_screen), so a frame only looks things up, however many rows there are.
+    """
+
+    def __init__(self, size, font_large, page_seconds=PAGE_SECONDS):
+        self.size = size
+        width, height = size
+        self.page_seconds = page_seconds
+
+        # Assuming the large font is the largest element, everything is centered on its height
+        self.font_height = font_large.get_height()
+        self.text_center_offset = self.font_height // 2
+        self.row_spacing = 2*ROUTE_CIRCLE_RADIUS + (ROUTE_CIRCLE_RADIUS*.5) # Total height for the row area
+        self.x_route = ROUTE_CIRCLE_RADIUS + (ROUTE_CIRCLE_RADIUS*.5) # X position for the circle center
+        self.headsign_x = self.x_route + (ROUTE_CIRCLE_RADIUS*1.5) # add a gap after the circle
+        # Headsigns get whatever is left after a typical set of countdowns (plus the right offset and a gap)
+        self.headsign_max_width = width - self.headsign_x - font_large.size("0, 00, 00, 00 min")[0] - 40
+
+        y_offset = BAR_HEIGHT + 10
+        self.rows_per_page = max(1, int((height - y_offset - ALERT_TICKER_HEIGHT) // self.row_spacing))
+        self.row_rects = []
+        for i in range(self.rows_per_page):
+            # Rects are rounded so neighbouring rows never overlap
+            row_top = int(y_offset + (i * self.row_spacing))
+            self.row_rects.append(pygame.Rect(0, row_top, width, int(y_offset + ((i + 1) * self.row_spacing)) - row_top))
+
+    @staticmethod
+    def large_font_size(size):
+        return 84 if size[0] > 1800 else 72
+
+    def page(self, row_count, now):
+        """
+        Returns (page, pages, next flip) for `row_count` rows at `now`. Pages take turns for
+        page_seconds each; next flip is None if everything fits on one.
+        """
+        pages = max(1, ceil(row_count / self.rows_per_page))
+        if pages == 1:
+            return 0, 1, None
+        turn = floor(now / self.page_seconds)
+        return turn % pages, pages, (turn + 1) * self.page_seconds
+
+class BoardRenderer:
+    """
+    Draws the whole board (clock bar, arrival rows and alert overlay) onto `screen`. It holds
+    the fonts, geometry and caches, but no data: each frame gets the rows and alert view to
+    draw, so it can be driven by main.py's loop or by a benchmark without one.
+    `screen` is a canvas (see components/canvas.py), or a Surface to draw on in software.
+    Routes are labelled and colored by `route_styles` (see components/stop_registry.py). Rows
+    that don't fit on the screen are shown a page at a time, for `page_seconds` each.
+    """
+
+    def __init__(self, screen, station_name, time_zone_str, clock=time.time, route_styles=None, page_seconds=PAGE_SECONDS):
+        if isinstance(screen, pygame.Surface):
+            screen = SurfaceCanvas(screen)
+        self.route_styles = route_styles or RouteStyles()
+        self.page_seconds = page_seconds
+        # The large font's size depends on the resolution; sizes already loaded are kept for toggling back
+        self.large_fonts = {}
+        self.large_font_size = None
+        self.layout = None
+        self.font_small = pygame.font.Font(FONT_PATH, 48)
+        self.font_debug = pygame.font.Font(FONT_PATH, DEBUG_FONT_SIZE)
+        # The alert font and icon aren't needed for the first frame, so they're loaded by
+        # load_alert_assets once the board is up, or when the first alert is drawn
+        self.alert_assets_loaded = False
+
+        self.clock_display = ClockDisplay(
+            screen=screen,
+            screen_width=screen.get_width(),
+            screen_height=screen.get_height(),
+            font_path=CLOCK_FONT,
+            time_zone_str=time_zone_str,
+            bar_height=BAR_HEIGHT,
+            station_name=station_name,
+            clock=clock
+        )
+        # Tracks what is on screen so each frame only redraws and pushes the regions that changed
+        self.region_tracker = RegionTracker(screen, BLACK)
+        self.screen = screen
+        self.set_screen(screen)
+
+    def set_screen(self, screen):
+        """Points the renderer at a (possibly resized) canvas and repaints everything."""
+        if screen is not self.screen:
+            # The alert images were made for the old canvas
+            self.alert_assets_loaded = False
+        self.screen = screen
+        self.screen_width = screen.get_width()
+        self.screen_height = screen.get_height()
+        if self.layout is None or self.layout.size != screen.get_size():
+            # Fonts, row slots and paging only change with the resolution
+            font_size = BoardLayout.large_font_size(screen.get_size())
+            if font_size != self.large_font_size:
+                if font_size not in self.large_fonts:
+                    self.large_fonts[font_size] = pygame.font.Font(FONT_PATH, font_size)
+                self.large_font_size = font_size
+                self.font_large = self.large_fonts[font_size]
+            self.layout = BoardLayout(screen.get_size(), self.font_large, self.page_seconds)
+            self.fitted_headsigns: dict[str, str] = {}
+        # Rows laid out for one data version and page, reused until one of them or a countdown changes
+        self.rows_version = None
+        self.rows_page = None
+        self.page_count = 1
+        self.rows_valid_until = 0
+        self.rows = []
+        self.rows_next_change = None
+        self.clock_display.screen = screen
+        self.clock_display.screen_width = self.screen_width
+        self.clock_display.screen_height = self.screen_height
+        self.clock_display.bar_rect = pygame.Rect(0, 0, self.screen_width, BAR_HEIGHT)
+        self.region_tracker.invalidate(screen)
+
+    def load_alert_assets(self):
+        if self.alert_assets_loaded:
+            return
+        self.font_alert = pygame.font.Font(FONT_PATH, 32)
+        try:
+            self.warning_icon = pygame.image.load(WARNING_ICON_PATH)
+            # Scale the icon to fit nicely in the alert bar
+            self.warning_icon = pygame.transform.scale(self.warning_icon, (ICON_SIZE, ICON_SIZE))
+        except pygame.error as e:
+            print(f"Could not load warning icon: {e}")
+            self.warning_icon = None # Handle case where icon loading fails
+        # The icon at every size of the expand/collapse animation, and the wrapped alert text
+        self.warning_icon_frames = self.screen.icon(self.warning_icon, ALERT_TICKER_HEIGHT, ICON_SIZE) if self.warning_icon else None
+        self.alert_layouts = AlertLayoutCache(self.font_alert, ALERT_YELLOW, self.screen.image)
+        self.alert_assets_loaded = True
+
+    def alert_overlay_layout(self, surface_size, alert_text, bar_height, icon_size):
+        """Works out where draw_alert_overlay puts the bar, icon and wrapped text lines.
+        Returns (bar rect, icon size, text x, text top y, line images, bounding rect). The
+        bounding rect includes any text that spills above a short bar.
+        """
+        self.load_alert_assets()
+        SIDE_PADDING = 12
+        surface_width, surface_height = surface_size
+
+        ticker_rect = pygame.Rect(
+            0,
+            surface_height - int(bar_height),
+            surface_width,
+            int(bar_height),
+        )
+
+        # Icon: align to left of the bar and vertically centered
+        icon_h = int(icon_size)
+        text_start_x = ticker_rect.x + SIDE_PADDING
+        if self.warning_icon:
+            text_start_x = ticker_rect.x + SIDE_PADDING + icon_h + 10
+
+        max_text_width = ticker_rect.width - (text_start_x - ticker_rect.x) - SIDE_PADDING
+
+        # The ticker is one line, trimmed to fit, and the box (and anything in between) is wrapped.
+        # Cached, since this runs every animation frame
+        single_line = int(bar_height) <= ALERT_TICKER_HEIGHT
+        wrapped_lines, line_surfaces = self.alert_layouts.get(alert_text, max_text_width, single_line)
+
+        total_text_height = len(wrapped_lines) * self.font_alert.get_linesize()
+        text_top = ticker_rect.centery - (total_text_height // 2)
+        bounds = ticker_rect.union(pygame.Rect(0, text_top, surface_width, total_text_height))
+        return ticker_rect, icon_h, text_start_x, text_top, line_surfaces, bounds
+
+    def draw_alert_overlay(self, surface, alert_text, bar_height, icon_size, text_alpha=255):
+        """Unified alert renderer that draws a bar of `bar_height`, an icon scaled to
+        `icon_size`, and wrapped text rendered with `text_alpha` transparency.
+        """
+        if not alert_text:
+            return
+
+        SIDE_PADDING = 12
+        ticker_rect, icon_h, text_start_x, current_y, line_surfaces, bounds = self.alert_overlay_layout(
+            surface.get_size(), alert_text, bar_height, icon_size
+        )
+
+        surface.fill(ALERT_GREY, ticker_rect)
+
+        if self.warning_icon:
+            # Scaled by the canvas: a pre-scaled frame in software, or by the renderer
+            surface.blit_icon(self.warning_icon_frames, icon_h, midleft=(ticker_rect.x + SIDE_PADDING, ticker_rect.centery))
+
+        # Blit the cached line images with provided alpha
+        for text_surface in line_surfaces:
+            surface.blit(text_surface, (text_start_x, current_y), int(text_alpha))
+            current_y += self.font_alert.get_linesize()
+
+    def build_row(self, arrival, now):
+        """
+        Works out everything drawn in one arrival row at time `now`. The returned tuple doubles as
+        the row's content key for the region tracker, so it must only hold hashable, comparable values.
+        """
+        now = round(now)
+        colored_arr: list[tuple[str, tuple]] = []
+        arrival_times = arrival[1][:4]
+        num_schedules = len(arrival_times) # Get the correct count
+
+        for j, record in enumerate(arrival_times):
+            # Lateness was classified when the data was fetched, so this is just a lookup
+            text_color = LATENESS_COLORS[record.lateness]
+            minutes_until = floor((record.arrival_epoch - now) / 60) # truncate to minute
+            if minutes_until > 60:
+                # If the next arrival isn't for over an hour (such as during night mode), display the actual time instead of minutes_until
+                minutes_str = record.scheduled_str
+                text_color = WHITE
+            elif minutes_until < 1:
+                # Display "Now" if arrival is imminent
+                minutes_str = "Now"
+            else:
+                minutes_str = f"{minutes_until}"
+
+            # Append the minutes string
+            colored_arr.append((minutes_str, text_color))
+
+            # Append a comma and space if it's NOT the last schedule
+            if j < num_schedules - 1:
+                colored_arr.append((", ", WHITE))
+
+        # Append the final " min" suffix ONLY ONCE at the end of all times, if not end of service
+        if num_schedules > 0 and colored_arr[-1][0] != "Now" and ":" not in colored_arr[-1][0]:
+            colored_arr.append((" min", WHITE))
+
+        # Route Number Circle, labelled and colored as configured in the stops file
+        route_number, circle_color = self.route_styles.get(str(arrival[0][0]))
+
+        return (route_number, circle_color, self.fit_headsign(arrival[0][1]), tuple(colored_arr))
+
+    def fit_headsign(self, headsign):
+        """
+        Shortens a headsign that would run into the countdowns, measuring pixel widths rather than
+        counting characters. First try to eliminate extra words. If that is not enough, truncate it.
+        Results are memoized since the same headsigns are drawn every frame.
+        """
+        fitted = self.fitted_headsigns.get(headsign)
+        if fitted is not None:
+            return fitted
+
+        fitted = headsign
+        if self.font_large.size(headsign)[0] > self.layout.headsign_max_width:
+            headsign_words = headsign.split(" ")
+            fitted = " ".join(headsign_words[:2]) + "..."
+            if len(headsign_words) <= 2 or self.font_large.size(fitted)[0] > self.layout.headsign_max_width:
+                fitted = fit_text(headsign, self.font_large, self.layout.headsign_max_width)
+        self.fitted_headsigns[headsign] = fitted
+        return fitted
+
+    def draw_row(self, surface, row, row_center_y):
+        """Draws a row built by build_row, vertically centered on row_center_y."""
+        route_number, circle_color, headsign_text, colored_arr = row
+
+        # Render the route number for placement inside the circle
+        layout = self.layout
+        route_num_surface = surface.text(self.font_large, route_number, WHITE)
+        surface.draw_circle(circle_color, (layout.x_route, row_center_y), ROUTE_CIRCLE_RADIUS)
+
+        # Center the route number text on the circle
+        route_num_rect = route_num_surface.get_rect(center=(layout.x_route, row_center_y))
+        surface.blit(route_num_surface, route_num_rect)
+
+        # Headsign Text
+        headsign_x_pos = layout.headsign_x
+        headsign_surface = surface.text(self.font_large, headsign_text, WHITE) # Use WHITE for headsign
+        surface.blit(
+            headsign_surface,
+            (headsign_x_pos, row_center_y - layout.text_center_offset) # Subtract half height
+        )
+
+        # Minutes_until_arrival Text
+        draw_multi_colored_text(surface, colored_arr, self.screen_width, row_center_y - layout.text_center_offset, 20, self.font_large)
+
+    def debug_overlay_rect(self, lines):
+        line_height = self.font_debug.get_linesize()
+        width = max(self.font_debug.size(line)[0] for line in lines) + 2 * DEBUG_PADDING
+        height = len(lines) * line_height + 2 * DEBUG_PADDING
+        return pygame.Rect(self.screen_width - width, BAR_HEIGHT + 10, width, height)
+
+    def draw_debug_overlay(self, surface, lines, rect):
+        """Draws the metrics summary in a box in the top right corner."""
+        surface.fill(DEBUG_BACKGROUND, rect)
+        y = rect.y + DEBUG_PADDING
+        for line in lines:
+            # Rendered directly, since these lines change all the time and would churn the text cache
+            surface.blit_surface(self.font_debug.render(line, True, WHITE), (rect.x + DEBUG_PADDING, y))
+            y += self.font_debug.get_linesize()
+
+    def layout_rows(self, arrival_data, now, version=None):
+        """
+        Builds the rows of `arrival_data` on the page shown at `now`, each with its slot's rect.
+        Returns (rows, next_change), where next_change is when a countdown on the page next
+        ticks over or the next page is due. With a `version` (a BoardSnapshot's, see
+        components/board_state.py), the rows are only rebuilt when it or the page changes, or
+        when a countdown is about to.
+        """
+        page, pages, next_flip = self.layout.page(len(arrival_data), now)
+        if version is not None and version == self.rows_version and page == self.rows_page and now < self.rows_valid_until:
+            return self.rows, self.rows_next_change
+
+        # Only this page's rows are built, so the cost of a frame doesn't grow with the number of stops
+        per_page = self.layout.rows_per_page
+        rows = []
+        next_change = None
+        for slot, arrival in enumerate(arrival_data[page * per_page:(page + 1) * per_page]):
+            rows.append((f"row_{slot}", self.layout.row_rects[slot], self.build_row(arrival, now)))
+            row_change = next_row_change(arrival, now)
+            if row_change is not None and (next_change is None or row_change < next_change):
+                next_change = row_change
+
+        self.rows_version = version
+        self.rows_page = page
+        self.page_count = pages
+        self.rows = rows
+        # build_row rounds `now`, so a countdown can tick over up to half a second early
+        self.rows_valid_until = next_change - 0.5 if next_change is not None else float("inf")
+        if next_flip is not None and (next_change is None or next_flip < next_change):
+            next_change = next_flip
+        self.rows_next_change = next_change
+        return rows, next_change
+
+    def draw(self, arrival_data, alert_view, now, timer=NULL_TIMER, debug_lines=None, version=None):
+        """
+        Draws one frame: the rows of `arrival_data` (a sequence of ((route, headsign), records))
+        at time `now`, and `alert_view` from AlertAnimation.update (or None for no alert). Only
+        regions whose content changed are redrawn and pushed to the display.
+        `version` identifies the data, so rows are only rebuilt when it changes (see layout_rows).
+        `timer` (see components/metrics.py) is charged for each phase of the frame, and
+        `debug_lines` are shown on top of everything else.
+        Returns the time at which a countdown next ticks over or the next page of rows is due,
+        or None if there are no rows.
+        """
+        screen = self.screen
+        region_tracker = self.region_tracker
+        # Declare every region with a key describing its content; only changed regions get redrawn
+        region_tracker.declare("clock", self.clock_display.get_rect(), self.clock_display.get_time_str())
+        timer.lap("clock")
+
+        rows = []
+        next_change = None
+        if arrival_data:
+            rows, next_change = self.layout_rows(arrival_data, now, version)
+            for name, row_rect, row in rows:
+                region_tracker.declare(name, row_rect, row)
+            if self.page_count > 1:
+                # Which page is showing, in the middle of the clock bar
+                page_text = f"{self.rows_page + 1}/{self.page_count}"
+                page_image = screen.text(self.clock_display.font, page_text, ClockDisplay.TEXT_COLOR)
+                page_rect = page_image.get_rect(center=self.clock_display.bar_rect.center)
+                region_tracker.declare("page", page_rect, page_text)
+        else:
+            # Display a loading/error message if the list is empty
+            loading_text = screen.text(self.font_large, "Loading Data...", WHITE)
+            loading_rect = loading_text.get_rect(topleft=(self.screen_width/2 - loading_text.get_rect().width/2, self.screen_height/2))
+            region_tracker.declare("loading", loading_rect, "Loading Data...")
+        timer.lap("rows")
+
+        if alert_view:
+            alert_bounds = self.alert_overlay_layout(screen.get_size(), *alert_view[:3])[-1]
+            region_tracker.declare("alert", alert_bounds, alert_view)
+        if debug_lines:
+            debug_rect = self.debug_overlay_rect(debug_lines)
+            region_tracker.declare("debug", debug_rect, tuple(debug_lines))
+        timer.lap("alert")
+
+        dirty = region_tracker.resolve()
+        timer.lap("flip")
+        if "clock" in dirty:
+            self.clock_display.draw()
+        if "page" in dirty:
+            screen.blit(page_image, page_rect)
+        timer.lap("clock")
+        if "loading" in dirty:
+            screen.blit(loading_text, loading_rect)
+        for name, row_rect, row in rows:
+            if name in dirty:
+                self.draw_row(screen, row, row_rect.centery)
+        timer.lap("rows")
+        if "alert" in dirty:
+            self.draw_alert_overlay(screen, *alert_view)
+        timer.lap("alert")
+        if "debug" in dirty:
+            self.draw_debug_overlay(screen, debug_lines, debug_rect)
+            timer.lap("debug")
+
+        region_tracker.flush()
+        timer.lap("flip")
+        return next_change
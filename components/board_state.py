@@ -0,0 +1,70 @@
+"""
+What the board shows, handed from the refresh threads to the render loop.
+
+Refreshes publish a new BoardSnapshot instead of changing the current one, and swap it in with
+a single assignment, so the render loop just reads `state.current` once per frame and gets a
+consistent view without taking a lock. Every snapshot has a version, so the renderer can tell
+when the rows have actually changed.
+"""
+import threading
+
+class BoardSnapshot:
+    """
+    One immutable view of the board's data. `rows` is a tuple of ((route, headsign), records)
+    in display order, `alerts` a tuple of alert texts and `alert_index` the one to show.
+    """
+    __slots__ = ("version", "rows", "alerts", "alert_index")
+
+    def __init__(self, version, rows, alerts, alert_index):
+        self.version = version
+        self.rows = rows
+        self.alerts = alerts
+        self.alert_index = alert_index
+
+    def alert_text(self):
+        return self.alerts[self.alert_index] if self.alerts else None
+
+    def __repr__(self):
+        return f"BoardSnapshot(version={self.version}, rows={len(self.rows)}, alerts={len(self.alerts)})"
+
+def freeze_rows(rows):
+    """Turns rows as parsed, a list of (key, records list), into the tuples a snapshot holds."""
+    return tuple((key, tuple(records)) for key, records in rows)
+
+class BoardState:
+    """
+    Holds the current BoardSnapshot. Writers (the refresh threads and the shared fetcher's
+    subscriber) are serialized by a lock; readers just read `current`.
+    """
+
+    def __init__(self):
+        self.current = BoardSnapshot(0, (), (), 0)
+        self.lock = threading.Lock()
+
+    def _swap(self, rows, alerts, alert_index):
+        # Called with the lock held. The assignment is what makes the new data visible
+        snapshot = BoardSnapshot(self.current.version + 1, rows, alerts, alert_index)
+        self.current = snapshot
+        return snapshot
+
+    def publish_rows(self, rows):
+        """Swaps in new rows (a list of (key, records list)). Returns the new snapshot."""
+        with self.lock:
+            current = self.current
+            return self._swap(freeze_rows(rows), current.alerts, current.alert_index)
+
+    def publish_alerts(self, alerts, rotate=True):
+        """
+        Swaps in a new list of alerts and moves on to the next one (or starts from the first
+        without `rotate`). None means they haven't changed, so it only moves on. Returns the
+        new snapshot.
+        """
+        with self.lock:
+            current = self.current
+            # None: nothing to update, just keep rotating through the alerts we already have
+            alerts = current.alerts if alerts is None else tuple(alerts)
+            alert_index = 0
+            if rotate and current.alert_index < len(alerts) - 1:
+                # Carry on from where the old list was, wrapping around the new one
+                alert_index = current.alert_index + 1
+            return self._swap(current.rows, alerts, alert_index)
@@ -0,0 +1,228 @@
+"""
+What the board draws on. BoardRenderer, ClockDisplay and RegionTracker only use this small
+interface, so the same frame can be drawn by either backend:
+
+- SurfaceCanvas (RENDER_BACKEND="software", the default): blits onto the display surface and
+  pushes only the changed rects to the screen.
+- TextureCanvas (RENDER_BACKEND="texture"): pygame._sdl2.video. Text, icons and route circles
+  are uploaded once as textures, and the alert transition is scaled and faded by the renderer
+  instead of on the CPU. The board is drawn into a target texture that is kept between
+  frames, so only changed regions are redrawn, as with the software backend.
+
+open_canvas falls back to SurfaceCanvas if the texture backend can't be set up. Without a GPU
+SDL picks its own software renderer for textures, so both backends run (and can be
+benchmarked against each other) anywhere.
+
+Images from text(), image() and icon() belong to the canvas that made them.
+"""
+import os
+import weakref
+import pygame
+from components.alert_layout import IconFrames
+from components.text_cache import text_cache
+
+try:
+    from pygame._sdl2 import video
+except ImportError:
+    video = None
+
+def _place(rect, position):
+    """Moves `rect` like Surface.get_rect(**position), e.g. center=(x, y)."""
+    for attribute, value in position.items():
+        setattr(rect, attribute, value)
+    return rect
+
+class SurfaceCanvas:
+    """Software drawing onto a pygame Surface, normally the display's."""
+    name = "software"
+
+    def __init__(self, surface):
+        self.surface = surface
+
+    def get_size(self):
+        return self.surface.get_size()
+
+    def get_width(self):
+        return self.surface.get_width()
+
+    def get_height(self):
+        return self.surface.get_height()
+
+    def get_rect(self):
+        return self.surface.get_rect()
+
+    @property
+    def fullscreen(self):
+        return bool(self.surface.get_flags() & pygame.FULLSCREEN)
+
+    def set_mode(self, size, fullscreen):
+        """Resizes the window, or switches it in or out of fullscreen."""
+        self.surface = pygame.display.set_mode(size, pygame.FULLSCREEN if fullscreen else pygame.RESIZABLE)
+
+    def fill(self, color, rect=None):
+        self.surface.fill(color, rect)
+
+    def draw_circle(self, color, center, radius):
+        pygame.draw.circle(self.surface, color, center, radius)
+
+    def text(self, font, text, color):
+        """Rendered text, from the shared TextCache."""
+        return text_cache.render(font, text, color)
+
+    def image(self, surface):
+        """Prepares a surface for blitting many times (see blit)."""
+        # Converting needs a display mode, which an off-screen canvas doesn't have
+        return surface.convert_alpha() if pygame.display.get_surface() else surface
+
+    def icon(self, surface, min_size, max_size):
+        """An image to be drawn at any size from min_size to max_size (see blit_icon)."""
+        return IconFrames(surface, min_size, max_size)
+
+    def blit(self, image, dest, alpha=255):
+        if alpha == 255:
+            self.surface.blit(image, dest)
+            return
+        # Text surfaces are shared (see TextCache), so only fade this one blit
+        image.set_alpha(alpha)
+        self.surface.blit(image, dest)
+        image.set_alpha(255)
+
+    def blit_icon(self, icon, size, **position):
+        # Uses the pre-scaled frame closest to this size
+        frame = icon.get(size)
+        self.surface.blit(frame, frame.get_rect(**position))
+
+    def blit_surface(self, surface, dest):
+        """Draws a surface that is only used once, e.g. a line of the debug overlay."""
+        self.surface.blit(surface, dest)
+
+    def present(self, rects=None):
+        """Shows what has been drawn: just `rects`, or the whole screen."""
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def to_surface(self):
+        return self.surface
+
+class TextureCanvas:
+    """Hardware-accelerated drawing with SDL2's renderer, into a target texture."""
+    name = "texture"
+
+    def __init__(self, window, renderer, fullscreen=False):
+        self.window = window
+        self.renderer = renderer
+        self.fullscreen = fullscreen
+        # Text surfaces come from the shared TextCache; their textures go when it evicts them
+        self.textures = weakref.WeakKeyDictionary()
+        self.circles = {} # (radius, color) -> texture
+        self._make_target()
+
+    @classmethod
+    def open(cls, size, fullscreen=False, title=""):
+        if video is None:
+            raise pygame.error("pygame._sdl2 is not available")
+        # Filter scaled textures linearly, so the icon grows smoothly during the alert transition
+        os.environ.setdefault("SDL_RENDER_SCALE_QUALITY", "1")
+        window = video.Window(title, size, fullscreen_desktop=fullscreen, resizable=not fullscreen)
+        try:
+            # The best driver available; SDL's software one if there is no GPU
+            renderer = video.Renderer(window)
+        except RuntimeError:
+            window.destroy()
+            raise
+        return cls(window, renderer, fullscreen)
+
+    def _make_target(self):
+        self.size = self.window.size
+        self.target = video.Texture(self.renderer, self.size, target=True)
+        self.renderer.target = self.target
+
+    def get_size(self):
+        return self.size
+
+    def get_width(self):
+        return self.size[0]
+
+    def get_height(self):
+        return self.size[1]
+
+    def get_rect(self):
+        return pygame.Rect((0, 0), self.size)
+
+    def set_mode(self, size, fullscreen):
+        if fullscreen:
+            self.window.set_fullscreen(desktop=True)
+        else:
+            self.window.set_windowed()
+            self.window.size = size
+        self.fullscreen = fullscreen
+        # What was drawn is lost, so the caller has to repaint (see BoardRenderer.set_screen)
+        self._make_target()
+
+    def fill(self, color, rect=None):
+        self.renderer.draw_color = pygame.Color(color)
+        self.renderer.fill_rect(rect if rect is not None else self.get_rect())
+
+    def draw_circle(self, color, center, radius):
+        key = (radius, tuple(color))
+        texture = self.circles.get(key)
+        if texture is None:
+            size = int(radius * 2)
+            surface = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.circle(surface, color, (size / 2, size / 2), radius)
+            texture = self.circles[key] = video.Texture.from_surface(self.renderer, surface)
+        texture.draw(dstrect=texture.get_rect(center=center))
+
+    def text(self, font, text, color):
+        surface = text_cache.render(font, text, color)
+        texture = self.textures.get(surface)
+        if texture is None:
+            texture = self.textures[surface] = video.Texture.from_surface(self.renderer, surface)
+        return texture
+
+    def image(self, surface):
+        return video.Texture.from_surface(self.renderer, surface)
+
+    def icon(self, surface, min_size, max_size):
+        # One full-size texture, scaled by the renderer to whatever size is asked for
+        return video.Texture.from_surface(self.renderer, surface)
+
+    def blit(self, image, dest, alpha=255):
+        if image.alpha != alpha:
+            image.alpha = alpha
+        image.draw(dstrect=dest)
+
+    def blit_icon(self, icon, size, **position):
+        icon.draw(dstrect=_place(pygame.Rect(0, 0, size, size), position))
+
+    def blit_surface(self, surface, dest):
+        video.Texture.from_surface(self.renderer, surface).draw(dstrect=dest)
+
+    def present(self, rects=None):
+        # Copying the whole board to the window is one draw call, so `rects` don't matter here
+        self.renderer.target = None
+        self.target.draw()
+        self.renderer.present()
+        self.renderer.target = self.target
+
+    def to_surface(self):
+        return self.renderer.to_surface()
+
+def open_canvas(size, fullscreen=False, backend="software", title=""):
+    """
+    Opens the window and returns a canvas for it: a TextureCanvas for backend="texture" if
+    it can be set up, otherwise a SurfaceCanvas.
+    """
+    if backend == "texture":
+        try:
+            return TextureCanvas.open(size, fullscreen, title)
+        except (pygame.error, RuntimeError) as e:
+            print(f"Could not set up texture rendering ({e}), using software rendering")
+    elif backend != "software":
+        print(f"Unknown render backend {backend!r}, using software rendering")
+    canvas = SurfaceCanvas(None)
+    canvas.set_mode(size, fullscreen)
+    pygame.display.set_caption(title)
+    return canvas
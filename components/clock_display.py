@@ -4,10 +4,12 @@ import pygame
 import datetime
 import pytz
 import os
+import time
 
 class ClockDisplay:
     """
     Handles the drawing of the top status bar, drop shadow, and the real-time clock.
+    `screen` is the canvas to draw on (see components/canvas.py).
     """
     
     # Configuration
@@ -17,8 +19,9 @@ class ClockDisplay:
     SHADOW_OFFSET = 3
     PADDING = 25
     
-    def __init__(self, screen, screen_width, screen_height, font_path, time_zone_str, bar_height, station_name):
+    def __init__(self, screen, screen_width, screen_height, font_path, time_zone_str, bar_height, station_name, clock=time.time):
         self.screen = screen
+        self.clock = clock # Returns the current timestamp; replays pass a virtual one
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.time_zone = pytz.timezone(time_zone_str)
@@ -45,16 +48,16 @@ class ClockDisplay:
         shadow_rect.y += self.SHADOW_OFFSET
         
         # Draw the shadow (only the bottom and right edges will show)
-        pygame.draw.rect(self.screen, self.SHADOW_COLOR, shadow_rect)
+        self.screen.fill(self.SHADOW_COLOR, shadow_rect)
         
         # 2. Draw the Main Bar (covers the rest of the shadow)
-        pygame.draw.rect(self.screen, self.BAR_COLOR, self.bar_rect)
+        self.screen.fill(self.BAR_COLOR, self.bar_rect)
 
     def draw_station_name(self):
         """Renders and draws the station name in the top left corner."""
         
         # Render the text surface
-        text_surface = self.font.render(self.station_name, True, self.TEXT_COLOR)
+        text_surface = self.screen.text(self.font, self.station_name, self.TEXT_COLOR)
         
         # Calculate the position
         text_rect = text_surface.get_rect()
@@ -66,16 +69,24 @@ class ClockDisplay:
         # Draw the station name
         self.screen.blit(text_surface, text_rect)
     
+    def get_rect(self):
+        """Returns the area covered by the bar, including its drop shadow."""
+        return pygame.Rect(0, 0, self.screen_width, self.bar_height + self.SHADOW_OFFSET)
+
+    def get_time_str(self):
+        """Returns the clock text as it would be drawn right now."""
+        # Get the current time in the specified time zone
+        current_dt = datetime.datetime.fromtimestamp(self.clock(), self.time_zone)
+        # Format: HH:MM AM/PM (e.g., 10:49 PM)
+        return current_dt.strftime("%I:%M %p")
+
     def draw_clock(self):
         """Renders and draws the current time in the top right corner."""
         
-        # Get the current time in the specified time zone
-        current_dt = datetime.datetime.now(self.time_zone)
-        # Format: HH:MM AM/PM (e.g., 10:49 PM)
-        time_str = current_dt.strftime("%I:%M %p")
+        time_str = self.get_time_str()
         
         # Render the text surface
-        text_surface = self.font.render(time_str, True, self.TEXT_COLOR)
+        text_surface = self.screen.text(self.font, time_str, self.TEXT_COLOR)
         
         # Calculate the position
         text_rect = text_surface.get_rect()
@@ -0,0 +1,81 @@
+import pygame
+
+class RegionTracker:
+    """
+    Retained-mode bookkeeping for dirty-rectangle rendering.
+
+    Every frame, each on-screen element (a row, the clock bar, the alert bar...) is declared
+    with its rect and a key describing its content. Only regions whose key or rect changed,
+    or that overlap something that changed, get cleared and redrawn, and only those rects
+    are pushed to the display (see Canvas.present in components/canvas.py).
+    """
+
+    def __init__(self, canvas, background):
+        self.canvas = canvas
+        self.background = background
+        self.regions: dict[str, tuple[pygame.Rect, object]] = {} # What is on screen right now
+        self.pending: dict[str, tuple[pygame.Rect, object]] = {} # What this frame wants on screen
+        self.order: list[str] = [] # Draw order for this frame (back to front)
+        self.damage: list[pygame.Rect] = []
+        self.full_repaint = True
+
+    def invalidate(self, canvas=None):
+        """Forces a full repaint on the next frame (on resize or fullscreen toggle)."""
+        if canvas is not None:
+            self.canvas = canvas
+        self.full_repaint = True
+
+    def declare(self, name, rect, key):
+        """Declares a region for this frame, in back-to-front order."""
+        self.pending[name] = (pygame.Rect(rect), key)
+        self.order.append(name)
+
+    def resolve(self):
+        """
+        Works out which declared regions must be redrawn and clears their area.
+        Returns the set of region names to draw this frame, in any order.
+        """
+        if self.full_repaint:
+            self.canvas.fill(self.background)
+            self.damage = [self.canvas.get_rect()]
+            dirty = set(self.order)
+        else:
+            dirty = set()
+            self.damage = []
+            # Anything that disappeared or moved leaves damage behind
+            for name, (rect, key) in self.regions.items():
+                if name not in self.pending or self.pending[name][0] != rect:
+                    self.damage.append(rect)
+            for name in self.order:
+                rect, key = self.pending[name]
+                if self.regions.get(name) != (rect, key):
+                    dirty.add(name)
+                    self.damage.append(rect)
+
+            # Anything overlapping damage has to be redrawn too, which may damage more regions
+            changed = True
+            while changed:
+                changed = False
+                for name in self.order:
+                    rect = self.pending[name][0]
+                    if name not in dirty and rect.collidelist(self.damage) != -1:
+                        dirty.add(name)
+                        self.damage.append(rect)
+                        changed = True
+
+            for rect in self.damage:
+                self.canvas.fill(self.background, rect)
+
+        self.regions = self.pending
+        self.pending = {}
+        self.order = []
+        return dirty
+
+    def flush(self):
+        """Pushes this frame's changes to the display."""
+        if self.full_repaint:
+            self.canvas.present()
+            self.full_repaint = False
+        elif self.damage:
+            self.canvas.present(self.damage)
+        self.damage = []
@@ -1,22 +1,113 @@
+import unicodedata
+
+ZWJ = "\u200d"
+
+def _extends_cluster(char):
+    """True if char belongs to the same user-perceived character as the one before it."""
+    code = ord(char)
+    return (
+        unicodedata.category(char) in ("Mn", "Mc", "Me") # Combining accents, vowel signs, enclosing marks
+        or char == ZWJ
+        or 0xFE00 <= code <= 0xFE0F # Variation selectors
+        or 0x1F3FB <= code <= 0x1F3FF # Skin tone modifiers
+        or 0xE0020 <= code <= 0xE007F # Emoji tag sequences
+        or 0x1160 <= code <= 0x11FF # Conjoining Hangul vowels and finals
+    )
+
+def cluster_boundaries(text):
+    """
+    Returns every index where text can be cut without splitting a grapheme cluster: a letter
+    from its combining marks, an emoji ZWJ sequence or modifier, or a pair of regional
+    indicators (a flag). An approximation of Unicode's extended grapheme clusters, covering
+    what shows up in alerts. Includes 0 and len(text).
+    """
+    boundaries = [0]
+    regional_indicators = 0
+    for i in range(1, len(text)):
+        char = text[i]
+        if 0x1F1E6 <= ord(text[i - 1]) <= 0x1F1FF:
+            regional_indicators += 1
+        else:
+            regional_indicators = 0
+        if _extends_cluster(char) or text[i - 1] == ZWJ:
+            continue
+        # The second of two regional indicators finishes a flag
+        if 0x1F1E6 <= ord(char) <= 0x1F1FF and regional_indicators % 2 == 1:
+            continue
+        boundaries.append(i)
+    if text:
+        boundaries.append(len(text))
+    return boundaries
+
+def _longest_fitting(text, boundaries, font, max_width, suffix):
+    """
+    Binary searches for the largest boundary n where text[:n] + suffix fits within max_width,
+    so a long alert takes O(log n) measurements. Returns 0 if nothing fits.
+    """
+    low, high = 0, len(boundaries) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if font.size(text[:boundaries[mid]].rstrip() + suffix)[0] <= max_width:
+            low = mid
+        else:
+            high = mid - 1
+    return boundaries[low]
+
+def _split_word(word, font, max_width):
+    """Breaks a word wider than max_width (e.g. a sentence of CJK) into pieces that fit."""
+    pieces = []
+    while word:
+        boundaries = cluster_boundaries(word)
+        # Always take at least one cluster, even if it is wider than the line on its own
+        cut = max(_longest_fitting(word, boundaries, font, max_width, ""), boundaries[1])
+        pieces.append(word[:cut])
+        word = word[cut:]
+    return pieces
+
 def wrap_text(text, font, max_width):
     """Wraps text to fit within a maximum pixel width."""
     lines = []
     words = text.split(' ')
+    space_width = font.size(' ')[0]
     current_line = []
+    current_width = 0
     for word in words:
-        # Check the width if the new word is added
-        if font.size(' '.join(current_line + [word]))[0] <= max_width:
+        # Measure each word once and keep a running width, instead of re-measuring the whole line
+        word_width = font.size(word)[0]
+        if word_width > max_width:
+            # Text without spaces (Chinese, Japanese, long URLs) is broken between characters
+            pieces = _split_word(word, font, max_width)
+            if current_line:
+                lines.append(' '.join(current_line))
+            lines.extend(pieces[:-1])
+            word = pieces[-1]
+            current_line = []
+            word_width = font.size(word)[0]
+        new_width = current_width + space_width + word_width if current_line else word_width
+        if new_width <= max_width or not current_line:
             current_line.append(word)
+            current_width = new_width
         else:
             # Start a new line
             lines.append(' '.join(current_line))
             current_line = [word]
+            current_width = word_width
     lines.append(' '.join(current_line)) # Add the last line
     return lines
 
+def fit_text(text, font, max_width, suffix="..."):
+    """
+    Returns the longest prefix of text that fits within max_width pixels, with suffix appended
+    if anything was cut off. Only cuts between grapheme clusters (see cluster_boundaries), so
+    accents, vowel signs and emoji sequences are never left dangling or dropped halfway.
+    """
+    if font.size(text)[0] <= max_width:
+        return text
+    return text[:_longest_fitting(text, cluster_boundaries(text), font, max_width, suffix)].rstrip() + suffix
+
 # This handles the "minutes until" section for each arrival row
 # We want each number to have its own color, depending on its arrival status
-def draw_multi_colored_text(surface, data, surface_width, start_y, right_offset, font):
+def draw_multi_colored_text(canvas, data, surface_width, start_y, right_offset, font):
     # --- STEP 1: Calculate the Total Width ---
     total_width = 0
     
@@ -25,13 +116,14 @@ def draw_multi_colored_text(surface, data, surface_width, start_y, right_offset,
     
     for text_part, color in data:
         # Render the text part (we need to do this to get the exact width)
-        text_surface = font.render(text_part, True, color)
+        text_surface = canvas.text(font, text_part, color)
+        width = text_surface.get_rect().width
         
         # Store the surface and its width
-        rendered_parts.append((text_surface, text_surface.get_width()))
+        rendered_parts.append((text_surface, width))
         
         # Accumulate the width
-        total_width += text_surface.get_width()
+        total_width += width
         
     # --- STEP 2: Determine the Starting X-Coordinate ---
     # The starting X is the screen's right edge, minus the total text width, 
@@ -43,7 +135,7 @@ def draw_multi_colored_text(surface, data, surface_width, start_y, right_offset,
     
     for text_surface, width in rendered_parts:
         # Blit (draw) the surface onto the screen
-        surface.blit(text_surface, (x_offset, start_y))
+        canvas.blit(text_surface, (x_offset, start_y))
         
         # Increment the x_offset by the width of the text we just drew
         x_offset += width
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Shared fetcher for several boards on one host. One fetcher process polls OneBusAway and the
+alerts feed, and every board subscribes to it over a Unix socket instead of polling itself.
+Boards showing the same stop with the same filter share a single query, so upstream traffic
+stays the same however many boards are running.
+
+The protocol is one JSON object per line. A board sends one request when it connects:
+
+    {"subscribe": [["40_99610", null], ["1_11060", ["9", "43", "60"]]], "alerts": true}
+
+and then only reads. The fetcher replies with the latest data it has for each query, then
+pushes a new message whenever that data changes:
+
+    {"type": "arrivals", "key": "1_11060|43,60,9", "version": 3, "rows": [[route, headsign, [record, ...]], ...]}
+    {"type": "alerts", "version": 2, "alerts": ["...", ...]}
+
+`key` is query_key(stop, filter), and records are ArrivalRecord.to_list() lists. Versions
+count up per key (and for alerts) for as long as the fetcher runs. Each message is serialized
+once and the same bytes are written to every subscriber.
+
+Stops can also be pinned, so they are polled even with no board subscribed, and listeners
+(like components/arrivals_api.py) can be attached to get every update as well.
+"""
+from collections import defaultdict
+from components.snapshot import decode_rows, encode_rows
+from components.transit_data import query_key
+import asyncio
+import json
+import os
+import requests
+import socket
+import threading
+import time
+
+# A board that stops reading is dropped once this much is queued for it
+MAX_BOARD_BUFFER = 1024 * 1024
+
+def _encode_message(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+class FetchDaemon:
+    """
+    Serves the arrivals of TransitData `transit_data` and the alerts of `alerts_feed` to boards
+    connecting on `socket_path`. Stop queries are added when the first board subscribes to
+    them and dropped when the last one disconnects. Alert fetches are recorded in `metrics`, if given.
+    """
+
+    def __init__(self, transit_data, alerts_feed, alert_thresholds, socket_path, alerts_refresh_rate=60, metrics=None):
+        self.transit_data = transit_data
+        self.metrics = metrics
+        self.alerts_feed = alerts_feed
+        self.alert_thresholds = alert_thresholds
+        self.socket_path = socket_path
+        self.alerts_refresh_rate = alerts_refresh_rate
+
+        self.subscribers: dict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+        self.alert_subscribers: set[asyncio.StreamWriter] = set()
+        self.versions: dict[str, int] = defaultdict(int)
+        self.latest: dict[str, bytes] = {} # Last message sent per key, for boards that join later
+        self.latest_rows: dict[str, str] = {}
+        self.alerts_version = 0
+        self.latest_alerts = None
+        self.queries_changed = None
+        self.pinned: set[str] = set()
+        # Objects with on_arrivals(key, version, rows_json), on_removed(key) and on_alerts(version, alerts),
+        # where rows_json is the encode_rows lists already serialized to JSON
+        self.listeners = []
+
+    def board_count(self):
+        """Number of boards connected right now."""
+        # Copies, since the metrics exporter calls this from another thread
+        boards = set(self.alert_subscribers)
+        for writers in list(self.subscribers.values()):
+            boards.update(writers)
+        return len(boards)
+
+    def pin(self, stop, filter=None):
+        """Polls a stop for as long as the fetcher runs, whether or not any board shows it."""
+        key = query_key(stop, filter)
+        self.pinned.add(key)
+        self.transit_data.add_query(key, stop, filter)
+
+    async def run(self):
+        self.queries_changed = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            # Left behind by a fetcher that didn't shut down cleanly
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_board, path=self.socket_path)
+        print(f"Fetcher listening on {self.socket_path}")
+        try:
+            async with server:
+                await asyncio.gather(server.serve_forever(), self._poll_stops(), self._poll_alerts())
+        finally:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _send(self, writer, message):
+        if writer.transport.get_write_buffer_size() > MAX_BOARD_BUFFER:
+            # This board has stopped reading, don't let it hold memory for everyone else
+            writer.close()
+            return
+        writer.write(message)
+
+    async def _handle_board(self, reader, writer):
+        keys = []
+        try:
+            request = json.loads(await reader.readline())
+            for stop, filter in request.get("subscribe", []):
+                key = query_key(stop, filter)
+                if key not in self.transit_data.queries:
+                    self.transit_data.add_query(key, stop, filter)
+                    self.queries_changed.set()
+                self.subscribers[key].add(writer)
+                keys.append(key)
+                if key in self.latest:
+                    writer.write(self.latest[key])
+            if request.get("alerts"):
+                self.alert_subscribers.add(writer)
+                if self.latest_alerts is not None:
+                    writer.write(self.latest_alerts)
+            await writer.drain()
+            # Boards don't send anything else, so just wait for this one to hang up, throwing
+            # away anything it does send a chunk at a time
+            while await reader.read(4096):
+                pass
+        except (ConnectionError, ValueError, TypeError, AttributeError) as e:
+            print(f"Dropping board connection: {e}")
+        finally:
+            self.alert_subscribers.discard(writer)
+            for key in keys:
+                self.subscribers[key].discard(writer)
+                if not self.subscribers[key]:
+                    del self.subscribers[key]
+                    if key not in self.pinned:
+                        # Nobody shows this stop any more, so stop polling it
+                        self.transit_data.remove_query(key)
+                        self.latest.pop(key, None)
+                        self.latest_rows.pop(key, None)
+                        for listener in self.listeners:
+                            listener.on_removed(key)
+            writer.close()
+
+    def _publish_arrivals(self, key):
+        rows = self.transit_data.arrivals.get(key)
+        if rows is None or key not in self.transit_data.queries:
+            return
+        encoded = encode_rows(rows)
+        rows_json = json.dumps(encoded, separators=(",", ":"))
+        if rows_json == self.latest_rows.get(key):
+            # Same predictions as last time, no need to wake every board up
+            return
+        self.latest_rows[key] = rows_json
+        self.versions[key] += 1
+        message = _encode_message({"type": "arrivals", "key": key, "version": self.versions[key], "rows": encoded})
+        self.latest[key] = message
+        for writer in list(self.subscribers.get(key, ())):
+            self._send(writer, message)
+        for listener in self.listeners:
+            listener.on_arrivals(key, self.versions[key], rows_json)
+
+    def _publish_alerts(self, alerts):
+        self.alerts_version += 1
+        self.latest_alerts = _encode_message({"type": "alerts", "version": self.alerts_version, "alerts": alerts})
+        for writer in list(self.alert_subscribers):
+            self._send(writer, self.latest_alerts)
+        for listener in self.listeners:
+            listener.on_alerts(self.alerts_version, alerts)
+
+    async def _poll_stops(self):
+        loop = asyncio.get_running_loop()
+        transit_data = self.transit_data
+        poll_scheduler = transit_data.poll_scheduler
+        while True:
+            due = poll_scheduler.due(time.time())
+            if due:
+                # Boards add and remove queries on this thread, so only the requests themselves
+                # run in the executor, on a snapshot of the queries. Their results are applied
+                # back here, where a query removed meanwhile is simply skipped
+                jobs = transit_data.prepare_fetch(due)
+                try:
+                    results = await loop.run_in_executor(None, transit_data.run_fetch, jobs)
+                except Exception as e:
+                    # Counts as a failed poll of every stop, so they back off instead of ending polling
+                    results = [e] * len(jobs)
+                for key in transit_data.apply_fetch(jobs, results):
+                    self._publish_arrivals(key)
+                continue
+            # Sleep until the next stop is due, or a board subscribes to a new one
+            next_due = poll_scheduler.next_due()
+            timeout = None if next_due is None else max(0, next_due - time.time())
+            self.queries_changed.clear()
+            try:
+                await asyncio.wait_for(self.queries_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_alerts(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = time.perf_counter()
+            error = None
+            try:
+                alerts = await loop.run_in_executor(None, self.alerts_feed.fetch_alerts, self.alert_thresholds)
+                # None means the feed is unchanged
+                if alerts is not None:
+                    self._publish_alerts(alerts)
+            except requests.exceptions.RequestException as e:
+                print(f"An error occurred while fetching service alerts: {e}")
+                error = e
+            except ValueError as e:
+                print(f"An error occurred while decoding service alerts: {e}")
+                error = e
+            if self.metrics:
+                self.metrics.record_fetch("alerts", "", time.perf_counter() - started, error)
+            await asyncio.sleep(self.alerts_refresh_rate)
+
+class FetchSubscriber:
+    """
+    Board side of the shared fetcher. Connects to `socket_path` on a background thread,
+    subscribes to `queries` (a list of (stop, filter)) and calls on_arrivals(key, rows) and
+    on_alerts(alerts) as updates come in, where rows are decoded like parse_query's. Reconnects
+    on its own if the fetcher restarts.
+    """
+
+    def __init__(self, socket_path, queries, on_arrivals, on_alerts, reconnect_delay=5):
+        self.socket_path = socket_path
+        self.queries = [[stop, filter] for stop, filter in queries]
+        self.on_arrivals = on_arrivals
+        self.on_alerts = on_alerts
+        self.reconnect_delay = reconnect_delay
+        self.versions: dict[str, int] = {}
+        self.connected = False
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, name="fetch-subscriber", daemon=True).start()
+
+    def _run(self):
+        waiting = False
+        while self.running:
+            try:
+                self._listen()
+            except (OSError, ValueError) as e:
+                if self.running and (self.connected or not waiting):
+                    # Only once per outage, not on every retry
+                    print(f"{'Lost connection to' if self.connected else 'Waiting for'} fetcher at {self.socket_path}: {e}")
+                waiting = not self.connected
+            self.connected = False
+            if self.running:
+                time.sleep(self.reconnect_delay)
+
+    def _listen(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            self.sock = sock
+            sock.connect(self.socket_path)
+            sock.sendall(_encode_message({"subscribe": self.queries, "alerts": True}))
+            self.connected = True
+            # Versions restart if the fetcher does
+            self.versions = {}
+            for line in sock.makefile("rb"):
+                try:
+                    self._handle_message(json.loads(line))
+                except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+                    # A message this board can't read (e.g. from a newer fetcher), skip it
+                    print(f"Ignoring a malformed message from the fetcher: {e!r}")
+            raise ConnectionError("fetcher closed the connection")
+
+    def _handle_message(self, message):
+        if message["type"] == "arrivals":
+            key = message["key"]
+            if message["version"] <= self.versions.get(key, 0):
+                return
+            rows = decode_rows(message["rows"])
+            self.versions[key] = message["version"]
+            self.on_arrivals(key, rows)
+        elif message["type"] == "alerts":
+            if message["version"] <= self.versions.get("alerts", 0):
+                return
+            alerts = message["alerts"]
+            self.versions["alerts"] = message["version"]
+            self.on_alerts(alerts)
+
+    def close(self):
+        self.running = False
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -0,0 +1,146 @@
+from components.fetch_supervisor import CircuitOpenError, FetchTimeout
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every request made with the same API key.
+    `rate` tokens are added per second, up to `capacity`, so short bursts (one refresh
+    of every stop) go out together while the long-run average stays under the key's limit.
+    """
+
+    def __init__(self, rate, capacity):
+        # Either would leave acquire() waiting forever (or dividing by zero)
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be above 0, got {rate}")
+        if capacity < 1:
+            raise ValueError(f"Token bucket capacity must be at least 1, got {capacity}")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available, then consumes them."""
+        if tokens > self.capacity:
+            raise ValueError(f"Can't acquire {tokens} tokens from a bucket that holds {self.capacity:g}")
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                # Time until enough tokens have trickled in
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class FetchEngine:
+    """
+    Runs stop queries concurrently on a persistent thread pool, gated by a shared TokenBucket.
+
+    With a `deadline`, a job that hasn't finished that many seconds after it was started gets
+    a FetchTimeout in its slot and is abandoned. If abandoned jobs tie up half the workers,
+    the pool is replaced so new jobs don't queue behind them. With a `breaker`
+    (a CircuitBreaker), jobs fail fast with CircuitOpenError while the upstream is down.
+    """
+
+    def __init__(self, rate_limiter, max_workers=8, deadline=None, breaker=None):
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.breaker = breaker
+        self.executor = self._new_executor()
+        self.stuck = 0 # Abandoned jobs still running on the current pool
+        self.waiting = 0 # Jobs submitted that haven't started yet
+        self.lock = threading.Lock()
+
+    def _new_executor(self):
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch")
+
+    def _submit(self, func, args):
+        if self.breaker:
+            self.breaker.check()
+        # Wait for the rate limit here, so the deadline only covers the request itself
+        self.rate_limiter.acquire()
+        with self.lock:
+            self.waiting += 1
+        return self.executor.submit(self._started, func, args), time.monotonic()
+
+    def _started(self, func, args):
+        with self.lock:
+            self.waiting -= 1
+        return func(*args)
+
+    def _abandon(self, future):
+        if future.cancel():
+            # Never started, so nothing is stuck
+            with self.lock:
+                self.waiting -= 1
+            return
+        executor = self.executor
+        with self.lock:
+            self.stuck += 1
+            replace = self.stuck >= max(1, self.max_workers // 2)
+            if replace:
+                self.stuck = 0
+                self.executor = self._new_executor()
+        if replace:
+            print(f"{self.max_workers // 2 or 1} fetch workers are stuck, starting a fresh pool")
+            # The stuck threads end when their own socket timeouts fire
+            executor.shutdown(wait=False)
+        else:
+            future.add_done_callback(lambda _: self._unstuck(executor))
+
+    def _unstuck(self, executor):
+        with self.lock:
+            if executor is self.executor and self.stuck > 0:
+                self.stuck -= 1
+
+    def fetch_all(self, jobs):
+        """
+        Runs every (func, args) job at the same time and returns their results in job order.
+        If a job raises, its exception is returned in its slot instead of a result, so one
+        bad stop doesn't throw away the data from the others.
+        """
+        submitted = []
+        for func, args in jobs:
+            try:
+                submitted.append(self._submit(func, args))
+            except CircuitOpenError as e:
+                submitted.append((e, None))
+
+        results = []
+        for future, started in submitted:
+            if started is None:
+                results.append(future)
+                continue
+            timeout = None
+            if self.deadline is not None:
+                timeout = max(0, started + self.deadline - time.monotonic())
+            try:
+                result = future.result(timeout=timeout)
+            except FuturesTimeoutError:
+                self._abandon(future)
+                result = FetchTimeout(f"No response within {self.deadline} s")
+            except Exception as e:
+                result = e
+            if self.breaker:
+                self.breaker.record(result if isinstance(result, Exception) else None)
+            results.append(result)
+        return results
+
+    def queued(self):
+        """Number of jobs waiting for a free worker."""
+        return self.waiting
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
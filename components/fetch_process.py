@@ -0,0 +1,79 @@
+"""
+Runs the fetch and parse pipeline in a child process, so that deserializing OneBusAway and
+alerts responses never holds the GIL while the board is drawing (FETCH_MODE="process").
+
+The child is fetcher.py serving only this board, on a private socket. The board reads it with
+a FetchSubscriber, which gets rows that are already parsed and filtered, in the compact form
+of encode_rows, and only for stops that changed.
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+FETCHER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fetcher.py")
+
+class FetchProcess:
+    """
+    Starts the child and keeps it running: if it exits or crashes it is started again after
+    `restart_delay` seconds, doubling up to `max_restart_delay` while it keeps failing. The
+    child exits on its own if the board dies without closing it.
+    """
+
+    def __init__(self, socket_path=None, command=None, restart_delay=1, max_restart_delay=60):
+        self.socket_path = socket_path or os.path.join(tempfile.gettempdir(), f"subway-tracker-{os.getpid()}.sock")
+        self.command = command or [sys.executable, FETCHER_PATH, "--socket", self.socket_path, "--parent", str(os.getpid())]
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.process = None
+        self.restarts = 0
+        self.running = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="fetch-process", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        delay = self.restart_delay
+        while self.running:
+            started = time.monotonic()
+            try:
+                self.process = subprocess.Popen(self.command)
+            except OSError as e:
+                problem = f"Could not start the fetch process: {e}"
+            else:
+                code = self.process.wait()
+                if not self.running:
+                    break
+                problem = f"Fetch process exited with status {code}"
+            if time.monotonic() - started > self.max_restart_delay:
+                # It ran fine for a while, so this isn't a crash loop
+                delay = self.restart_delay
+            print(f"{problem}, restarting it in {delay:.0f} s")
+            if self.stopped.wait(delay):
+                break
+            delay = min(delay * 2, self.max_restart_delay)
+            self.restarts += 1
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self, timeout=3):
+        """Stops the child, giving it `timeout` seconds to shut down cleanly before killing it."""
+        self.running = False
+        self.stopped.set()
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
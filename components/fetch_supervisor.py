@@ -0,0 +1,154 @@
+"""
+Keeps a hung or failing upstream from stalling the board:
+
+- CircuitBreaker fails requests fast while an upstream is down, and lets a trial request
+  through every so often so it recovers on its own.
+- FetchSupervisor runs a data source's background refresh and abandons it if it gets stuck,
+  so a new one can start.
+
+Python threads can't be killed, so abandoned work keeps running until its own socket timeouts
+end it; it just no longer holds anything up.
+"""
+import requests
+import threading
+import time
+
+class FetchTimeout(requests.exceptions.Timeout):
+    """A request that didn't finish within its deadline."""
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of making a request while the upstream's circuit breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is failing, not trying again for {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+def is_upstream_failure(error):
+    """
+    Whether an error says the upstream is unwell (timeouts, connection errors, 5xx and 429
+    responses), rather than that one request was bad.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+class CircuitBreaker:
+    """
+    Counts consecutive upstream failures. After `failure_threshold` of them the circuit opens
+    and check() raises CircuitOpenError for `reset_timeout` seconds. Then one trial request is
+    let through (half open): if it works the circuit closes, if not it opens again for twice
+    as long, up to `max_reset_timeout`. Thread-safe.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_reset_timeout=5*60, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_for = reset_timeout
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def check(self):
+        """Raises CircuitOpenError if requests shouldn't be made right now."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.open_for - self.clock()
+            if self.state == self.OPEN and remaining <= 0:
+                # Let one request through to see if the upstream is back
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.name, max(remaining, 0))
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                print(f"{self.name} is back")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.open_for = self.reset_timeout
+
+    def record_failure(self, error):
+        if not is_upstream_failure(error):
+            return
+        with self.lock:
+            self.failures += 1
+            if self.state == self.OPEN:
+                # A request that was already in flight when the circuit opened
+                return
+            if self.state == self.HALF_OPEN:
+                # Still down, wait longer before the next trial
+                self.open_for = min(self.open_for * 2, self.max_reset_timeout)
+            elif self.state == self.CLOSED and self.failures < self.failure_threshold:
+                return
+            print(f"{self.name} failed {self.failures} times in a row, pausing requests for {self.open_for:.0f} s")
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+    def record(self, error=None):
+        if error is None:
+            self.record_success()
+        else:
+            self.record_failure(error)
+
+class FetchSupervisor:
+    """
+    Runs one background refresh at a time for a data source, e.g. the board's arrivals or its
+    alerts, on a shared WorkerPool (see components/worker_pool.py). If a refresh is still
+    running after `deadline` seconds it is abandoned: busy() returns False again so the caller
+    can start a new one, the pool gets a worker in place of the stuck one, and the stuck
+    thread is left to finish (or not) on its own.
+    """
+
+    def __init__(self, name, deadline, pool, clock=time.monotonic):
+        self.name = name
+        self.deadline = deadline
+        self.pool = pool
+        self.clock = clock
+        self.started_at = None
+        self.generation = 0
+        self.abandoned = 0
+        self.lock = threading.Lock()
+
+    def running(self):
+        return self.started_at is not None
+
+    def busy(self):
+        """Whether a refresh is running and hasn't hit its deadline. Abandons it if it has."""
+        with self.lock:
+            if self.started_at is None:
+                return False
+            stuck_for = self.clock() - self.started_at
+            if stuck_for <= self.deadline:
+                return True
+            print(f"{self.name} refresh has been stuck for {stuck_for:.0f} s, abandoning it")
+            self.abandoned += 1
+            self.started_at = None
+            self.generation += 1
+        self.pool.replace_stuck()
+        return False
+
+    def start(self, target, *args):
+        """Queues target(*args) on the pool."""
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self.started_at = self.clock()
+        self.pool.submit(self._run, generation, target, args)
+
+    def _run(self, generation, target, args):
+        try:
+            target(*args)
+        finally:
+            with self.lock:
+                # An abandoned refresh finishing late mustn't mark its replacement as done
+                if generation == self.generation:
+                    self.started_at = None
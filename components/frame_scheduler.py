@@ -0,0 +1,52 @@
+import pygame
+import time
+
+class FrameScheduler:
+    """
+    Replaces a fixed clock.tick(FPS) with a loop that only wakes up when something visible
+    is due to change. During a frame, callers report when their content will next change
+    with request_frame_at(), or call animate() if they need full FPS. wait() then either
+    ticks at full FPS or sleeps until the earliest deadline or the next pygame event.
+    """
+
+    def __init__(self, fps, max_idle_seconds=10, clock=time.time, speed=1):
+        self.fps = fps
+        # Deadlines are in `clock` time, which runs `speed` times faster than real time in replays
+        self.time = clock
+        self.speed = speed
+        self.max_idle_seconds = max_idle_seconds # Safety net, in case a deadline is missed
+        self.clock = pygame.time.Clock()
+        self.next_frame_time = None
+        self.animating = False
+
+    def request_frame_at(self, when):
+        """Asks for a frame to be drawn no later than `when` (a `clock` timestamp). None is ignored."""
+        if when is None:
+            return
+        if self.next_frame_time is None or when < self.next_frame_time:
+            self.next_frame_time = when
+
+    def animate(self):
+        """Asks for the next frame at full FPS (e.g. during an alert transition)."""
+        self.animating = True
+
+    def wait(self):
+        """Blocks until the next frame is due, then resets the requests for the next frame."""
+        if self.animating:
+            self.clock.tick(self.fps)
+        else:
+            timeout = self.max_idle_seconds
+            if self.next_frame_time is not None:
+                timeout = min(timeout, (self.next_frame_time - self.time()) / self.speed)
+            timeout_ms = int(timeout * 1000)
+            if timeout_ms > 0:
+                # Sleep until the deadline or until any event arrives, whichever is first.
+                # The event is put back so the main loop's event handling still sees it.
+                event = pygame.event.wait(timeout_ms)
+                if event.type != pygame.NOEVENT:
+                    pygame.event.post(event)
+            # Keep the clock's frame timing in sync so the next animation starts smoothly
+            self.clock.tick()
+
+        self.next_frame_time = None
+        self.animating = False
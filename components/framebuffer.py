@@ -0,0 +1,232 @@
+"""
+Output to a Linux framebuffer (/dev/fbN) or an e-paper panel, with no window system (FRAMEBUFFER
+in .env). These displays are slow to refresh and, for e-paper, cost power for every pixel that
+changes, so the board is drawn off-screen and only what actually changed is written:
+
+- FramebufferOutput is the canvas the board draws on (see components/canvas.py). The region
+  tracker already tells it which regions were redrawn; it narrows those down to the pixels
+  that differ from what the display shows, usually a few countdown digits and the clock.
+- Writes are throttled to one every `min_interval` seconds. Changes made in between are
+  merged into the next write.
+- The full alert box is the one big change: showing and hiding it rewrites most of the
+  screen. main.py doesn't animate it here and shows it only every FRAMEBUFFER_ALERT_CYCLE
+  seconds.
+- FramebufferSink writes the changed rects into the framebuffer, memory-mapped. It works the
+  same on a plain file, which is handy for testing (see benchmarks/framebuffer_diff.py).
+"""
+import mmap
+import os
+import time
+import pygame
+from components.canvas import SurfaceCanvas
+
+# Pixel formats of the framebuffer, by bits per pixel: masks for an XRGB8888 or RGB565
+# Surface laid out like the framebuffer's memory. 8 bits is greyscale, as on most e-paper
+FRAMEBUFFER_MASKS = {
+    32: (0xFF0000, 0x00FF00, 0x0000FF, 0),
+    16: (0xF800, 0x07E0, 0x001F, 0),
+}
+GREYSCALE_PALETTE = [(level, level, level) for level in range(256)]
+
+def _read_sysfs(device, name):
+    try:
+        with open(f"/sys/class/graphics/{device}/{name}") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def framebuffer_info(path):
+    """
+    Returns ((width, height), bits per pixel, stride in bytes) of a /dev/fbN device from sysfs,
+    or None if `path` isn't one.
+    """
+    device = os.path.basename(os.path.realpath(path))
+    size = _read_sysfs(device, "virtual_size")
+    bits_per_pixel = _read_sysfs(device, "bits_per_pixel")
+    if not device.startswith("fb") or size is None or bits_per_pixel is None:
+        return None
+    width, height = (int(n) for n in size.split(","))
+    bits_per_pixel = int(bits_per_pixel)
+    stride = _read_sysfs(device, "stride") # Only on newer kernels
+    return (width, height), bits_per_pixel, int(stride) if stride else width * bits_per_pixel // 8
+
+class FramebufferSink:
+    """
+    Writes rects of a surface into a memory-mapped framebuffer: a /dev/fbN device, whose size
+    and format are read from sysfs, or a file of `size` pixels at `bits_per_pixel`, created
+    (or grown) if needed.
+    """
+
+    def __init__(self, path, size=None, bits_per_pixel=None):
+        self.path = path
+        info = framebuffer_info(path)
+        if info:
+            size, bits_per_pixel, self.stride = info
+        else:
+            if size is None:
+                raise ValueError(f"{path} is not a framebuffer device, so it needs a size")
+            bits_per_pixel = bits_per_pixel or 32
+            self.stride = size[0] * bits_per_pixel // 8
+        self.size = tuple(size)
+        self.bits_per_pixel = bits_per_pixel
+
+        # The board's pixels are converted into this, in the framebuffer's own format
+        if bits_per_pixel in FRAMEBUFFER_MASKS:
+            self.frame = pygame.Surface(self.size, 0, bits_per_pixel, FRAMEBUFFER_MASKS[bits_per_pixel])
+        elif bits_per_pixel == 8:
+            self.frame = pygame.Surface(self.size, 0, 8)
+            self.frame.set_palette(GREYSCALE_PALETTE)
+        else:
+            raise ValueError(f"Unsupported framebuffer format: {bits_per_pixel} bits per pixel")
+
+        length = self.stride * self.size[1]
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not info and os.fstat(self.fd).st_size < length:
+                os.ftruncate(self.fd, length)
+            self.map = mmap.mmap(self.fd, length)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def write(self, surface, rects):
+        """Copies `rects` of `surface` (the size of the framebuffer) onto the display."""
+        bounds = self.frame.get_rect()
+        rects = [bounds.clip(rect) for rect in rects]
+        for rect in rects:
+            self.frame.blit(surface, rect, rect)
+
+        bytes_per_pixel = self.frame.get_bytesize()
+        pitch = self.frame.get_pitch()
+        # Viewing the pixels locks the surface, so only after blitting
+        with memoryview(self.frame.get_view("0")).cast("B") as pixels:
+            for rect in rects:
+                start = rect.x * bytes_per_pixel
+                end = start + rect.width * bytes_per_pixel
+                for y in range(rect.top, rect.bottom):
+                    offset = y * self.stride
+                    self.map[offset + start:offset + end] = pixels[y * pitch + start:y * pitch + end]
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+def _changed_rows(current, previous, rect):
+    """Returns (top, bottom) of the rows of `rect` that differ between the surfaces, or None."""
+    def row(surface, y):
+        return pygame.image.tobytes(surface.subsurface((rect.x, y, rect.width, 1)), "RGBX")
+
+    top = rect.top
+    while top < rect.bottom and row(current, top) == row(previous, top):
+        top += 1
+    if top == rect.bottom:
+        return None
+    bottom = rect.bottom
+    while row(current, bottom - 1) == row(previous, bottom - 1):
+        bottom -= 1
+    return top, bottom
+
+def changed_rects(current, previous, regions, tile=16):
+    """
+    Narrows `regions` (rects that may have changed) down to the parts where `current` differs
+    from `previous`. Each region is cut to the rows that changed, then into `tile` pixel wide
+    columns; runs of changed columns become one rect, trimmed to their own changed rows.
+    """
+    bounds = current.get_rect()
+    regions = [bounds.clip(rect) for rect in regions]
+    # Overlapping regions would be compared (and written) twice
+    merged = []
+    for rect in sorted(regions, key=lambda r: r.top):
+        if not rect:
+            continue
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect = rect.union(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+
+    changed = []
+    for region in merged:
+        rows = _changed_rows(current, previous, region)
+        if rows is None:
+            continue
+        band = pygame.Rect(region.x, rows[0], region.width, rows[1] - rows[0])
+        run = None
+        for x in range(band.left, band.right, tile):
+            column = pygame.Rect(x, band.top, min(tile, band.right - x), band.height)
+            if pygame.image.tobytes(current.subsurface(column), "RGBX") != pygame.image.tobytes(previous.subsurface(column), "RGBX"):
+                run = run.union(column) if run else column
+            elif run:
+                changed.append(run)
+                run = None
+        if run:
+            changed.append(run)
+
+    for i, rect in enumerate(changed):
+        top, bottom = _changed_rows(current, previous, rect)
+        changed[i] = pygame.Rect(rect.x, top, rect.width, bottom - top)
+    return changed
+
+class FramebufferOutput(SurfaceCanvas):
+    """
+    A canvas that draws off-screen and writes only the changed pixels to a FramebufferSink,
+    at most once every `min_interval` seconds of `clock` time. Call flush() each frame, and
+    again by next_flush(), so changes held back by the throttle get written.
+    """
+    name = "framebuffer"
+
+    def __init__(self, sink, min_interval=0, clock=time.time, tile=16):
+        super().__init__(pygame.Surface(sink.size))
+        self.sink = sink
+        self.min_interval = min_interval
+        self.clock = clock
+        self.tile = tile
+        # What the display is showing. Unknown at first, so the first write is the whole screen
+        self.shown = self.surface.copy()
+        self.pending = []
+        self.full_write = True
+        self.last_write = None
+        self.writes = 0
+        self.pixels_written = 0
+
+    @property
+    def fullscreen(self):
+        return True
+
+    def set_mode(self, size, fullscreen):
+        pass # The framebuffer's size is fixed
+
+    def present(self, rects=None):
+        if rects is None:
+            self.full_write = True
+        else:
+            self.pending.extend(rect for rect in rects if rect not in self.pending)
+        self.flush()
+
+    def next_flush(self):
+        """When held-back changes can be written, or None if there aren't any."""
+        if not self.pending and not self.full_write:
+            return None
+        return self.last_write + self.min_interval if self.last_write is not None else self.clock()
+
+    def flush(self):
+        """Writes what changed since the last write, unless that was under min_interval ago."""
+        if not self.pending and not self.full_write:
+            return
+        now = self.clock()
+        if self.last_write is not None and now - self.last_write < self.min_interval:
+            return
+        if self.full_write:
+            rects = [self.surface.get_rect()]
+        else:
+            rects = changed_rects(self.surface, self.shown, self.pending, self.tile)
+        self.pending = []
+        self.full_write = False
+        if not rects:
+            return # Redrawn, but identical to what's shown
+        for rect in rects:
+            self.shown.blit(self.surface, rect, rect)
+        self.sink.write(self.surface, rects)
+        self.last_write = now
+        self.writes += 1
+        self.pixels_written += sum(rect.width * rect.height for rect in rects)
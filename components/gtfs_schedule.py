@@ -0,0 +1,215 @@
+"""
+Local index of a GTFS static schedule, so the board can show scheduled departures without
+calling OneBusAway: as a fallback when the API is down or rate-limited, and as the source
+for finding the first trip of the morning.
+
+Build the index once (and again whenever the agencies publish a new schedule) with:
+
+    python -m components.gtfs_schedule gtfs_index.sqlite 40=sound_transit_gtfs.zip 1=kcm_gtfs.zip
+
+where each `prefix=zip` pair is a OneBusAway agency ID and that agency's GTFS zip. Stop IDs
+are stored with the prefix (e.g. "40_99610"), so the same IDs work for the API and the index.
+"""
+from collections import OrderedDict, namedtuple
+import csv
+import io
+import os
+import sqlite3
+import sys
+import threading
+import zipfile
+from datetime import datetime, timedelta
+import pytz
+
+# Shaped like an entry of an OneBusAway arrival_and_departure.list response (times in ms),
+# so parse_query and ArrivalRecord.from_oba can treat scheduled and live data the same way
+ScheduledDeparture = namedtuple("ScheduledDeparture", [
+    "route_short_name", "trip_headsign", "trip_id", "scheduled_arrival_time", "scheduled_departure_time",
+    "predicted_arrival_time", "predicted_departure_time", "predicted", "status",
+])
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+BATCH_SIZE = 10000
+# Service days whose active service IDs are kept: a lookup reads yesterday through the horizon
+SERVICE_DATE_CACHE_SIZE = 8
+
+def _read_csv(archive, name):
+    """Streams the rows of one file in a GTFS zip as dicts."""
+    with archive.open(name) as raw:
+        yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig"))
+
+def _gtfs_seconds(time_str):
+    """Converts a GTFS HH:MM:SS time (which can go past 24:00:00) to seconds after midnight."""
+    hours, minutes, seconds = time_str.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+def build_index(db_path, feeds, stop_ids=None):
+    """
+    Imports GTFS zips into a compact SQLite index at db_path. `feeds` is a list of
+    (agency prefix, zip path). If stop_ids is given, only those (prefixed) stops are kept.
+    The index is written to a temporary file and swapped in atomically.
+    """
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript("""
+        CREATE TABLE departures (
+            stop_id TEXT, service_id TEXT, arrival_secs INTEGER, departure_secs INTEGER,
+            route_short_name TEXT, headsign TEXT, trip_id TEXT
+        );
+        CREATE TABLE calendar (service_id TEXT PRIMARY KEY, weekdays INTEGER, start_date TEXT, end_date TEXT);
+        CREATE TABLE calendar_dates (service_id TEXT, date TEXT, exception_type INTEGER);
+    """)
+
+    for prefix, zip_path in feeds:
+        with zipfile.ZipFile(zip_path) as archive:
+            names = set(archive.namelist())
+            routes = {row["route_id"]: row["route_short_name"] or row.get("route_long_name", "") for row in _read_csv(archive, "routes.txt")}
+            trips = {
+                row["trip_id"]: (f"{prefix}_{row['service_id']}", routes.get(row["route_id"], ""), row.get("trip_headsign", ""))
+                for row in _read_csv(archive, "trips.txt")
+            }
+
+            batch = []
+            for row in _read_csv(archive, "stop_times.txt"):
+                stop_id = f"{prefix}_{row['stop_id']}"
+                if stop_ids is not None and stop_id not in stop_ids:
+                    continue
+                if not row["arrival_time"] or row["trip_id"] not in trips:
+                    continue
+                service_id, route_short_name, headsign = trips[row["trip_id"]]
+                batch.append((
+                    stop_id, service_id, _gtfs_seconds(row["arrival_time"]), _gtfs_seconds(row["departure_time"] or row["arrival_time"]),
+                    route_short_name, row.get("stop_headsign") or headsign, f"{prefix}_{row['trip_id']}",
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    db.executemany("INSERT INTO departures VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                    batch = []
+            db.executemany("INSERT INTO departures VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+
+            if "calendar.txt" in names:
+                db.executemany("INSERT OR REPLACE INTO calendar VALUES (?, ?, ?, ?)", [
+                    (f"{prefix}_{row['service_id']}", sum(1 << i for i, day in enumerate(WEEKDAYS) if row[day] == "1"), row["start_date"], row["end_date"])
+                    for row in _read_csv(archive, "calendar.txt")
+                ])
+            if "calendar_dates.txt" in names:
+                db.executemany("INSERT INTO calendar_dates VALUES (?, ?, ?)", [
+                    (f"{prefix}_{row['service_id']}", row["date"], int(row["exception_type"]))
+                    for row in _read_csv(archive, "calendar_dates.txt")
+                ])
+
+    # The index makes a lookup a single range scan on (stop, time)
+    db.execute("CREATE INDEX departures_by_stop ON departures (stop_id, arrival_secs)")
+    db.execute("CREATE INDEX calendar_dates_by_date ON calendar_dates (date)")
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+    os.replace(tmp_path, db_path)
+
+class ScheduleIndex:
+    """
+    Read-only queries against an index built by build_index.
+    Safe to share between the fetch threads: each thread gets its own SQLite connection, which
+    goes away with the thread (e.g. when the worker pool replaces a stuck one).
+    """
+
+    def __init__(self, db_path, time_zone_str):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.time_zone = pytz.timezone(time_zone_str)
+        self.local = threading.local()
+        self.services_by_date = OrderedDict() # Only the last few service days, the board runs for months
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            self.local.db = db
+        return db
+
+    def _active_services(self, service_date):
+        """Returns the service IDs running on a date, worked out once per date."""
+        with self.lock:
+            services = self.services_by_date.get(service_date)
+            if services is not None:
+                self.services_by_date.move_to_end(service_date)
+                return services
+        db = self._connection()
+        date_str = service_date.strftime("%Y%m%d")
+        weekday_bit = 1 << service_date.weekday()
+        services = {
+            service_id for (service_id,) in db.execute(
+                "SELECT service_id FROM calendar WHERE weekdays & ? AND start_date <= ? AND end_date >= ?",
+                (weekday_bit, date_str, date_str),
+            )
+        }
+        for service_id, exception_type in db.execute("SELECT service_id, exception_type FROM calendar_dates WHERE date = ?", (date_str,)):
+            if exception_type == 1:
+                services.add(service_id)
+            else:
+                services.discard(service_id)
+        services = tuple(services)
+        with self.lock:
+            self.services_by_date[service_date] = services
+            if len(self.services_by_date) > SERVICE_DATE_CACHE_SIZE:
+                self.services_by_date.popitem(last=False)
+        return services
+
+    def _service_day_start(self, service_date):
+        # GTFS times count from "noon minus 12h" on the service day, which is midnight except on DST changes
+        noon = self.time_zone.localize(datetime(service_date.year, service_date.month, service_date.day, 12))
+        return noon.timestamp() - 12 * 3600
+
+    def next_departures(self, stop_id, now, limit=4, filter=None, horizon_days=1):
+        """
+        Returns up to `limit` ScheduledDepartures at stop_id after timestamp `now`, in order.
+        `filter` works like parse_query's: a list of route short names or headsigns to keep.
+        Looks `horizon_days` past today, so the first trip of the morning can be found overnight.
+        """
+        db = self._connection()
+        today = datetime.fromtimestamp(now, self.time_zone).date()
+        results = []
+        # Trips from yesterday's service can still be running after midnight
+        for day_offset in range(-1, horizon_days + 1):
+            service_date = today + timedelta(days=day_offset)
+            services = self._active_services(service_date)
+            if not services:
+                continue
+            day_start = self._service_day_start(service_date)
+            query = (
+                "SELECT route_short_name, headsign, trip_id, arrival_secs, departure_secs FROM departures"
+                f" WHERE stop_id = ? AND arrival_secs >= ? AND service_id IN ({','.join('?' * len(services))})"
+            )
+            params = [stop_id, max(0, int(now - day_start)), *services]
+            if filter:
+                marks = ",".join("?" * len(filter))
+                query += f" AND (route_short_name IN ({marks}) OR headsign IN ({marks}))"
+                params += [*filter, *filter]
+            query += " ORDER BY arrival_secs LIMIT ?"
+            params.append(limit)
+            for route_short_name, headsign, trip_id, arrival_secs, departure_secs in db.execute(query, params):
+                arrival_ms = int((day_start + arrival_secs) * 1000)
+                departure_ms = int((day_start + departure_secs) * 1000)
+                results.append(ScheduledDeparture(route_short_name, headsign, trip_id, arrival_ms, departure_ms, 0, 0, False, "scheduled"))
+
+        results.sort(key=lambda departure: departure.scheduled_arrival_time)
+        return results[:limit]
+
+    def close(self):
+        # Other threads' connections can only be closed on their own threads, so they're
+        # dropped here and closed once nothing refers to them
+        db = getattr(self.local, "db", None)
+        if db is not None:
+            db.close()
+        self.local = threading.local()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m components.gtfs_schedule <index.sqlite> <agency prefix>=<gtfs.zip> [...]")
+        sys.exit(1)
+    build_index(sys.argv[1], [tuple(arg.split("=", 1)) for arg in sys.argv[2:]])
+    print(f"Wrote schedule index to {sys.argv[1]}")
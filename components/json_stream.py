@@ -0,0 +1,80 @@
+import codecs
+import json
+import re
+
+# Matches the opening of the array we want to stream, e.g. `"entity": [`
+_ARRAY_START = '"{key}"\\s*:\\s*\\['
+_WHITESPACE_AND_COMMAS = re.compile(r'[\s,]*')
+_decoder = json.JSONDecoder()
+
+def iter_array_items(chunks, key, max_item_bytes=16 * 1024 * 1024):
+    """
+    Incrementally parses a JSON document arriving as byte chunks and yields the items of the
+    first array stored under `key` (e.g. "entity"), one at a time, as they are completed.
+    Items are expected to be objects or arrays, since a bare number split across two chunks
+    can't be told apart from a complete one.
+    Only the current chunk and the item being decoded are held in memory, so peak memory
+    doesn't grow with the size of the document.
+
+    Raises json.JSONDecodeError if the document ends early or an item is not valid JSON.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    array_start = re.compile(_ARRAY_START.format(key=re.escape(key)))
+    chunk_iter = iter(chunks)
+    buffer = ""
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        for chunk in chunk_iter:
+            if chunk:
+                buffer += decoder.decode(chunk)
+                return
+        buffer += decoder.decode(b"", final=True)
+        eof = True
+
+    # Skip ahead to the start of the array
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if eof:
+            raise json.JSONDecodeError(f"No array found for key {key!r}", buffer, 0)
+        # Keep a tail in case the key is split across chunks
+        buffer = buffer[-(len(key) + 16):]
+        read_more()
+
+    # Decode items one by one until the closing bracket
+    pos = 0
+    while True:
+        pos = _WHITESPACE_AND_COMMAS.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if eof:
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            buffer = ""
+            pos = 0
+            read_more()
+            continue
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the item is split across chunks; drop what's done and read more
+            if eof:
+                raise
+            buffer = buffer[pos:]
+            pos = 0
+            if len(buffer) > max_item_bytes:
+                raise json.JSONDecodeError("Array item too large", buffer[:64], 0)
+            read_more()
+            continue
+
+        yield item
+        pos = end
+        # Don't let the consumed part of the buffer pile up
+        if pos > 65536:
+            buffer = buffer[pos:]
+            pos = 0
@@ -0,0 +1,293 @@
+"""
+Runtime metrics for a board or the shared fetcher: frame time per render phase, fetch latency
+and errors per query, data age, and thread state. Exposed in Prometheus text format over HTTP
+(METRICS_PORT) and/or written to a file (METRICS_FILE) for node_exporter's textfile collector.
+
+Nothing here runs unless metrics are turned on: callers hold `metrics = None` and time frames
+with NULL_TIMER, whose methods do nothing.
+"""
+from bisect import bisect_left
+from collections import defaultdict, deque
+import os
+import threading
+import time
+
+FRAME_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 1)
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RECENT_FRAMES = 300 # Frames kept for the debug overlay's percentiles
+
+def error_reason(error):
+    """Short label for a fetch error: the HTTP status if there is one, else the exception type."""
+    status = getattr(error, "status_code", None)
+    if status:
+        return f"http_{status}"
+    return type(error).__name__
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+class Histogram:
+    """A Prometheus-style histogram: cumulative buckets, sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, **labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {self.count}")
+        return lines
+
+class FrameTimer:
+    """
+    Splits one frame into phases. lap(phase) charges the time since the previous lap to
+    `phase`; a phase can be charged several times per frame. done() records the frame.
+    """
+    __slots__ = ("metrics", "totals", "last")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def done(self):
+        self.metrics.observe_frame(self.totals)
+
+class _NullTimer:
+    """Stands in for a FrameTimer when metrics are off."""
+
+    def lap(self, phase):
+        pass
+
+    def done(self):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+class Metrics:
+    """
+    Thread-safe registry of everything the board measures. Fetch metrics are labelled by query
+    key (the stop name on a board, the stop and filter in the fetcher) and stop ID.
+    `clock` is used for data age, so replays report it in replayed time.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.frame_phases: dict[str, Histogram] = {}
+        self.recent_frames = deque(maxlen=RECENT_FRAMES)
+        self.fetch_latency: dict[tuple[str, str], Histogram] = {}
+        self.last_latency: dict[tuple[str, str], float] = {}
+        self.fetches = defaultdict(int) # (query, stop) -> attempts
+        self.fetch_errors = defaultdict(int) # (query, stop, reason) -> errors
+        self.last_success: dict[tuple[str, str], float] = {}
+        self.gauges = [] # (name, help, function returning a number or {labels dict items: value})
+
+    def frame_timer(self):
+        return FrameTimer(self)
+
+    def observe_frame(self, totals):
+        total = sum(totals.values())
+        with self.lock:
+            for phase, seconds in totals.items():
+                histogram = self.frame_phases.get(phase)
+                if histogram is None:
+                    histogram = self.frame_phases[phase] = Histogram(FRAME_BUCKETS)
+                histogram.observe(seconds)
+            self.recent_frames.append(total)
+
+    def record_fetch(self, query, stop, seconds, error=None):
+        """Records one upstream request, and whether it failed."""
+        key = (query, stop)
+        with self.lock:
+            histogram = self.fetch_latency.get(key)
+            if histogram is None:
+                histogram = self.fetch_latency[key] = Histogram(FETCH_BUCKETS)
+            histogram.observe(seconds)
+            self.last_latency[key] = seconds
+            self.fetches[key] += 1
+            if error is None:
+                self.last_success[key] = self.clock()
+            else:
+                self.fetch_errors[(query, stop, error_reason(error))] += 1
+
+    def record_update(self, query, stop):
+        """Marks data as fresh without a fetch, e.g. when it was pushed by the shared fetcher."""
+        with self.lock:
+            self.last_success[(query, stop)] = self.clock()
+
+    def gauge(self, name, help, func):
+        """
+        Registers a value read when metrics are collected. `func` returns a number, or a dict
+        mapping tuples of (label, value) pairs to numbers.
+        """
+        self.gauges.append((name, help, func))
+
+    def frame_percentiles(self):
+        """Returns (p50, p99, frames) over the recent frames, in milliseconds."""
+        with self.lock:
+            frames = sorted(self.recent_frames)
+        if not frames:
+            return 0.0, 0.0, 0
+        return frames[len(frames) // 2] * 1000, frames[min(len(frames) - 1, int(len(frames) * 0.99))] * 1000, len(frames)
+
+    def data_ages(self):
+        now = self.clock()
+        with self.lock:
+            return {key: now - when for key, when in self.last_success.items()}
+
+    def overlay_lines(self):
+        """A few lines summing up the metrics, for the on-screen debug overlay."""
+        p50, p99, frames = self.frame_percentiles()
+        lines = [f"frame p50 {p50:.1f} ms, p99 {p99:.1f} ms ({frames})"]
+        ages = self.data_ages()
+        with self.lock:
+            errors = defaultdict(int)
+            for (query, stop, reason), count in self.fetch_errors.items():
+                errors[(query, stop)] += count
+            for key in sorted(set(self.fetches) | set(self.last_success)):
+                age = ages.get(key)
+                line = f"{key[0]}: " + (f"{age:.0f} s old" if age is not None else "no data")
+                if key in self.last_latency:
+                    line += f", {self.last_latency[key] * 1000:.0f} ms, {errors[key]} errors"
+                lines.append(line)
+        lines.append(f"threads: {threading.active_count()}")
+        return lines
+
+    def render(self):
+        """Returns every metric in Prometheus text format."""
+        ages = self.data_ages()
+        lines = []
+        with self.lock:
+            lines.append("# HELP subway_frame_seconds Time spent drawing a frame, by phase")
+            lines.append("# TYPE subway_frame_seconds histogram")
+            for phase, histogram in sorted(self.frame_phases.items()):
+                lines.extend(histogram.render("subway_frame_seconds", phase=phase))
+
+            lines.append("# HELP subway_fetch_seconds Latency of upstream requests")
+            lines.append("# TYPE subway_fetch_seconds histogram")
+            for (query, stop), histogram in sorted(self.fetch_latency.items()):
+                lines.extend(histogram.render("subway_fetch_seconds", query=query, stop=stop))
+
+            lines.append("# HELP subway_fetches_total Upstream requests made")
+            lines.append("# TYPE subway_fetches_total counter")
+            for (query, stop), count in sorted(self.fetches.items()):
+                lines.append(f"subway_fetches_total{_labels(query=query, stop=stop)} {count}")
+
+            lines.append("# HELP subway_fetch_errors_total Upstream requests that failed, by reason")
+            lines.append("# TYPE subway_fetch_errors_total counter")
+            for (query, stop, reason), count in sorted(self.fetch_errors.items()):
+                lines.append(f"subway_fetch_errors_total{_labels(query=query, stop=stop, reason=reason)} {count}")
+
+        lines.append("# HELP subway_data_age_seconds Time since the last successful fetch")
+        lines.append("# TYPE subway_data_age_seconds gauge")
+        for (query, stop), age in sorted(ages.items()):
+            lines.append(f"subway_data_age_seconds{_labels(query=query, stop=stop)} {age:.1f}")
+
+        lines.append("# HELP subway_threads Live Python threads")
+        lines.append("# TYPE subway_threads gauge")
+        lines.append(f"subway_threads {threading.active_count()}")
+
+        for name, help, func in self.gauges:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            value = func()
+            if isinstance(value, dict):
+                for labels, item in sorted(value.items()):
+                    lines.append(f"{name}{_labels(**dict(labels))} {item}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves Metrics.render() at /metrics on a background thread."""
+
+    def __init__(self, metrics, port, host="0.0.0.0"):
+        # Imported here, since boards without METRICS_PORT never need it and it slows startup
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Scrapes every few seconds would flood the console
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics at http://{host}:{port}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MetricsFile:
+    """
+    Rewrites `path` with Metrics.render() every `interval` seconds on a background thread.
+    Each write goes to a temporary file that is renamed over the old one, so readers never
+    see half a file.
+    """
+
+    def __init__(self, metrics, path, interval=15):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, name="metrics-file", daemon=True).start()
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not write metrics file {self.path}: {e}")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        self.write()
+
+def start_exporters(metrics, port=None, path=None):
+    """Starts the exporters configured in .env. Returns them, for closing at shutdown."""
+    exporters = []
+    if port:
+        try:
+            exporters.append(MetricsServer(metrics, int(port)))
+        except OSError as e:
+            print(f"Could not serve metrics on port {port}: {e}")
+    if path:
+        exporters.append(MetricsFile(metrics, path))
+    return exporters
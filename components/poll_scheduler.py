@@ -0,0 +1,79 @@
+import random
+
+class PollScheduler:
+    """
+    Decides when each stop should next be polled, based on that stop's own data:
+    - an arrival under `imminent_seconds` away: poll every `fast_interval`, so "Now" is accurate
+    - the next trip more than `lead_seconds` away (e.g. overnight): sleep until `lead_seconds`
+      before it, capped at `max_interval`
+    - nothing found at all: try again after `no_service_interval`
+    - otherwise: the regular `base_interval`
+    Failed polls (including HTTP 429) back off exponentially with full jitter, honouring
+    Retry-After when the server sends one.
+    """
+
+    def __init__(self, base_interval=35, fast_interval=15, imminent_seconds=180, lead_seconds=20*60,
+                 max_interval=2*60*60, no_service_interval=30*60, backoff_base=10, backoff_max=15*60):
+        self.base_interval = base_interval
+        self.fast_interval = fast_interval
+        self.imminent_seconds = imminent_seconds
+        self.lead_seconds = lead_seconds
+        self.max_interval = max_interval
+        self.no_service_interval = no_service_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.next_poll: dict[str, float] = {}
+        self.failures: dict[str, int] = {}
+
+    def add(self, key, when=0):
+        """Registers a stop, due at `when` (immediately by default)."""
+        self.next_poll.setdefault(key, when)
+        self.failures.setdefault(key, 0)
+
+    def remove(self, key):
+        self.next_poll.pop(key, None)
+        self.failures.pop(key, None)
+
+    def due(self, now):
+        """Returns the stops whose next poll is due at `now`."""
+        return [key for key, when in self.next_poll.items() if when <= now]
+
+    def next_due(self):
+        """Returns the earliest next poll time across all stops, or None."""
+        return min(self.next_poll.values(), default=None)
+
+    def interval_for(self, next_arrival, now):
+        """Works out how long to wait before polling a stop whose next arrival is at `next_arrival`."""
+        if next_arrival is None:
+            return self.no_service_interval
+        time_until = next_arrival - now
+        if time_until < self.imminent_seconds:
+            return self.fast_interval
+        if time_until > self.lead_seconds:
+            # Far off: nothing will change until shortly before it arrives
+            return max(self.base_interval, min(time_until - self.lead_seconds, self.max_interval))
+        return self.base_interval
+
+    def record_success(self, key, next_arrival, now):
+        if key not in self.next_poll:
+            return # Removed while it was being polled, so it stays removed
+        self.failures[key] = 0
+        self.next_poll[key] = now + self.interval_for(next_arrival, now)
+
+    def retry_now(self, key, now):
+        """Clears a stop's backoff and makes it due at `now`, e.g. once its upstream is back."""
+        if key not in self.next_poll:
+            return
+        self.failures[key] = 0
+        self.next_poll[key] = now
+
+    def record_failure(self, key, now, retry_after=None):
+        if key not in self.next_poll:
+            return
+        failures = self.failures.get(key, 0) + 1
+        self.failures[key] = failures
+        # Full jitter, so several boards (or stops) don't retry in lockstep
+        delay = random.uniform(self.backoff_base, min(self.backoff_max, self.backoff_base * 2 ** failures))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self.next_poll[key] = now + delay
@@ -0,0 +1,327 @@
+"""
+Record and replay of upstream traffic, so refreshes can be reproduced offline.
+
+Recording wraps the OneBusAway client and the alerts feed's requests.Session, and writes every
+response (or error) with its timestamp to a gzipped JSON-lines file. Set RECORD_FILE in .env
+for main.py or fetcher.py to record.
+
+Replaying serves those responses back, on a VirtualClock, to the same parse_query and
+fetch_alerts code. Each request gets the last response recorded for it at or before the
+virtual time. Set REPLAY_FILE (and REPLAY_SPEED) in .env to replay on the board, or replay
+headless, as fast as possible, to get a deterministic log of what the board would have shown:
+
+    python -m components.replay recording.jsonl.gz [--speed 60] [--stop 1_11060|9,43,60 ...]
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from components.alerts_feed import DEFAULT_ALERTS_URL, AlertsFeed
+from components.arrival_record import SCHEDULED
+from components.transit_data import TransitData, query_key
+from datetime import datetime
+import argparse
+import base64
+import gzip
+import json
+import pytz
+import random
+import requests
+import threading
+import time
+
+# Alert response headers worth keeping, for revalidation
+_ALERT_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+START_SLACK_SECONDS = 5
+
+class VirtualClock:
+    """
+    Time that starts at `start` and runs `speed` times faster than real time. With speed=0 it
+    only moves when sleep() or advance_to() is called, for replaying as fast as possible.
+    """
+
+    def __init__(self, start, speed=1.0):
+        self.start = start
+        self.speed = speed
+        self.real_start = time.monotonic()
+        self.offset = 0.0
+        self.lock = threading.Lock()
+
+    def time(self):
+        if self.speed:
+            return self.start + (time.monotonic() - self.real_start) * self.speed
+        return self.start + self.offset
+
+    def sleep(self, seconds):
+        if self.speed:
+            time.sleep(max(0, seconds) / self.speed)
+        else:
+            with self.lock:
+                self.offset += max(0, seconds)
+
+    def advance_to(self, when):
+        self.sleep(when - self.time())
+
+class TrafficRecorder:
+    """
+    Appends timestamped upstream responses to a gzipped JSON-lines file. Thread-safe.
+    `clock` stamps the entries; a VirtualClock's makes a recording of simulated traffic.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.file = gzip.open(path, "at")
+        self.lock = threading.Lock()
+
+    def write(self, entry):
+        entry["t"] = self.clock()
+        line = json.dumps(entry, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            # Flush each entry, so a board that gets killed still leaves a usable recording
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def _error_entry(entry, error):
+    entry["error"] = str(error)
+    entry["status"] = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if response is not None and response.headers.get("retry-after"):
+        entry["retry_after"] = response.headers.get("retry-after")
+    return entry
+
+class _RecordingArrivals:
+    def __init__(self, arrival_and_departure, recorder):
+        self.arrival_and_departure = arrival_and_departure
+        self.recorder = recorder
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        entry = {"kind": "oba", "stop": stop_id, "minutes_after": minutes_after}
+        try:
+            response = self.arrival_and_departure.list(stop_id=stop_id, minutes_after=minutes_after, minutes_before=minutes_before)
+        except Exception as e:
+            self.recorder.write(_error_entry(entry, e))
+            raise
+        # Only the arrivals are used; the references (stops, routes, trips...) are most of the size
+        data = response.to_dict(mode="json")
+        data.get("data", {}).pop("references", None)
+        entry["response"] = data
+        self.recorder.write(entry)
+        return response
+
+class RecordingClient:
+    """Wraps an OnebusawaySDK client, recording every arrival_and_departure.list call."""
+
+    def __init__(self, client, recorder):
+        self.arrival_and_departure = _RecordingArrivals(client.arrival_and_departure, recorder)
+
+class RecordingSession:
+    """Wraps a requests.Session for AlertsFeed, recording every response body."""
+
+    def __init__(self, session, recorder):
+        self.session = session
+        self.recorder = recorder
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        entry = {"kind": "alerts", "url": url}
+        try:
+            # Read the whole body here; iter_content then serves it from memory
+            response = self.session.get(url, headers=headers, timeout=timeout)
+        except Exception as e:
+            self.recorder.write(_error_entry(entry, e))
+            raise
+        entry["status"] = response.status_code
+        entry["headers"] = {name: response.headers[name] for name in _ALERT_HEADERS if name in response.headers}
+        entry["body"] = base64.b64encode(response.content).decode()
+        self.recorder.write(entry)
+        return response
+
+    def close(self):
+        self.session.close()
+
+class Recording:
+    """A recording loaded into memory, indexed by request."""
+
+    def __init__(self, path):
+        self.entries = defaultdict(list) # Request -> entries in time order
+        with gzip.open(path, "rt") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["kind"] == "oba":
+                    self.entries[("oba", entry["stop"], entry["minutes_after"])].append(entry)
+                else:
+                    self.entries[("alerts",)].append(entry)
+        for entries in self.entries.values():
+            entries.sort(key=lambda entry: entry["t"])
+        self.times = {request: [entry["t"] for entry in entries] for request, entries in self.entries.items()}
+
+    def start_time(self):
+        return min((times[0] for times in self.times.values()), default=time.time())
+
+    def end_time(self):
+        return max((times[-1] for times in self.times.values()), default=time.time())
+
+    def stops(self):
+        return sorted({request[1] for request in self.entries if request[0] == "oba"})
+
+    def lookup(self, request, now):
+        """Returns the last entry for `request` recorded at or before `now`, or None."""
+        times = self.times.get(request)
+        if not times:
+            return None
+        i = bisect_right(times, now)
+        if i == 0:
+            # A board's first requests go out a moment apart, so allow for that at the start
+            return self.entries[request][0] if times[0] - now <= START_SLACK_SECONDS else None
+        return self.entries[request][i - 1]
+
+class NoRateLimit:
+    """Stands in for a TokenBucket, since replays don't touch the real API."""
+
+    def acquire(self, tokens=1):
+        pass
+
+class ReplayError(requests.exceptions.RequestException):
+    """
+    A recorded upstream error, or a request with nothing recorded yet. It is a RequestException
+    so callers handle it like the network error it stands in for.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+        if retry_after is not None:
+            self.response = _ReplayResponse(status_code, {"retry-after": retry_after}, b"")
+
+class _ReplayArrivals:
+    def __init__(self, recording, clock):
+        self.recording = recording
+        self.clock = clock
+
+    def list(self, stop_id, minutes_after, minutes_before=0):
+        # Imported here so recording doesn't need the SDK's model classes
+        from onebusaway.types.arrival_and_departure_list_response import ArrivalAndDepartureListResponse
+        entry = self.recording.lookup(("oba", stop_id, minutes_after), self.clock())
+        if entry is None:
+            raise ReplayError(f"Nothing recorded yet for {stop_id} ({minutes_after} min)")
+        if "error" in entry:
+            raise ReplayError(entry["error"], entry.get("status"), entry.get("retry_after"))
+        return ArrivalAndDepartureListResponse.construct(**entry["response"])
+
+class ReplayClient:
+    """Stands in for OnebusawaySDK, answering from a Recording at the clock's current time."""
+
+    def __init__(self, recording, clock):
+        self.arrival_and_departure = _ReplayArrivals(recording, clock)
+
+class _ReplayResponse:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ReplayError(f"HTTP {self.status_code} (replayed)", self.status_code)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+class ReplaySession:
+    """Stands in for the alerts feed's requests.Session, honouring If-None-Match like a server would."""
+
+    def __init__(self, recording, clock):
+        self.recording = recording
+        self.clock = clock
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        entry = self.recording.lookup(("alerts",), self.clock())
+        if entry is None:
+            raise ReplayError("Nothing recorded yet for the alerts feed")
+        if "error" in entry:
+            raise ReplayError(entry["error"], entry.get("status"))
+        etag = entry["headers"].get("ETag")
+        if etag and headers and headers.get("If-None-Match") == etag:
+            return _ReplayResponse(304, entry["headers"], b"")
+        return _ReplayResponse(entry["status"], entry["headers"], base64.b64decode(entry["body"]))
+
+    def close(self):
+        pass
+
+def _describe(rows, now):
+    parts = []
+    for (route, headsign), records in rows.items():
+        minutes = ",".join(
+            ("~" if record.lateness == SCHEDULED else "") + str(max(0, int((record.arrival_epoch - now) // 60)))
+            for record in records
+        )
+        parts.append(f"{route} {headsign}: {minutes}")
+    return "; ".join(parts) or "(no arrivals)"
+
+def replay(recording, queries, time_zone, speed=0, alerts_refresh_rate=60, alert_thresholds=("SEVERE",), out=print):
+    """
+    Runs TransitData and AlertsFeed over a recording on a VirtualClock, with the board's poll
+    schedule, and reports every refresh through `out`. With speed=0 it runs as fast as possible.
+    """
+    random.seed(0) # Backoff jitter, so runs are repeatable
+    clock = VirtualClock(recording.start_time(), speed)
+    end = recording.end_time()
+    transit_data = TransitData(ReplayClient(recording, clock.time), time_zone, NoRateLimit(), clock=clock.time, max_workers=1)
+    for stop, stop_filter in queries:
+        transit_data.add_query(query_key(stop, stop_filter), stop, stop_filter)
+    alerts_feed = AlertsFeed(DEFAULT_ALERTS_URL, session=ReplaySession(recording, clock.time), clock=clock.time)
+    next_alerts = clock.time()
+    stats = {"polls": 0, "alert_fetches": 0}
+
+    while clock.time() <= end:
+        now = clock.time()
+        stamp = datetime.fromtimestamp(now, time_zone).strftime("%H:%M:%S")
+        due = transit_data.poll_scheduler.due(now)
+        if due:
+            for key in transit_data.fetch(due):
+                stats["polls"] += 1
+                out(f"{stamp} {key}: {_describe(transit_data.arrivals[key], now)}")
+        if now >= next_alerts:
+            stats["alert_fetches"] += 1
+            try:
+                alerts = alerts_feed.fetch_alerts(list(alert_thresholds))
+                if alerts is not None:
+                    out(f"{stamp} alerts: {alerts}")
+            except (ReplayError, ValueError) as e:
+                out(f"{stamp} alerts error: {e}")
+            next_alerts = now + alerts_refresh_rate
+        next_due = transit_data.poll_scheduler.next_due()
+        clock.advance_to(min(next_alerts, next_due if next_due is not None else next_alerts))
+
+    transit_data.shutdown()
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recording of upstream traffic without a display.")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=0, help="times faster than real time (default: as fast as possible)")
+    parser.add_argument("--stop", action="append", default=[], help="stop ID, optionally followed by | and a comma-separated filter (default: every recorded stop)")
+    parser.add_argument("--time-zone", default="America/Los_Angeles")
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    queries = []
+    for entry in args.stop or recording.stops():
+        stop, _, stop_filter = entry.partition("|")
+        queries.append((stop, stop_filter.split(",") if stop_filter else None))
+    started = time.perf_counter()
+    stats = replay(recording, queries, pytz.timezone(args.time_zone), speed=args.speed)
+    span = (recording.end_time() - recording.start_time()) / 3600
+    print(f"Replayed {span:.1f} h of traffic ({stats['polls']} stop refreshes, {stats['alert_fetches']} alert fetches) in {time.perf_counter() - started:.1f} s")
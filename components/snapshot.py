@@ -0,0 +1,108 @@
+from components.arrival_record import ArrivalRecord
+import json
+import os
+import tempfile
+import time
+
+SNAPSHOT_VERSION = 3
+
+def encode_rows(rows):
+    """Turns one stop's rows (as parse_query returns them) into plain JSON-able lists."""
+    return [[route, headsign, [record.to_list() for record in records]] for (route, headsign), records in rows.items()]
+
+def decode_rows(rows, now=None):
+    """Reverses encode_rows, dropping arrivals that left over a minute before `now`."""
+    if now is None:
+        now = time.time()
+    stop_rows = {}
+    for route, headsign, records in rows:
+        records = [ArrivalRecord.from_list(values) for values in records]
+        records = [record for record in records if record.arrival_epoch > now - 60]
+        if records:
+            stop_rows[(route, headsign)] = records
+    return stop_rows
+
+def _snapshot_data(stop_arrival_data, alerts):
+    """The part of a snapshot that changes with the data, as plain JSON-able values."""
+    return {
+        "arrivals": {mode: encode_rows(rows) for mode, rows in stop_arrival_data.items()},
+        "alerts": list(alerts),
+    }
+
+def _write_snapshot(path, data):
+    snapshot = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), **data}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def save_snapshot(path, stop_arrival_data, alerts):
+    """
+    Atomically writes the last good arrivals and alerts to `path`, so the next boot can draw
+    them straight away. Written to a temporary file and swapped in with os.replace, so a
+    power cut mid-write never leaves a half-written snapshot behind.
+    """
+    _write_snapshot(path, _snapshot_data(stop_arrival_data, alerts))
+
+class SnapshotWriter:
+    """
+    Saves snapshots to `path` like save_snapshot, but only when the data changed and at most
+    once every `min_interval` seconds, since each save is an fsync on what is often an SD card.
+    A change skipped for the interval is written by the first save() after it, and
+    save(..., force=True) (e.g. on shutdown) writes any change straight away.
+    """
+
+    def __init__(self, path, min_interval=60):
+        self.path = path
+        self.min_interval = min_interval
+        self.last_data = None
+        self.last_saved = None
+        self.saves = 0
+
+    def save(self, stop_arrival_data, alerts, force=False):
+        """Returns whether the snapshot was written."""
+        data = _snapshot_data(stop_arrival_data, alerts)
+        if data == self.last_data:
+            return False
+        now = time.monotonic()
+        if not force and self.last_saved is not None and now - self.last_saved < self.min_interval:
+            return False
+        _write_snapshot(self.path, data)
+        self.last_data = data
+        self.last_saved = now
+        self.saves += 1
+        return True
+
+def load_snapshot(path, now=None):
+    """
+    Reads a snapshot written by save_snapshot. Returns a dict with "arrivals" (per stop name,
+    in the same shape parse_query returns) and "alerts", or None if there is no usable
+    snapshot. Arrivals that have already left are dropped; the rest are
+    recomputed against the current clock when drawn, since records store absolute times.
+    """
+    if now is None:
+        now = time.time()
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Could not read snapshot {path}: {e}")
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    arrivals = {mode: decode_rows(rows, now) for mode, rows in snapshot["arrivals"].items()}
+
+    return {
+        "saved_at": snapshot["saved_at"],
+        "arrivals": arrivals,
+        "alerts": snapshot["alerts"],
+    }
@@ -0,0 +1,96 @@
+"""
+The stops a board shows and how routes are drawn, read from a JSON file (STOPS_FILE in .env,
+stops.json by default):
+
+    {
+        "stops": [
+            {"name": "LYNNWOOD", "stop": "40_99603"},
+            {"name": "BUS_BROADWAY", "stop": "1_11060", "filter": ["9", "43", "60"]}
+        ],
+        "routes": [
+            {"match": "1 Line", "label": "1", "color": [41, 130, 64]}
+        ],
+        "default_route_color": [255, 116, 65]
+    }
+
+Stops are shown in this order. A stop's optional "filter" keeps only the arrivals whose route
+or headsign is one of its entries (see TransitData.parse_query), and "name" identifies it in
+snapshots and metrics (it defaults to the stop ID and filter). A route is drawn with the first
+style whose "match" is part of its name, and the optional "label" replaces the name in its
+circle; routes that match nothing get default_route_color. Any other keys, like "description",
+are ignored.
+"""
+import json
+
+DEFAULT_STOPS_FILE = "stops.json"
+DEFAULT_ROUTE_COLOR = (255, 116, 65)
+
+def _color(value, where):
+    if not (isinstance(value, list) and len(value) == 3 and all(isinstance(c, int) and 0 <= c <= 255 for c in value)):
+        raise ValueError(f"{where}: a color must be [red, green, blue], got {value!r}")
+    return tuple(value)
+
+class RouteStyles:
+    """Works out the label and circle color of a route. Memoized, since there are only a few routes."""
+
+    def __init__(self, styles=(), default_color=DEFAULT_ROUTE_COLOR):
+        self.styles = list(styles) # (match, label or None, color)
+        self.default_color = default_color
+        self.cache: dict[str, tuple[str, tuple]] = {}
+
+    def get(self, route_number):
+        """Returns (label, color) for a route name like "1 Line" or "43"."""
+        style = self.cache.get(route_number)
+        if style is None:
+            style = (route_number, self.default_color)
+            for match, label, color in self.styles:
+                if match in route_number:
+                    style = (label or route_number, color)
+                    break
+            self.cache[route_number] = style
+        return style
+
+class StopRegistry:
+    """The stop queries, as (stop ID, name, filter) in display order, and the route styles."""
+
+    def __init__(self, queries, route_styles):
+        self.queries = queries
+        self.route_styles = route_styles
+
+def parse_stop_registry(data, where="stops"):
+    """Checks and builds a StopRegistry from the decoded JSON. Raises ValueError if it's invalid."""
+    if not isinstance(data, dict) or not isinstance(data.get("stops"), list) or not data["stops"]:
+        raise ValueError(f"{where}: needs a non-empty list of \"stops\"")
+
+    queries = []
+    names = set()
+    for i, entry in enumerate(data["stops"]):
+        if not isinstance(entry, dict) or not isinstance(entry.get("stop"), str):
+            raise ValueError(f"{where}: stop {i + 1} needs a \"stop\" ID")
+        stop_filter = entry.get("filter") or None
+        if stop_filter is not None and not (isinstance(stop_filter, list) and all(isinstance(f, str) for f in stop_filter)):
+            raise ValueError(f"{where}: the filter of stop {entry['stop']} must be a list of strings")
+        name = entry.get("name") or (entry["stop"] + ("|" + ",".join(stop_filter) if stop_filter else ""))
+        if name in names:
+            raise ValueError(f"{where}: more than one stop is named {name!r}")
+        names.add(name)
+        queries.append((entry["stop"], name, stop_filter))
+
+    styles = []
+    for i, entry in enumerate(data.get("routes", [])):
+        if not isinstance(entry, dict) or not isinstance(entry.get("match"), str):
+            raise ValueError(f"{where}: route style {i + 1} needs a \"match\"")
+        styles.append((entry["match"], entry.get("label"), _color(entry.get("color"), f"{where}: route {entry['match']!r}")))
+    default_color = DEFAULT_ROUTE_COLOR
+    if "default_route_color" in data:
+        default_color = _color(data["default_route_color"], f"{where}: default_route_color")
+    return StopRegistry(queries, RouteStyles(styles, default_color))
+
+def load_stop_registry(path=DEFAULT_STOPS_FILE):
+    """Reads a stops file. Raises OSError if it can't be read and ValueError if it's invalid."""
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from e
+    return parse_stop_registry(data, path)
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+class TextCache:
+    """
+    Bounded LRU cache of rendered text surfaces, keyed by (font, text, color, antialias).
+    Most of what the board draws (route numbers, headsigns, minute counts, the clock) only
+    changes once a minute, so steady-state frames can blit cached surfaces instead of
+    rasterizing glyphs every frame.
+
+    Cached surfaces are shared: callers must not draw on them or change their alpha.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        """Drop-in replacement for font.render(text, antialias, color)."""
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            # Evict the least recently used surface
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def stats(self):
+        """Returns a one-line summary of the hit/miss counters."""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0
+        return f"text cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {len(self.surfaces)}/{self.max_entries} entries"
+
+# Shared by main.py and every component, so the same text is only ever rendered once
+text_cache = TextCache()
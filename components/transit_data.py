@@ -0,0 +1,205 @@
+from collections import defaultdict
+from components.arrival_record import ArrivalRecord
+from components.fetch_engine import FetchEngine
+from components.fetch_supervisor import CircuitBreaker, CircuitOpenError, is_upstream_failure
+from components.poll_scheduler import PollScheduler
+from datetime import datetime
+import sqlite3
+import time
+
+def query_key(stop, filter=None):
+    """
+    Identifies a stop query by what it actually asks OneBusAway for, so boards that show the
+    same stop with the same filter share one query. Filter order doesn't matter.
+    """
+    if not filter:
+        return stop
+    return stop + "|" + ",".join(sorted(filter))
+
+def next_arrival(rows):
+    """Returns the earliest arrival time in a stop's rows, or None if there are none."""
+    return min((records[0].arrival_epoch for records in rows.values() if records), default=None)
+
+def retry_after(error):
+    """
+    Returns how long to hold off after an error: the Retry-After delay of an HTTP 429, or how
+    long the circuit breaker stays open. None if the error doesn't say.
+    """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    if getattr(error, "status_code", None) != 429 or response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TransitData:
+    """
+    Fetches, parses and keeps the arrivals for a set of stop queries, each polled on its own
+    PollScheduler schedule. Doesn't touch pygame, so the same code runs in a board and in the
+    standalone fetcher (see components/fetch_daemon.py).
+
+    `arrivals` holds the last good rows per query key, in the shape parse_query returns.
+    `clock` returns the current timestamp; replays (components/replay.py) pass a virtual one.
+    With `metrics` (components/metrics.py), every request's latency and outcome is recorded.
+
+    A query that takes longer than `fetch_deadline` seconds is abandoned, and after a run of
+    failures OneBusAway's circuit breaker fails queries fast (see components/fetch_supervisor.py),
+    so a hung or down API never holds up a refresh.
+    """
+
+    def __init__(self, client, time_zone, rate_limiter, schedule_index=None, base_interval=35,
+                 schedule_fallback_count=8, max_workers=8, clock=time.time, metrics=None, fetch_deadline=20):
+        self.client = client
+        self.clock = clock
+        self.metrics = metrics
+        self.time_zone = time_zone
+        self.schedule_index = schedule_index
+        self.schedule_fallback_count = schedule_fallback_count
+        self.queries: dict[str, tuple[str, list[str] | None]] = {}
+        self.arrivals: dict[str, dict[tuple[str, str], list[ArrivalRecord]]] = {}
+        self.poll_scheduler = PollScheduler(base_interval=base_interval)
+        self.breaker = CircuitBreaker("OneBusAway", clock=clock)
+        # Stops backing off because OneBusAway was down (or the circuit was open), rather than
+        # because of anything about the stop itself
+        self.waiting_on_upstream: set[str] = set()
+        self.fetch_engine = FetchEngine(rate_limiter, max_workers=max_workers, deadline=fetch_deadline, breaker=self.breaker)
+
+    def add_query(self, key, stop, filter=None):
+        self.queries[key] = (stop, filter)
+        self.poll_scheduler.add(key)
+
+    def remove_query(self, key):
+        self.queries.pop(key, None)
+        self.arrivals.pop(key, None)
+        self.waiting_on_upstream.discard(key)
+        self.poll_scheduler.remove(key)
+
+    def parse_query(self, stop, filter=None) -> dict[tuple[str, str], list[ArrivalRecord]]:
+        # Query for the next 35 minutes
+        response = self.client.arrival_and_departure.list(stop_id=stop, minutes_after=35, minutes_before=0)
+        arrivals_and_departures = response.data.entry.arrivals_and_departures
+        if filter:
+            arrivals_and_departures = [x for x in arrivals_and_departures if (x.route_short_name in filter) or (x.trip_headsign in filter)]
+
+        if not arrivals_and_departures:
+            # Nothing soon (e.g. overnight): show just the first upcoming departure. The poll
+            # scheduler then leaves this stop alone until shortly before it arrives
+            if self.schedule_index:
+                # Look it up locally instead of spending an API call on schedule data
+                all_departures = self.schedule_index.next_departures(stop, self.clock(), limit=1, filter=filter)
+            else:
+                # Look ahead over the next 7 hours
+                response = self.client.arrival_and_departure.list(stop_id=stop, minutes_after=420, minutes_before=0)
+                all_departures = response.data.entry.arrivals_and_departures
+                if filter:
+                    all_departures = [x for x in all_departures if (x.route_short_name in filter) or (x.trip_headsign in filter)]
+            arrivals_and_departures = all_departures[:1]
+
+        return self.group_arrivals(arrivals_and_departures, filter)
+
+    def _timed_query(self, key, stop, filter=None):
+        # Only the request and parse are timed, not the wait for the rate limiter
+        started = time.perf_counter()
+        try:
+            rows = self.parse_query(stop, filter)
+        except Exception as e:
+            self.metrics.record_fetch(key, stop, time.perf_counter() - started, e)
+            raise
+        self.metrics.record_fetch(key, stop, time.perf_counter() - started)
+        return rows
+
+    def scheduled_arrivals(self, stop, filter=None) -> dict[tuple[str, str], list[ArrivalRecord]]:
+        """Same as parse_query, but from the local GTFS schedule instead of OneBusAway."""
+        departures = self.schedule_index.next_departures(stop, self.clock(), limit=self.schedule_fallback_count, filter=filter)
+        return self.group_arrivals(departures, filter)
+
+    def group_arrivals(self, arrivals_and_departures, filter=None) -> dict[tuple[str, str], list[ArrivalRecord]]:
+        """Groups OneBusAway (or scheduled) arrivals into rows by route and headsign."""
+        arr = defaultdict(list)
+        for arr_dep in arrivals_and_departures:
+            if filter != None and len(filter) > 0:
+                if arr_dep.trip_headsign not in filter and arr_dep.route_short_name not in filter:
+                    continue
+            headsign = arr_dep.trip_headsign
+            arr[(
+                arr_dep.route_short_name,
+                headsign
+            )].append(ArrivalRecord.from_oba(arr_dep, self.time_zone))
+        return dict(arr)
+
+    def prepare_fetch(self, keys):
+        """
+        Snapshots the (key, stop, filter) of each given query that still exists, for run_fetch.
+        Call it on the thread that adds and removes queries.
+        """
+        return [(key, *self.queries[key]) for key in keys if key in self.queries]
+
+    def run_fetch(self, jobs):
+        """
+        Queries the stops of `jobs` (from prepare_fetch) concurrently and returns each one's rows
+        or exception, in order. Only reads the snapshot, so it can run on any thread.
+        """
+        if self.metrics:
+            calls = [(self._timed_query, job) for job in jobs]
+        else:
+            calls = [(self.parse_query, job[1:]) for job in jobs]
+        return self.fetch_engine.fetch_all(calls)
+
+    def apply_fetch(self, jobs, results):
+        """
+        Stores the results of run_fetch in `arrivals` and schedules each stop's next poll.
+        Returns the keys whose rows were replaced (with live data, or scheduled data if the API
+        failed). Call it on the same thread as prepare_fetch.
+        """
+        now = self.clock()
+        updated = []
+        recovered = False
+        for (key, stop, filter), response in zip(jobs, results):
+            if self.queries.get(key) != (stop, filter):
+                # Removed while it was being fetched
+                continue
+            if isinstance(response, Exception):
+                # A 429's Retry-After is honoured as it is
+                if isinstance(response, CircuitOpenError) or (is_upstream_failure(response) and retry_after(response) is None):
+                    self.waiting_on_upstream.add(key)
+                else:
+                    self.waiting_on_upstream.discard(key)
+                time_str = datetime.fromtimestamp(now, self.time_zone).strftime("%H:%M")
+                print(f"An error occurred at {time_str} while fetching transit data for {key}: {response}")
+                self.poll_scheduler.record_failure(key, now, retry_after(response))
+                if not self.schedule_index:
+                    # Keep showing the last good data for this stop
+                    continue
+                # Show scheduled times (in grey) until the API comes back
+                try:
+                    self.arrivals[key] = self.scheduled_arrivals(stop, filter)
+                    updated.append(key)
+                except sqlite3.Error as e:
+                    print(f"An error occurred while reading the GTFS schedule index: {e}")
+                continue
+            self.arrivals[key] = response
+            self.poll_scheduler.record_success(key, next_arrival(response), now)
+            self.waiting_on_upstream.discard(key)
+            recovered = True
+            updated.append(key)
+        if recovered and self.waiting_on_upstream and self.breaker.state == CircuitBreaker.CLOSED:
+            # OneBusAway is back. When the circuit was half open only one stop was let through, and
+            # the others failed fast or are backed off from the outage, so poll them again now
+            for key in self.waiting_on_upstream:
+                self.poll_scheduler.retry_now(key, now)
+            self.waiting_on_upstream.clear()
+        return updated
+
+    def fetch(self, keys):
+        """
+        Fetches the given queries concurrently and updates `arrivals`. Returns the keys whose
+        rows were replaced (with live data, or scheduled data if the API failed).
+        """
+        jobs = self.prepare_fetch(keys)
+        return self.apply_fetch(jobs, self.run_fetch(jobs))
+
+    def shutdown(self):
+        self.fetch_engine.shutdown()
@@ -1,8 +0,0 @@
-from enum import Enum
-
-class TransitMode(Enum):
-    ANGLE = "ANGLE_LAKE"
-    LYNNWOOD = "LYNNWOOD"
-    BUS_OLIVE = "BUS_OLIVE"
-    BUS_BROADWAY = "BUS_BROADWAY"
-    STREETCAR = "STREETCAR"
\ No newline at end of file
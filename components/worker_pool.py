@@ -0,0 +1,125 @@
+"""
+Long-lived background threads, so the board's refreshes (and the deadlines that bound them)
+reuse the same threads instead of starting a new one every time.
+"""
+import heapq
+import queue
+import threading
+import time
+import traceback
+
+class WorkerPool:
+    """
+    Runs submitted jobs on `workers` daemon threads, in the order they were submitted.
+    A job that raises is reported and doesn't take its worker down with it.
+
+    If a job gets stuck (see FetchSupervisor), replace_stuck() starts an extra worker so the
+    queue keeps moving; the next worker to finish a job then retires, bringing the pool back
+    to its size. close() stops the workers once they're idle.
+    """
+
+    def __init__(self, name, workers=2):
+        self.name = name
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.retiring = 0 # Workers to stop once they finish their current job
+        self.started = 0
+        self.closed = False
+        for _ in range(workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        self.started += 1
+        thread = threading.Thread(target=self._run, name=f"{self.name}-{self.started}", daemon=True)
+        self.threads.add(thread)
+        thread.start()
+
+    def submit(self, func, *args):
+        if self.closed:
+            return
+        self.jobs.put((func, args))
+
+    def replace_stuck(self):
+        """Adds a worker in place of one that is stuck on a job."""
+        with self.lock:
+            if self.closed:
+                return
+            self.retiring += 1
+            self._start_worker()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            func, args = job
+            try:
+                func(*args)
+            except Exception:
+                print(f"A background job failed in {threading.current_thread().name}:")
+                traceback.print_exc()
+            with self.lock:
+                if self.retiring:
+                    self.retiring -= 1
+                    break
+        with self.lock:
+            self.threads.discard(threading.current_thread())
+
+    def size(self):
+        """Live worker threads, including any stuck ones."""
+        with self.lock:
+            return len(self.threads)
+
+    def close(self, timeout=1):
+        """Stops the idle workers, waiting up to `timeout` seconds for busy ones to finish."""
+        with self.lock:
+            self.closed = True
+            threads = list(self.threads)
+        for _ in threads:
+            self.jobs.put(None)
+        give_up_at = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, give_up_at - time.monotonic()))
+
+class Deadlines:
+    """
+    Calls functions at given monotonic times, all on one long-lived thread, e.g. to cut off
+    downloads that overrun. Cheaper than a threading.Timer (and so a new thread) per request.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pending = [] # Heap of (when, sequence number, func, args)
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def call_at(self, when, func, *args):
+        """Calls func(*args) at time.monotonic() `when`. Returns a handle for cancel()."""
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            self.sequence += 1
+            heapq.heappush(self.pending, (when, self.sequence, func, args))
+            self.condition.notify()
+            return self.sequence
+
+    def cancel(self, handle):
+        with self.condition:
+            # Only a handful are ever pending, so a linear search is fine
+            self.pending = [entry for entry in self.pending if entry[1] != handle]
+            heapq.heapify(self.pending)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending or self.pending[0][0] > time.monotonic():
+                    self.condition.wait(self.pending[0][0] - time.monotonic() if self.pending else None)
+                when, handle, func, args = heapq.heappop(self.pending)
+            try:
+                func(*args)
+            except Exception:
+                print(f"A deadline callback failed in {self.name}:")
+                traceback.print_exc()
@@ -0,0 +1,136 @@
+"""
+Standalone fetcher for running several boards on one host (see components/fetch_daemon.py).
+Start it once with `python fetcher.py`, then set the same FETCH_SOCKET in each board's .env.
+With HTTP_PORT set, it also serves the data to browsers (see components/arrivals_api.py).
+
+A board with FETCH_MODE="process" starts its own private copy with --parent (see
+components/fetch_process.py).
+"""
+from components.alerts_feed import open_alerts_feed
+from components.arrivals_api import ArrivalsAPI
+from components.fetch_daemon import FetchDaemon
+from components.fetch_engine import TokenBucket
+from components.gtfs_schedule import ScheduleIndex
+from components.metrics import Metrics, start_exporters
+from components.replay import RecordingClient, RecordingSession, TrafficRecorder
+from components.transit_data import TransitData
+from dotenv import dotenv_values
+from onebusaway import OnebusawaySDK, Timeout
+import argparse
+import asyncio
+import os
+import pytz
+import requests
+import signal
+import sqlite3
+import threading
+import time
+
+parser = argparse.ArgumentParser(description="Polls OneBusAway and the alerts feed for the boards on this host.")
+parser.add_argument("--socket", help="Unix socket to serve boards on, instead of FETCH_SOCKET")
+parser.add_argument("--parent", type=int, help="serve only the board with this process ID, and exit when it does")
+args = parser.parse_args()
+
+config = dotenv_values(".env")
+
+API_KEY = config["API_KEY"]
+REGION = config.get("REGION") or "America/Los_Angeles"
+TIME_ZONE = pytz.timezone(REGION)
+BASE_URL = 'https://api.pugetsound.onebusaway.org/'
+FETCH_SOCKET = args.socket or config.get("FETCH_SOCKET") or "subway-tracker.sock"
+GTFS_INDEX = config.get("GTFS_INDEX")
+HTTP_PORT = config.get("HTTP_PORT")
+RECORD_FILE = config.get("RECORD_FILE")
+# Stops to poll even when no board is showing them, e.g. for the HTTP API. Separated by ";",
+# each optionally followed by "|" and a comma-separated filter: "40_99610;1_11060|9,43,60"
+FETCH_STOPS = config.get("FETCH_STOPS") or ""
+API_RATE_LIMIT = float(config.get("API_RATE_LIMIT") or 1)
+API_RATE_BURST = int(config.get("API_RATE_BURST") or 10)
+if API_RATE_LIMIT <= 0:
+    print(f"API_RATE_LIMIT must be above 0, got {API_RATE_LIMIT:g}. Using 1")
+    API_RATE_LIMIT = 1.0
+if API_RATE_BURST < 1:
+    print(f"API_RATE_BURST must be at least 1, got {API_RATE_BURST}. Using 1")
+    API_RATE_BURST = 1
+API_CONNECT_TIMEOUT = 5
+API_READ_TIMEOUT = 10
+# Prometheus metrics over HTTP and/or in a file (see components/metrics.py)
+METRICS_PORT = config.get("METRICS_PORT")
+METRICS_FILE = config.get("METRICS_FILE")
+DATA_REFRESH_RATE = 35
+SERVICE_ALERTS_REFRESH_RATE = 60
+alert_thresholds = ["SEVERE"]
+if args.parent:
+    # Started by a board for itself: it reads the same .env, but the exporters and extra stops
+    # in there are the board's, not ours
+    HTTP_PORT = METRICS_PORT = METRICS_FILE = None
+    FETCH_STOPS = ""
+
+def exit_with_parent(pid):
+    """Shuts the fetcher down once the board that started it is gone, even if it was killed."""
+    while os.getppid() == pid:
+        time.sleep(2)
+    print("Board exited, stopping its fetcher")
+    # Interrupts asyncio.run on the main thread, so the finally block below still runs
+    os.kill(os.getpid(), signal.SIGINT)
+
+client = OnebusawaySDK(**{
+    "api_key" : API_KEY,
+    "base_url" : BASE_URL,
+    "timeout" : Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+    "max_retries" : 0 # The poll scheduler retries failed stops with backoff
+    })
+alerts_session = requests.Session()
+traffic_recorder = None
+if RECORD_FILE:
+    # Record upstream traffic for replaying later (see components/replay.py)
+    traffic_recorder = TrafficRecorder(RECORD_FILE)
+    client = RecordingClient(client, traffic_recorder)
+    alerts_session = RecordingSession(alerts_session, traffic_recorder)
+schedule_index = None
+if GTFS_INDEX:
+    try:
+        schedule_index = ScheduleIndex(GTFS_INDEX, REGION)
+    except (FileNotFoundError, sqlite3.Error) as e:
+        print(f"Could not open GTFS schedule index {GTFS_INDEX}: {e}")
+metrics = Metrics() if METRICS_PORT or METRICS_FILE else None
+transit_data = TransitData(client, TIME_ZONE, TokenBucket(API_RATE_LIMIT, API_RATE_BURST), schedule_index, base_interval=DATA_REFRESH_RATE, metrics=metrics)
+alerts_feed = open_alerts_feed(config.get("ALERTS_FORMAT") or "json", config.get("ALERTS_PB_URL"), session=alerts_session)
+
+daemon = FetchDaemon(transit_data, alerts_feed, alert_thresholds, FETCH_SOCKET, SERVICE_ALERTS_REFRESH_RATE, metrics=metrics)
+for entry in FETCH_STOPS.split(";"):
+    if entry.strip():
+        stop, _, stop_filter = entry.strip().partition("|")
+        daemon.pin(stop, stop_filter.split(",") if stop_filter else None)
+
+exporters = []
+if metrics:
+    metrics.gauge("subway_fetcher_boards", "Boards connected to the fetcher", daemon.board_count)
+    metrics.gauge("subway_fetcher_queries", "Stop queries being polled", lambda: len(transit_data.queries))
+    exporters = start_exporters(metrics, METRICS_PORT, METRICS_FILE)
+
+async def serve():
+    if HTTP_PORT:
+        api = ArrivalsAPI(port=int(HTTP_PORT))
+        daemon.listeners.append(api)
+        await api.start()
+        if metrics:
+            metrics.gauge("subway_api_clients", "Browsers connected to the event stream", lambda: len(api.clients))
+    await daemon.run()
+
+if args.parent:
+    threading.Thread(target=exit_with_parent, args=(args.parent,), name="parent-watch", daemon=True).start()
+try:
+    asyncio.run(serve())
+except KeyboardInterrupt:
+    pass
+finally:
+    print("Fetcher shutting down")
+    for exporter in exporters:
+        exporter.close()
+    transit_data.shutdown()
+    alerts_feed.close()
+    if schedule_index:
+        schedule_index.close()
+    if traffic_recorder:
+        traffic_recorder.close()
@@ -1,17 +1,22 @@
-from collections import defaultdict
-from components.clock_display import ClockDisplay
-from components.display_functions import wrap_text, draw_multi_colored_text
-from components.transit_mode import TransitMode
-from datetime import datetime, timedelta
+import time
+STARTUP_TIME = time.perf_counter() # For measuring time-to-first-frame
+
+# Startup runs in two phases so the display comes up as soon as possible. Only what the first
+# frame needs is imported here; the HTTP stack, the OneBusAway SDK and the rest are loaded
+# once it's on screen (see "Phase 2" below)
+from components.board_renderer import ALERT_FULL_DISPLAY_SECONDS, AlertAnimation, BoardRenderer
+from components.board_state import BoardState
+from components.canvas import open_canvas
+from components.metrics import NULL_TIMER, Metrics
+from components.frame_scheduler import FrameScheduler
+from components.snapshot import SnapshotWriter, load_snapshot
+from components.stop_registry import DEFAULT_STOPS_FILE, load_stop_registry
+from components.text_cache import text_cache
 from dotenv import dotenv_values
-import json
-from math import floor
-from onebusaway import OnebusawaySDK
+import os
 import pygame
 import pytz
-import requests
 import threading
-import time
 
 config = dotenv_values(".env")
 
@@ -25,455 +30,378 @@ TIME_ZONE = pytz.timezone(REGION)
 BASE_URL = 'https://api.pugetsound.onebusaway.org/'
 time_zone = pytz.timezone(REGION)
 
-# Stop IDs
-LINK_STOP_ID_ANGLE_LAKE = "40_99610" # Cap Hill Station to Angle Lake
-LINK_STOP_ID_LYNNWOOD = "40_99603" # Cap Hill Station to Lynnwood
-BUS_OLIVE_STOP_ID = "1_29266" # E Olive Way & Summit Ave E
-BUS_BROADWAY_STOP_ID = "1_11060" # Broadway and E Denny
-STREETCAR_STOP_ID = "1_11175" # Broadway and E Howell
+# The stops to show and how to draw their routes (see components/stop_registry.py)
+STOPS_FILE = config.get("STOPS_FILE") or DEFAULT_STOPS_FILE
+stop_registry = load_stop_registry(STOPS_FILE)
+# (stop ID, name, filter) for every stop, in the order rows are displayed
+STOP_QUERIES = stop_registry.queries
+# Seconds each page of rows is shown, when there are more than fit on the screen
+PAGE_SECONDS = float(config.get("PAGE_SECONDS") or 10)
+
+# Optional local GTFS schedule index (see components/gtfs_schedule.py), used to find the first
+# trip of the morning and as a fallback when OneBusAway is unavailable
+GTFS_INDEX = config.get("GTFS_INDEX")
+SCHEDULE_FALLBACK_COUNT = 8 # Scheduled departures to show per stop when the API is down
+
+# OneBusAway rate limit, shared by every concurrent stop query made with this key
+API_RATE_LIMIT = float(config.get("API_RATE_LIMIT") or 1) # Requests per second, long-run average
+API_RATE_BURST = int(config.get("API_RATE_BURST") or 10) # Requests allowed at once
+if API_RATE_LIMIT <= 0:
+    print(f"API_RATE_LIMIT must be above 0, got {API_RATE_LIMIT:g}. Using 1")
+    API_RATE_LIMIT = 1.0
+if API_RATE_BURST < 1:
+    print(f"API_RATE_BURST must be at least 1, got {API_RATE_BURST}. Using 1")
+    API_RATE_BURST = 1
+# Seconds to wait for OneBusAway to accept a connection, and then for each read
+API_CONNECT_TIMEOUT = 5
+API_READ_TIMEOUT = 10
+# A stop query that takes longer than this is abandoned and retried later
+FETCH_DEADLINE = 20
+# A background refresh still running after this long is assumed stuck, and a new one is started
+REFRESH_WATCHDOG_SECONDS = 60
+
+# Optional shared fetcher (see fetcher.py). When set, the board subscribes to the fetcher
+# on this Unix socket instead of polling OneBusAway and the alerts feed itself
+FETCH_SOCKET = config.get("FETCH_SOCKET")
+# "process" runs the fetching and parsing in a child process of this board's own, instead of
+# on threads, so it never holds up a frame (see components/fetch_process.py). Only without
+# FETCH_SOCKET, and not when replaying
+FETCH_MODE = config.get("FETCH_MODE") or "thread"
 
 # Global variables
-global_arrival_data: list[tuple[tuple[str, str], list[dict]]] = [] 
-last_data_refresh_time = 0
-is_fetching_data = False
+# The rows and alerts on the board. Refreshes swap in a new snapshot; the loop reads the current one
+board_state = BoardState()
 
-global_alerts_data: list[str] = []
 last_alert_refresh_time = 0
-is_fetching_alerts = False
-alerts_lock = threading.Lock()
-alert_index = 0
 alert_thresholds = ["SEVERE"]
-ALERTS_URL = "https://s3.amazonaws.com/st-service-alerts-prod/alerts_pb.json"
-
-# Caching for night mode
-night_mode: dict[str, int] = {}
-night_cache: dict = {}
-
-# Alert display configuration (ticker + periodic full display)
-ALERT_TICKER_HEIGHT = 48
-ALERT_FULL_DISPLAY_SECONDS = 12
-ALERT_CYCLE_SECONDS = 90
-ALERT_TICKER_CHAR_PADDING = 4
-ALERT_TICKER_TRIM_SUFFIX = "..."
-
-# Runtime alert state
-alert_show_full_until = 0
-last_alert_cycle = 0
-ticker_x = 0
-
-# Animation / transition state for alerts
-ALERT_TRANSITION_DURATION = 0.8  # seconds for expand/collapse animation
-alert_state = "ticker"  # one of: 'ticker', 'animating', 'full'
-alert_transition_start = 0
-alert_transition_direction = None  # 'expand' or 'collapse'
-alert_full_end_time = 0
-
-
-# Initialize Pygame modules
-pygame.init()
+# Optional binary GTFS-realtime alerts feed (needs gtfs-realtime-bindings), used instead of the JSON one
+ALERTS_FORMAT = config.get("ALERTS_FORMAT") or "json"
+ALERTS_PB_URL = config.get("ALERTS_PB_URL")
+
+# Warm-start snapshot of the last good data, drawn straight away on the next boot. Saved at
+# most once every SNAPSHOT_INTERVAL seconds, and only when it changed, to spare the SD card
+SNAPSHOT_PATH = config.get("SNAPSHOT_PATH") or "snapshot.json"
+SNAPSHOT_INTERVAL = float(config.get("SNAPSHOT_INTERVAL") or 60)
+snapshot_writer = SnapshotWriter(SNAPSHOT_PATH, SNAPSHOT_INTERVAL)
+snapshot_lock = threading.Lock()
+
+# Record upstream traffic to a file, or replay a recording instead of going online
+# (see components/replay.py). REPLAY_SPEED runs the replay faster than real time
+RECORD_FILE = config.get("RECORD_FILE")
+REPLAY_FILE = config.get("REPLAY_FILE")
+REPLAY_SPEED = float(config.get("REPLAY_SPEED") or 1)
+
+# Prometheus metrics over HTTP and/or in a file, and an on-screen summary of them (toggled
+# with D). All off by default (see components/metrics.py)
+METRICS_PORT = config.get("METRICS_PORT")
+METRICS_FILE = config.get("METRICS_FILE")
+DEBUG_OVERLAY = config.get("DEBUG_OVERLAY", "").lower() in ("1", "true", "yes")
+# "texture" draws with SDL2's renderer and textures instead of software blits, falling back to
+# software if it can't be set up (see components/canvas.py)
+RENDER_BACKEND = config.get("RENDER_BACKEND") or "software"
+# Draw off-screen and write only the changed pixels to a framebuffer device (e.g. /dev/fb0) or
+# a file, with no window system (see components/framebuffer.py). A file needs FRAMEBUFFER_SIZE
+# ("800x480") and optionally FRAMEBUFFER_BPP (32, 16 or 8). Writes are at least
+# FRAMEBUFFER_MIN_INTERVAL seconds apart, which e-paper panels need. The full alert box is
+# shown every FRAMEBUFFER_ALERT_CYCLE seconds rather than every 90, as each showing rewrites
+# most of the screen twice; 0 keeps the alert to the ticker
+FRAMEBUFFER = config.get("FRAMEBUFFER")
+FRAMEBUFFER_SIZE = config.get("FRAMEBUFFER_SIZE")
+FRAMEBUFFER_BPP = int(config.get("FRAMEBUFFER_BPP") or 32)
+FRAMEBUFFER_MIN_INTERVAL = float(config.get("FRAMEBUFFER_MIN_INTERVAL") or 0)
+FRAMEBUFFER_ALERT_CYCLE = float(config.get("FRAMEBUFFER_ALERT_CYCLE") or 600)
+
+# The board's idea of the current time. A replay runs it from the start of the recording
+clock = time.time
+recording = None
+if REPLAY_FILE:
+    from components.replay import Recording, VirtualClock
+    recording = Recording(REPLAY_FILE)
+    clock = VirtualClock(recording.start_time(), REPLAY_SPEED).time
+metrics = Metrics(clock=clock) if METRICS_PORT or METRICS_FILE or DEBUG_OVERLAY else None
+show_debug_overlay = DEBUG_OVERLAY
+
+if FRAMEBUFFER:
+    # Nothing is shown in a window, so SDL doesn't need a real video driver
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+# Initialize only the Pygame modules the board uses (pygame.init() would also start audio)
+pygame.display.init()
 pygame.font.init()
 
 # Display Setup
-DATA_REFRESH_RATE = 35 # Fetch data every 35 seconds
+DATA_REFRESH_RATE = 35 # Fetch data every 35 seconds, more or less often depending on each stop's arrivals
 SERVICE_ALERTS_REFRESH_RATE = 60 # Fetch service alerts every minute
 info = pygame.display.Info()
 SCREEN_WIDTH = info.current_w
 SCREEN_HEIGHT = info.current_h
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
-pygame.display.set_caption("Upcoming Arrivals")
-
-# Colors and Fonts
-WHITE = (255, 255, 255)
-BLACK = (23, 29, 34)
-LIGHT_GREY = (128, 128, 128)
-ALERT_GREY = (67, 65, 66)
-ALERT_YELLOW = (255, 179, 34)
-LIGHT_YELLOW = (255, 255, 0)
-GREEN = (0, 255, 100)
-RED = (255, 0, 0)
-LINE_1_COLOR = (41, 130, 64)
-LINE_2_COLOR = (0, 162, 224)
-BUS_COLOR = (255, 116, 65)
-STREETCAR_COLOR = (157, 28, 34)
-
-# Component settings
-BAR_HEIGHT = 60
-ICON_SIZE = 200
-ROUTE_CIRCLE_RADIUS = 45 # Increase this size for prominence
-SCREEN_WIDTH = screen.get_width()
-SCREEN_HEIGHT = screen.get_height()
-
-# Fonts
-FONT_PATH = 'assets/fonts/Roboto/static/Roboto_Condensed-Bold.ttf'
-CLOCK_FONT = 'assets/fonts/Roboto/static/Roboto_Condensed-ExtraLight.ttf'
-large_font_size = 72
-if SCREEN_WIDTH > 1800:
-    large_font_size = 84
-FONT_LARGE = pygame.font.Font(FONT_PATH, large_font_size)
-FONT_SMALL = pygame.font.Font(FONT_PATH, 48)
-FONT_ALERT = pygame.font.Font(FONT_PATH, 32)
+# The canvas the board draws on, which also owns the window
+if FRAMEBUFFER:
+    from components.framebuffer import FramebufferOutput, FramebufferSink
+    framebuffer_size = tuple(int(n) for n in FRAMEBUFFER_SIZE.lower().split("x")) if FRAMEBUFFER_SIZE else None
+    screen = FramebufferOutput(FramebufferSink(FRAMEBUFFER, framebuffer_size, FRAMEBUFFER_BPP), FRAMEBUFFER_MIN_INTERVAL, clock=clock)
+    SCREEN_WIDTH, SCREEN_HEIGHT = screen.get_size()
+else:
+    screen = open_canvas((SCREEN_WIDTH, SCREEN_HEIGHT), fullscreen=True, backend=RENDER_BACKEND, title="Upcoming Arrivals")
+
+# Draws the clock bar, rows and alert overlay; the loop below only decides what and when
+board_renderer = BoardRenderer(screen, STATION_NAME, REGION, clock=clock, route_styles=stop_registry.route_styles, page_seconds=PAGE_SECONDS)
+# Framebuffers (and e-paper above all) are too slow to animate, so the alert just switches.
+# The full box covers most of the screen, so it's also shown less often there, and kept up
+# for a whole write interval longer so a throttled write can't skip it
+if FRAMEBUFFER:
+    alert_animation = AlertAnimation(animate=False, cycle_seconds=FRAMEBUFFER_ALERT_CYCLE,
+                                     full_seconds=ALERT_FULL_DISPLAY_SECONDS + FRAMEBUFFER_MIN_INTERVAL)
+else:
+    alert_animation = AlertAnimation()
 
 # Timing Variables
-clock = pygame.time.Clock() # Used to limit FPS
-FPS = 30
-
-clock_display = ClockDisplay(
-    screen=screen,
-    screen_width=SCREEN_WIDTH,
-    screen_height=SCREEN_HEIGHT,
-    font_path=CLOCK_FONT,
-    time_zone_str=REGION, # Use the time zone loaded from .env
-    bar_height=BAR_HEIGHT,
-    station_name = STATION_NAME
+FPS = 30 # Only used while animating; otherwise the loop sleeps until something changes
+frame_scheduler = FrameScheduler(FPS, clock=clock, speed=REPLAY_SPEED if recording else 1)
+# Posted by the fetch threads so a sleeping main loop wakes up to draw new data
+DATA_UPDATED_EVENT = pygame.event.custom_type()
+
+def merge_stop_data(arrivals):
+    """Merges per-stop data (keyed by stop name) into the list of rows, in STOP_QUERIES order."""
+    merged_responses = []
+    for stop, name, stop_filter in STOP_QUERIES:
+        response = arrivals.get(name, {})
+        for headsign in response:
+            merged_responses.append((headsign, response[headsign]))
+    return merged_responses
+
+# --- Phase 1: the first frame ---
+# Draw the last snapshot straight away, or "Loading Data..." if there isn't one. The alert
+# overlay waits for the next frame, so its font and icon don't hold this one up
+warm_start = None if recording else load_snapshot(SNAPSHOT_PATH)
+if warm_start:
+    board_state.publish_rows(merge_stop_data(warm_start["arrivals"]))
+    board_state.publish_alerts(warm_start["alerts"], rotate=False)
+board_renderer.draw(board_state.current.rows, None, clock(), version=board_state.current.version)
+start_kind = "warm start from snapshot" if warm_start else "cold start"
+print(f"First frame drawn {(time.perf_counter() - STARTUP_TIME) * 1000:.0f} ms after startup ({start_kind})")
+
+# --- Phase 2: everything else ---
+# Loaded with the first frame already on screen. The OneBusAway SDK, the slowest import of
+# all, is left to the first refresh (see open_client)
+from components.alerts_feed import DEFAULT_ALERTS_URL, open_alerts_feed
+from components.fetch_daemon import FetchSubscriber
+from components.fetch_engine import TokenBucket
+from components.fetch_process import FetchProcess
+from components.fetch_supervisor import FetchSupervisor
+from components.gtfs_schedule import ScheduleIndex
+from components.metrics import start_exporters
+from components.replay import NoRateLimit, RecordingClient, RecordingSession, ReplayClient, ReplaySession, TrafficRecorder
+from components.transit_data import TransitData, query_key
+from components.worker_pool import WorkerPool
+import json
+import requests
+import sqlite3
+
+board_renderer.load_alert_assets()
+ALERTS_URL = DEFAULT_ALERTS_URL
+
+# Long-lived threads for the background refreshes, which run one at a time each and are
+# replaced if they get stuck
+refresh_workers = WorkerPool("refresh", workers=2)
+data_refresh = FetchSupervisor("Transit data", REFRESH_WATCHDOG_SECONDS, refresh_workers)
+alerts_refresh = FetchSupervisor("Service alerts", REFRESH_WATCHDOG_SECONDS, refresh_workers)
+
+# The board's own fetch process, if FETCH_MODE="process"
+fetch_process = None
+if FETCH_MODE == "process" and not FETCH_SOCKET and not recording:
+    fetch_process = FetchProcess()
+elif FETCH_MODE not in ("thread", "process"):
+    print(f"Unknown FETCH_MODE {FETCH_MODE!r}, fetching on threads")
+
+traffic_recorder = None
+# In process mode the child records the traffic instead (it reads the same .env)
+if RECORD_FILE and not recording and not fetch_process:
+    traffic_recorder = TrafficRecorder(RECORD_FILE)
+if recording:
+    client = ReplayClient(recording, clock)
+    alerts_session = ReplaySession(recording, clock)
+else:
+    # Made by the first refresh instead (see open_client), so the SDK loads in the background
+    client = None
+    alerts_session = requests.Session()
+    if traffic_recorder:
+        alerts_session = RecordingSession(alerts_session, traffic_recorder)
+alerts_feed = open_alerts_feed(ALERTS_FORMAT, ALERTS_PB_URL, ALERTS_URL, session=alerts_session, clock=clock)
+
+schedule_index = None
+if GTFS_INDEX:
+    try:
+        schedule_index = ScheduleIndex(GTFS_INDEX, REGION)
+    except (FileNotFoundError, sqlite3.Error) as e:
+        print(f"Could not open GTFS schedule index {GTFS_INDEX}: {e}")
+# Fetches and parses each stop, polled on its own schedule. Keyed by stop name
+transit_data = TransitData(
+    client, TIME_ZONE, NoRateLimit() if recording else TokenBucket(API_RATE_LIMIT, API_RATE_BURST), schedule_index,
+    base_interval=DATA_REFRESH_RATE, schedule_fallback_count=SCHEDULE_FALLBACK_COUNT,
+    # A thread per stop, but no more than the rate limit lets run at once
+    max_workers=min(len(STOP_QUERIES), API_RATE_BURST),
+    fetch_deadline=FETCH_DEADLINE, clock=clock, metrics=metrics
 )
-
-try:
-    WARNING_ICON = pygame.image.load('assets/icons/alert-octagon.png')
-    # Scale the icon to fit nicely in the alert bar
-    WARNING_ICON = pygame.transform.scale(WARNING_ICON, (ICON_SIZE, ICON_SIZE))
-except pygame.error as e:
-    print(f"Could not load warning icon: {e}")
-    WARNING_ICON = None # Handle case where icon loading fails
-
-client = OnebusawaySDK(**{
-    "api_key" : API_KEY,
-    "base_url" : BASE_URL
-    })
-
-def draw_alert_box(surface, alert_text):
-    global global_alerts_data
+for stop, name, stop_filter in STOP_QUERIES:
+    transit_data.add_query(name, stop, stop_filter)
+poll_scheduler = transit_data.poll_scheduler
+
+exporters = []
+fetch_subscriber = None # Set up below, once the first frame is drawn; the metrics gauges read it
+if metrics:
+    metrics.gauge("subway_fetch_queue", "Stop queries waiting for a fetch thread", transit_data.fetch_engine.queued)
+    metrics.gauge("subway_fetch_in_progress", "Whether a fetch thread is running, by kind",
+                  lambda: {(("kind", "arrivals"),): int(data_refresh.running()), (("kind", "alerts"),): int(alerts_refresh.running())})
+    metrics.gauge("subway_refresh_abandoned", "Background refreshes abandoned by the watchdog, by kind",
+                  lambda: {(("kind", "arrivals"),): data_refresh.abandoned, (("kind", "alerts"),): alerts_refresh.abandoned})
+    metrics.gauge("subway_circuit_open", "Whether an upstream's circuit breaker is failing requests fast",
+                  lambda: {(("upstream", "onebusaway"),): int(transit_data.breaker.state != "closed"),
+                           (("upstream", "alerts"),): int(alerts_feed.breaker.state != "closed")})
+    metrics.gauge("subway_fetcher_connected", "Whether the board is connected to the shared fetcher",
+                  lambda: int(bool(fetch_subscriber and fetch_subscriber.connected)))
+    if fetch_process:
+        metrics.gauge("subway_fetch_process_restarts", "Times the board's fetch process was restarted",
+                      lambda: fetch_process.restarts)
+    if FRAMEBUFFER:
+        metrics.gauge("subway_framebuffer_writes", "Writes to the framebuffer", lambda: screen.writes)
+        metrics.gauge("subway_framebuffer_pixels_written", "Pixels written to the framebuffer", lambda: screen.pixels_written)
+    metrics.gauge("subway_text_cache_renders", "Text cache lookups, by result",
+                  lambda: {(("result", "hit"),): text_cache.hits, (("result", "miss"),): text_cache.misses})
+    exporters = start_exporters(metrics, METRICS_PORT, METRICS_FILE)
+
+def open_client():
     """
-    Draws a light grey alert box near the bottom of the screen with a warning icon
-    and wrapped text.
+    Builds the OneBusAway client. Importing the SDK takes longer than anything else at startup,
+    so this runs on a refresh thread, when the first fetch needs it.
     """
-    if not alert_text:
-        return
-    
-    if len(global_alerts_data) > 1:
-        alert_text = "(" + str(alert_index + 1) + "/" + str(len(global_alerts_data)) + ") " + alert_text
-
-    alert_height = ICON_SIZE
-    BOTTOM_OFFSET = 20
-    SIDE_PADDING = 20
-    ICON_PADDING = 20
-    TEXT_START_X_OFFSET = ICON_PADDING + ICON_SIZE + 10
-
-    alert_rect = pygame.Rect(
-        0, 
-        surface.get_height() - alert_height - BOTTOM_OFFSET, 
-        surface.get_width(), 
-        alert_height
-    )
-
-    # Draw the light grey background
-    pygame.draw.rect(surface, ALERT_GREY, alert_rect)
-
-    # --- Draw Icon ---
-    if WARNING_ICON:
-        icon_rect = WARNING_ICON.get_rect(midleft=(alert_rect.x, alert_rect.centery))
-        surface.blit(WARNING_ICON, icon_rect)
-    
-    # --- Draw Wrapped Text ---
-    # Calculate the maximum width available for the text
-    max_text_width = alert_rect.width - TEXT_START_X_OFFSET - SIDE_PADDING
-    
-    # Wrap the text using the helper function
-    wrapped_lines = wrap_text(alert_text, FONT_ALERT, max_text_width)
-
-    # Determine vertical starting position for centered multi-line text
-    # Start drawing lines at a Y position so the whole block is vertically centered
-    total_text_height = len(wrapped_lines) * FONT_ALERT.get_linesize()
-    current_y = alert_rect.centery - (total_text_height // 2)
-
-    for line in wrapped_lines:
-        text_surface = FONT_ALERT.render(line, True, ALERT_YELLOW)
-        # Position each line starting just after the icon area, aligned left
-        surface.blit(text_surface, (alert_rect.x + TEXT_START_X_OFFSET, current_y))
-        current_y += FONT_ALERT.get_linesize() # Move down for the next line
-
-def draw_alert_ticker(surface, alert_text):
-    """Draw a compact single-line ticker flush to the bottom (no interaction)."""
-    if not alert_text:
-        return
-
-    # Add index prefix if multiple alerts
-    if len(global_alerts_data) > 1:
-        alert_text = "(" + str(alert_index + 1) + "/" + str(len(global_alerts_data)) + ") " + alert_text
-
-    SIDE_PADDING = 12
-
-    # Put the ticker flush to the bottom (no extra bottom offset)
-    ticker_rect = pygame.Rect(
-        0,
-        surface.get_height() - ALERT_TICKER_HEIGHT,
-        surface.get_width(),
-        ALERT_TICKER_HEIGHT,
-    )
-
-    pygame.draw.rect(surface, ALERT_GREY, ticker_rect)
-
-    # Icon: aligned with left edge of screen, height == banner height
-    icon_h = ALERT_TICKER_HEIGHT
-    if WARNING_ICON:
-        small_icon = pygame.transform.scale(WARNING_ICON, (icon_h, icon_h))
-        icon_rect = small_icon.get_rect(topleft=(ticker_rect.x, ticker_rect.y))
-        surface.blit(small_icon, icon_rect)
-        text_start_x = icon_rect.right + 10
-    else:
-        text_start_x = ticker_rect.x + 8
-
-    max_text_width = ticker_rect.width - (text_start_x - ticker_rect.x) - SIDE_PADDING
-
-    # Trim text to fit single line if necessary
-    text = alert_text
-    text_surf = FONT_ALERT.render(text, True, ALERT_YELLOW)
-    if text_surf.get_width() > max_text_width:
-        while text and FONT_ALERT.render(text + ALERT_TICKER_TRIM_SUFFIX, True, ALERT_YELLOW).get_width() > max_text_width:
-            text = text[:-1]
-        text += ALERT_TICKER_TRIM_SUFFIX
-        text_surf = FONT_ALERT.render(text, True, ALERT_YELLOW)
-
-    surface.blit(text_surf, (text_start_x, ticker_rect.centery - FONT_ALERT.get_linesize() // 2))
-
-def _lerp(a, b, t):
-    return a + (b - a) * t
+    from onebusaway import OnebusawaySDK, Timeout
+    client = OnebusawaySDK(**{
+        "api_key" : API_KEY,
+        "base_url" : BASE_URL,
+        "timeout" : Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        "max_retries" : 0 # The poll scheduler retries failed stops with backoff
+        })
+    if traffic_recorder:
+        client = RecordingClient(client, traffic_recorder)
+    return client
 
-def draw_alert_overlay(surface, alert_text, bar_height, icon_size, text_alpha=255):
-    """Unified alert renderer that draws a bar of `bar_height`, an icon scaled to
-    `icon_size`, and wrapped text rendered with `text_alpha` transparency.
+def save_warm_start(force=False):
     """
-    if not alert_text:
+    Saves the current data so the next boot can draw it before the first fetch finishes.
+    Throttled by snapshot_writer, unless `force`d.
+    """
+    if recording:
+        # Replayed data would look stale (or from the future) to the next boot
         return
-
-    SIDE_PADDING = 12
-
-    ticker_rect = pygame.Rect(
-        0,
-        surface.get_height() - int(bar_height),
-        surface.get_width(),
-        int(bar_height),
-    )
-
-    pygame.draw.rect(surface, ALERT_GREY, ticker_rect)
-
-    # Icon: align to left of the bar and vertically centered
-    icon_h = int(icon_size)
-    text_start_x = ticker_rect.x + SIDE_PADDING
-    if WARNING_ICON:
-        # Scale icon preserving alpha
+    with snapshot_lock:
         try:
-            small_icon = pygame.transform.smoothscale(WARNING_ICON, (icon_h, icon_h))
-        except Exception:
-            small_icon = pygame.transform.scale(WARNING_ICON, (icon_h, icon_h))
-        icon_rect = small_icon.get_rect(midleft=(ticker_rect.x + SIDE_PADDING, ticker_rect.centery))
-        surface.blit(small_icon, icon_rect)
-        text_start_x = icon_rect.right + 10
-
-    max_text_width = ticker_rect.width - (text_start_x - ticker_rect.x) - SIDE_PADDING
-
-    # Trim/wrap like the ticker/box logic
-    wrapped_lines = wrap_text(alert_text, FONT_ALERT, max_text_width)
-
-    # Render wrapped lines with provided alpha
-    total_text_height = len(wrapped_lines) * FONT_ALERT.get_linesize()
-    current_y = ticker_rect.centery - (total_text_height // 2)
-
-    for line in wrapped_lines:
-        text_surface = FONT_ALERT.render(line, True, ALERT_YELLOW).convert_alpha()
-        # Apply alpha
-        text_surface.set_alpha(int(text_alpha))
-        surface.blit(text_surface, (text_start_x, current_y))
-        current_y += FONT_ALERT.get_linesize()
-
-def parse_query(stop, transit_mode_enum, filter=None, exclude=None) -> dict[tuple[str, str], list[dict]]:
-    global night_mode
-    transit_mode = str(transit_mode_enum)
-    
-    arrivals_and_departures = [] # Initialize as empty list
-
-    # If the stop is in night mode...
-    if transit_mode in night_mode.keys():
-        if night_mode[transit_mode] < datetime.now().timestamp():
-            # Exit night mode: clear cache and query normally
-            del night_mode[transit_mode]
-            del night_cache[transit_mode]
-            response = client.arrival_and_departure.list(stop_id=stop, minutes_after=35, minutes_before=0)
-            arrivals_and_departures = response.data.entry.arrivals_and_departures
-        else:
-            if transit_mode not in night_cache.keys():
-                # One-time query for night mode (next 7 hours)
-                response = client.arrival_and_departure.list(stop_id=stop, minutes_after=420, minutes_before=0)
-                all_departures = response.data.entry.arrivals_and_departures
-                if all_departures:
-                    if filter != None:
-                        arr = [x for x in all_departures if (x.route_short_name in filter) or (x.trip_headsign in filter)]
-                    else:
-                        arr = all_departures
-                    if arr:
-                        arr = arr[0]
-                        night_cache[transit_mode] = arr
-                        # Set night mode to end 20 minutes before the first arrival
-                        night_mode[transit_mode] = round(arr.scheduled_arrival_time / 1000 - (60 * 20))
-                        # The departures list will contain only this one future arrival
-                        arrivals_and_departures = [arr] # Wrap the single object in a list
-                    else:
-                        arrivals_and_departures = []
-                else:
-                    # If no departures found even for 7 hours
-                    arrivals_and_departures = []
-            else:
-                # Pull from the existing cache
-                arrivals_and_departures = [night_cache[transit_mode]]
-    else:
-        # If the stop is not in night mode, query for the next 35 minutes
-        response = client.arrival_and_departure.list(stop_id=stop, minutes_after=35, minutes_before=0)
-        arrivals_and_departures = response.data.entry.arrivals_and_departures
-
-    arr = defaultdict(list)
-    for arr_dep in arrivals_and_departures:
-        if filter != None and len(filter) > 0:
-            if arr_dep.trip_headsign not in filter and arr_dep.route_short_name not in filter:
-                continue
-        headsign = arr_dep.trip_headsign
-        headsign_len = len(headsign)
-        # If headsign is too long, first try to eliminate extra words. If that is not enough, truncate it 
-        if (headsign_len > 18 and SCREEN_WIDTH < 1500) or headsign_len > 25:
-            headsign_words = headsign.split(" ")
-            headsign = headsign_words[0] + " " + headsign_words[1]
-            if len(headsign) > 18:
-                headsign = headsign[:13]
-            headsign += "..."
-        arr[(
-            arr_dep.route_short_name,
-            headsign
-        )].append({
-            "predicted_arrival_time": arr_dep.predicted_arrival_time,
-            "predicted_departure_time": arr_dep.predicted_departure_time,
-            "scheduled_arrival_time": arr_dep.scheduled_arrival_time,
-            "scheduled_departure_time": arr_dep.scheduled_departure_time,
-            "predicted": arr_dep.predicted,
-            "status": arr_dep.status,
-            "trip": arr_dep.trip_id
-        })
-    return dict(arr)
+            # Shallow copies, since the other fetch thread may be updating these
+            snapshot_writer.save(dict(transit_data.arrivals), list(board_state.current.alerts), force)
+        except OSError as e:
+            print(f"Could not save snapshot {SNAPSHOT_PATH}: {e}")
 
-def fetch_transit_data():
-    """Fetches data from OBA and updates the global data structure."""
-    global global_arrival_data, is_fetching_data
-    is_fetching_data = True
+def load_warm_start(snapshot):
+    """
+    Carries on from the snapshot drawn in the first frame. Every stop is still due straight
+    away, so the rows from disk are only shown until the first live fetch replaces them.
+    """
+    transit_data.arrivals.update(snapshot["arrivals"])
 
+def post_data_updated():
+    """Wakes the main loop to draw new data."""
     try:
-        # Without any optional parameters, uses the API default time window
-        buffer_time = int((datetime.now() + timedelta(minutes=30)).timestamp())
-        response_link_angle_lake = parse_query(LINK_STOP_ID_ANGLE_LAKE, TransitMode.ANGLE)
-        if len(response_link_angle_lake) == 0:
-            night_mode[str(TransitMode.ANGLE)] = buffer_time
-        time.sleep(1)
-
-        response_link_lynnwood = parse_query(LINK_STOP_ID_LYNNWOOD, TransitMode.LYNNWOOD)
-        if len(response_link_lynnwood) == 0:
-            night_mode[str(TransitMode.LYNNWOOD)] = buffer_time
-        time.sleep(1)
-
-        response_bus_olive = parse_query(BUS_OLIVE_STOP_ID, TransitMode.BUS_OLIVE)
-        if len(response_bus_olive) == 0:
-            night_mode[str(TransitMode.BUS_OLIVE)] = buffer_time
-        time.sleep(1)
-
-        response_bus_broadway = parse_query(BUS_BROADWAY_STOP_ID, TransitMode.BUS_BROADWAY, ["9", "43", "60"])
-        if len(response_bus_broadway) == 0:
-            night_mode[str(TransitMode.BUS_BROADWAY)] = buffer_time
-        time.sleep(1)
-
-        response_streetcar = parse_query(STREETCAR_STOP_ID, TransitMode.STREETCAR, ["Pioneer Square"])
-        if len(response_streetcar) == 0:
-            night_mode[str(TransitMode.STREETCAR)] = buffer_time
-        time.sleep(1)
-
-        merged_responses = []
-
-        for headsign in response_link_lynnwood:
-            merged_responses.append((headsign, response_link_lynnwood[headsign]))
-        for headsign in response_link_angle_lake:
-            merged_responses.append((headsign, response_link_angle_lake[headsign]))
-        for headsign in response_bus_olive:
-            merged_responses.append((headsign, response_bus_olive[headsign]))
-        for headsign in response_bus_broadway:
-            merged_responses.append((headsign, response_bus_broadway[headsign]))
-        for headsign in response_streetcar:
-            merged_responses.append((headsign, response_streetcar[headsign]))
-        global_arrival_data = merged_responses
-
-    except Exception as e:
-        time_str = datetime.now(TIME_ZONE).strftime("%H:%M")
-        print(f"An error occurred at {time_str} while fetching transit data: {e}")
-
-    is_fetching_data = False
+        pygame.event.post(pygame.event.Event(DATA_UPDATED_EVENT))
+    except pygame.error:
+        pass # A refresh that finished after shutdown
+
+def fetch_transit_data(stop_keys):
+    """Fetches data from OBA concurrently for the given stops and publishes the new rows."""
+    if transit_data.client is None:
+        transit_data.client = open_client()
+    transit_data.fetch(stop_keys)
+    board_state.publish_rows(merge_stop_data(transit_data.arrivals))
+    save_warm_start()
+    post_data_updated()
+
+def update_alerts(alerts_data):
+    """Swaps in a new list of alerts. None means they haven't changed, so just move on to the next one."""
+    board_state.publish_alerts(alerts_data)
+    if alerts_data is not None:
+        save_warm_start()
 
 def fetch_service_alerts():
-    global global_alerts_data, is_fetching_alerts, alert_index, alert_thresholds, alerts_lock
-    is_fetching_alerts = True
-
     alerts_data = []
+    error = None
+    started = time.perf_counter()
     try:
-        # Make the GET request to the URL
-        response = requests.get(ALERTS_URL)
-
-        # Check if the request was successful (status code 200-299)
-        response.raise_for_status()
-
-        # Parse the data, checking only for SEVERE alerts
-        data = response.json()
-        for entity in data["entity"]:
-            if entity["alert"]["severity_level"] not in alert_thresholds:
-                continue
-            alert_active = False
-            # Only show active alerts
-            for period in entity["alert"]["active_period"]:
-                # Allow for 24hr notice
-                DAY = 60*60*24
-                if "start" not in period.keys():
-                    continue
-                elif period["start"] < (time.time() + DAY):
-                    if "end" not in period.keys():
-                        alert_active = True
-                    elif period["end"] > time.time():
-                        alert_active = True
-            if not alert_active:
-                continue
-            for translation in entity["alert"]["header_text"]["translation"]:
-                if translation["language"] == "en":
-                    alerts_data.append(translation["text"])
-                    break
+        # Conditional GET over the shared session, parsing and filtering entities as they
+        # stream in. None means the feed is unchanged
+        alerts_data = alerts_feed.fetch_alerts(alert_thresholds)
 
     except requests.exceptions.RequestException as e:
         # Handle any potential errors during the request (e.g., network issues, invalid URL)
         print(f"An error occurred while fetching service alerts: {e}")
-    except json.JSONDecodeError:
+        error = e
+    except json.JSONDecodeError as e:
         # Handle cases where the response body does not contain valid JSON
         print("Failed to decode JSON from the response.")
-
-    with alerts_lock:
-        if alerts_data: # Only update index if there are new alerts
-            # Recalculate index based on the *new* data size
-            if alert_index >= len(alerts_data) - 1:
-                alert_index = 0
-            # Otherwise, only increment if the index is valid for the new data
-            elif alert_index < len(alerts_data) - 1:
-                 alert_index += 1
-
-        global_alerts_data = alerts_data
-    is_fetching_alerts = False
+        error = e
+    except ValueError as e:
+        # Handle cases where the response body is not a valid protobuf feed
+        print(f"An error occurred while decoding service alerts: {e}")
+        error = e
+    if metrics:
+        metrics.record_fetch("alerts", "", time.perf_counter() - started, error)
+
+    update_alerts(alerts_data)
+    post_data_updated()
+
+def on_fetcher_arrivals(key, rows):
+    """Called by the FetchSubscriber thread with new rows from the shared fetcher."""
+    for name in fetcher_query_names.get(key, []):
+        transit_data.arrivals[name] = rows
+        if metrics:
+            metrics.record_update(name, transit_data.queries[name][0])
+    board_state.publish_rows(merge_stop_data(transit_data.arrivals))
+    save_warm_start()
+    post_data_updated()
+
+def on_fetcher_alerts(alerts_data):
+    """Called by the FetchSubscriber thread with new alerts from the shared fetcher."""
+    update_alerts(alerts_data)
+    if metrics:
+        metrics.record_update("alerts", "")
+    post_data_updated()
 
 # --- Main Script Execution ---
-# Load initial values
-fetch_transit_data() 
-fetch_service_alerts()
-last_data_refresh_time = time.time()
-last_alert_refresh_time = time.time()
+# Pick up where the snapshot on screen left off, while the first live fetch runs in the background
+if warm_start:
+    load_warm_start(warm_start)
+if fetch_process:
+    fetch_process.start()
+if FETCH_SOCKET or fetch_process:
+    # The shared fetcher (or our own fetch process) does all the polling, this board just
+    # listens for updates
+    fetcher_query_names = {}
+    for stop, name, stop_filter in STOP_QUERIES:
+        fetcher_query_names.setdefault(query_key(stop, stop_filter), []).append(name)
+    fetch_subscriber = FetchSubscriber(
+        fetch_process.socket_path if fetch_process else FETCH_SOCKET,
+        [(stop, stop_filter) for stop, name, stop_filter in STOP_QUERIES],
+        on_fetcher_arrivals, on_fetcher_alerts,
+        # Our own process is only ever briefly away, while it starts or restarts
+        reconnect_delay=0.5 if fetch_process else 5
+    )
+    fetch_subscriber.start()
+else:
+    data_refresh.start(fetch_transit_data, poll_scheduler.due(clock()))
+    alerts_refresh.start(fetch_service_alerts)
+last_alert_refresh_time = clock()
+print(f"Started fetching {(time.perf_counter() - STARTUP_TIME) * 1000:.0f} ms after startup")
 
 running = True
 while running:
+    timer = metrics.frame_timer() if metrics else NULL_TIMER
     # --- 1. Event Handling ---
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -481,6 +409,8 @@ while running:
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 running = False
+            elif event.key == pygame.K_d and metrics:
+                show_debug_overlay = not show_debug_overlay
         if event.type == pygame.MOUSEBUTTONDOWN:
             # Button 1 is Left-click, Button 2 is Middle-click (scroll wheel), 
             # Button 3 is Right-click
@@ -488,189 +418,92 @@ while running:
             if event.button == 3: 
                 running = False
             elif event.button == 1:
-                if screen.get_flags() & pygame.FULLSCREEN:
+                if screen.fullscreen:
                     SCREEN_HEIGHT -= 50
                     SCREEN_WIDTH -= 50
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+                    screen.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), fullscreen=False)
                 else:
                     SCREEN_HEIGHT += 50
                     SCREEN_WIDTH += 50
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN)
+                    screen.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), fullscreen=True)
+                board_renderer.set_screen(screen)
+        if event.type in (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED,
+                          pygame.RENDER_TARGETS_RESET, pygame.RENDER_DEVICE_RESET):
+            # The window contents (or, with textures, the board's target texture) may have
+            # been lost, so repaint everything
+            board_renderer.region_tracker.invalidate(screen)
 
     # 2. Data Update (Low Frequency, using THREADING)
-    current_time = time.time()
-    if current_time - last_data_refresh_time > DATA_REFRESH_RATE and not is_fetching_data:
-        # Start the API call in a new thread so the main loop doesn't freeze
-        threading.Thread(target=fetch_transit_data, daemon=True).start()
-        last_data_refresh_time = current_time
+    current_time = clock()
+    if fetch_subscriber:
+        # Updates are pushed by the shared fetcher; only the alert rotation is driven from here
+        if current_time - last_alert_refresh_time > SERVICE_ALERTS_REFRESH_RATE:
+            update_alerts(None)
+            last_alert_refresh_time = current_time
+    else:
+        due_stops = poll_scheduler.due(current_time)
+        if due_stops and not data_refresh.busy():
+            # Start the API call in a new thread so the main loop doesn't freeze
+            data_refresh.start(fetch_transit_data, due_stops)
 
-    if current_time - last_alert_refresh_time > SERVICE_ALERTS_REFRESH_RATE and not is_fetching_alerts:
-        threading.Thread(target=fetch_service_alerts, daemon=True).start()
-        last_alert_refresh_time = current_time
+        if current_time - last_alert_refresh_time > SERVICE_ALERTS_REFRESH_RATE and not alerts_refresh.busy():
+            alerts_refresh.start(fetch_service_alerts)
+            last_alert_refresh_time = current_time
 
-    # 3. Drawing/Rendering (High Frequency)
-    screen.fill(BLACK) 
-    clock_display.draw()
-    y_offset = BAR_HEIGHT + 10
-
-    # Assuming FONT_LARGE is the largest element, calculate its height once
-    FONT_HEIGHT = FONT_LARGE.get_height() 
-    TEXT_CENTER_OFFSET = FONT_HEIGHT // 2
-    ROW_SPACING = 2*ROUTE_CIRCLE_RADIUS + (ROUTE_CIRCLE_RADIUS*.5) # Total height for the row area
-    X_ROUTE = ROUTE_CIRCLE_RADIUS + (ROUTE_CIRCLE_RADIUS*.5) # X position for the circle center
-
-    if global_arrival_data:
-        # Loop through the GLOBAL data list updated by the thread
-        for i, arrival in enumerate(global_arrival_data):
-            text_color = WHITE
-            # Define the top edge of the current row block
-            ROW_TOP_Y = y_offset + (i * ROW_SPACING)
-
-            # Calculate the center Y-coordinate for all elements in this row
-            ROW_CENTER_Y = ROW_TOP_Y + (ROW_SPACING // 2)
-
-            colored_arr: list[tuple[str, tuple]] = []
-            arrival_times = arrival[1][:4]
-            num_schedules = len(arrival_times) # Get the correct count
-
-            for j, schedule in enumerate(arrival_times):
-                if schedule.get('predicted', False):
-                    # Calculate minutes until arrival in real-time
-                    # Color the text based on (predicted time vs scheduled time)
-                    now = round(datetime.now(TIME_ZONE).timestamp())
-                    time_until = (schedule['predicted_arrival_time']/1000 - round(datetime.now(TIME_ZONE).timestamp()))
-                    time_diff = (schedule['predicted_arrival_time']/1000 - schedule['scheduled_arrival_time']/1000)
-                    if time_diff >= 300: # >=5min late
-                        text_color = RED
-                    elif time_diff >= 90: # >=1.5min late
-                        text_color = LIGHT_YELLOW
-                    elif time_diff <= -60: # >=1min early
-                        text_color = GREEN
-                else:
-                    # If real-time data is not available for this arrival, set the color to light grey
-                    time_until = (schedule['scheduled_arrival_time']/1000 - round(datetime.now(TIME_ZONE).timestamp()))
-                    text_color = LIGHT_GREY
-
-                minutes_until = floor(time_until / 60) # truncate to minute
-                if minutes_until > 60:
-                    # If the next arrival isn't for over an hour (such as during night mode), display the actual time instead of minutes_until
-                    minutes_str = datetime.fromtimestamp(schedule["scheduled_arrival_time"]/1000, TIME_ZONE).strftime("%H:%M")
-                    text_color = WHITE
-                elif minutes_until < 1:
-                    # Display "Now" if arrival is imminent
-                    minutes_str = "Now"
-                else:
-                    minutes_str = f"{minutes_until}"
-                
-                # Append the minutes string
-                colored_arr.append((minutes_str, text_color))
-
-                # Append a comma and space if it's NOT the last schedule
-                if j < num_schedules - 1:
-                    colored_arr.append((", ", WHITE))
-                
-            # Append the final " min" suffix ONLY ONCE at the end of all times, if not end of service
-            if num_schedules > 0 and colored_arr[-1][0] != "Now" and ":" not in colored_arr[-1][0]:
-                colored_arr.append((" min", WHITE))
-        
-            # Route Number Circle
-            route_number = str(arrival[0][0]) # Ensure it's a string
-            
-            # Blit the circle
-            if "1 Line" in route_number:
-                route_number = "1"
-                circle_color = LINE_1_COLOR
-            elif "2 Line" in route_number:
-                route_number = "2"
-                circle_color = LINE_2_COLOR
-            elif "Streetcar" in route_number:
-                route_number = 'S'
-                circle_color = STREETCAR_COLOR
-            else:
-                circle_color = BUS_COLOR
-            # Render the route number for placement inside the circle
-            route_num_surface = FONT_LARGE.render(route_number, True, WHITE) # Use a smaller font for the number
-            pygame.draw.circle(screen, circle_color, (X_ROUTE, ROW_CENTER_Y), ROUTE_CIRCLE_RADIUS)
-
-            # Center the route number text on the circle
-            route_num_rect = route_num_surface.get_rect(center=(X_ROUTE, ROW_CENTER_Y))
-            screen.blit(route_num_surface, route_num_rect)
-
-            # Headsign Text
-            headsign_text = arrival[0][1]
-            headsign_x_pos = X_ROUTE + (ROUTE_CIRCLE_RADIUS*1.5) # add a gap after the circle
-            headsign_surface = FONT_LARGE.render(headsign_text, True, WHITE) # Use WHITE for headsign
-            screen.blit(
-                headsign_surface, 
-                (headsign_x_pos, ROW_CENTER_Y - TEXT_CENTER_OFFSET) # Subtract half height
-            )
-
-            # Minutes_until_arrival Text
-            draw_multi_colored_text(screen, colored_arr, SCREEN_WIDTH, ROW_CENTER_Y - TEXT_CENTER_OFFSET, 20, FONT_LARGE)
+    timer.lap("events")
 
-    else:
-        # Display a loading/error message if the list is empty
-        loading_text = FONT_LARGE.render("Loading Data...", True, WHITE)
-        screen.blit(loading_text, (SCREEN_WIDTH/2 - loading_text.get_width()/2, SCREEN_HEIGHT/2))
-
-    if global_alerts_data:
-        with alerts_lock:
-            if global_alerts_data:
-                current_time_loop = time.time()
-
-                # Trigger a full alert cycle periodically (starts expand animation)
-                if current_time_loop - last_alert_cycle > ALERT_CYCLE_SECONDS and alert_state == 'ticker':
-                    alert_transition_direction = 'expand'
-                    alert_transition_start = current_time_loop
-                    alert_state = 'animating'
-                    alert_full_end_time = current_time_loop + ALERT_FULL_DISPLAY_SECONDS
-                    last_alert_cycle = current_time_loop
-
-                # Handle animation / states
-                if alert_state == 'animating':
-                    t = (current_time_loop - alert_transition_start) / ALERT_TRANSITION_DURATION
-                    t = max(0.0, min(1.0, t))
-                    if alert_transition_direction == 'expand':
-                        bar_h = _lerp(ALERT_TICKER_HEIGHT, ICON_SIZE, t)
-                        icon_s = _lerp(ALERT_TICKER_HEIGHT, ICON_SIZE, t)
-                        # alpha: fade out (0-25%), hold hidden (25-75%), fade in (75-100%)
-                        if t < 0.25:
-                            a = _lerp(255, 0, t / 0.25)
-                        elif t < 0.75:
-                            a = 0
-                        else:
-                            a = _lerp(0, 255, (t - 0.75) / 0.25)
-                        draw_alert_overlay(screen, global_alerts_data[alert_index], bar_h, icon_s, a)
-                        if t >= 1.0:
-                            alert_state = 'full'
-                            alert_show_full_until = alert_full_end_time
-                    else:  # collapse
-                        bar_h = _lerp(ICON_SIZE, ALERT_TICKER_HEIGHT, t)
-                        icon_s = _lerp(ICON_SIZE, ALERT_TICKER_HEIGHT, t)
-                        if t < 0.25:
-                            a = _lerp(255, 0, t / 0.25)
-                        elif t < 0.75:
-                            a = 0
-                        else:
-                            a = _lerp(0, 255, (t - 0.75) / 0.25)
-                        draw_alert_overlay(screen, global_alerts_data[alert_index], bar_h, icon_s, a)
-                        if t >= 1.0:
-                            alert_state = 'ticker'
-
-                elif alert_state == 'full':
-                    # If full display time expired, start collapse animation
-                    if current_time_loop >= alert_show_full_until:
-                        alert_transition_direction = 'collapse'
-                        alert_transition_start = current_time_loop
-                        alert_state = 'animating'
-                    else:
-                        draw_alert_overlay(screen, global_alerts_data[alert_index], ICON_SIZE, ICON_SIZE, 255)
-
-                else:  # ticker
-                    draw_alert_overlay(screen, global_alerts_data[alert_index], ALERT_TICKER_HEIGHT, ALERT_TICKER_HEIGHT, 255)
-
-    pygame.display.flip()
-    clock.tick(FPS)
+    # 3. Drawing/Rendering (High Frequency)
+    # One consistent view of the data for the whole frame, however often the refreshes swap it
+    snapshot = board_state.current
+    alert_view = None
+    if snapshot.alerts:
+        alert_view = alert_animation.update(snapshot.alert_text(), clock())
+    timer.lap("alert")
+    debug_lines = metrics.overlay_lines() if show_debug_overlay else None
+    # Only the regions that changed are redrawn, and rows are only rebuilt when the snapshot
+    # or a countdown changes. Returns when the next countdown ticks over
+    row_change = board_renderer.draw(snapshot.rows, alert_view, current_time, timer, debug_lines, snapshot.version)
+    if FRAMEBUFFER:
+        # Changes held back by the minimum interval are written as soon as it's up
+        screen.flush()
+        frame_scheduler.request_frame_at(screen.next_flush())
+    timer.done()
+    if row_change is not None:
+        frame_scheduler.request_frame_at(row_change)
+
+    # 4. Sleep until the next visible change: the next clock minute, countdown tick,
+    # alert cycle or data refresh. Only alert transitions run at full FPS.
+    frame_scheduler.request_frame_at(current_time - (current_time % 60) + 60)
+    # Pending fetches wake the loop with DATA_UPDATED_EVENT when they finish
+    if not data_refresh.running() and not fetch_subscriber:
+        frame_scheduler.request_frame_at(poll_scheduler.next_due())
+    if not alerts_refresh.running():
+        frame_scheduler.request_frame_at(last_alert_refresh_time + SERVICE_ALERTS_REFRESH_RATE)
+    if alert_view:
+        alert_change = alert_animation.next_change()
+        if alert_change is None:
+            frame_scheduler.animate()
+        else:
+            frame_scheduler.request_frame_at(alert_change)
+    frame_scheduler.wait()
 
 print("Clean shutdown initiated. Thanks!")
+print(text_cache.stats())
+for exporter in exporters:
+    exporter.close()
+if fetch_subscriber:
+    fetch_subscriber.close()
+if fetch_process:
+    fetch_process.close()
+refresh_workers.close()
+# Whatever the last throttled save skipped
+save_warm_start(force=True)
+transit_data.shutdown()
+if schedule_index:
+    schedule_index.close()
+alerts_feed.close()
+if traffic_recorder:
+    traffic_recorder.close()
+if FRAMEBUFFER:
+    screen.sink.close()
 pygame.quit()